@@ -1,9 +1,13 @@
 # address.py
 from __future__ import annotations
-from dataclasses import dataclass
-from utils import to_bytes
+import struct
+from typing import List
+
+_WORD = struct.Struct(">I")
+_TREE = struct.Struct(">Q")
+_WORDS = struct.Struct(">8I")
+_ZERO_16 = bytes(16)
 
-@dataclass
 class Address:
     """
     RFC 8391, Section 2.5: 32-byte address = 8 words (32-bit each).
@@ -12,63 +16,72 @@ class Address:
       word1-2: tree (64)
       word3: type (0 OTS, 1 L-tree, 2 hash tree)
       word4-7: depend on type, plus keyAndMask at word7
+    The address is kept already serialized in a 32-byte bytearray: setters
+    write their word in place and to_bytes is a single bytes() copy.
     """
-    w: list[int]
+    __slots__ = ("_buf",)
 
     def __init__(self) -> None:
-        self.w = [0] * 8
+        self._buf = bytearray(32)
 
     def copy(self) -> "Address":
-        a = Address()
-        a.w = self.w[:]
+        a = Address.__new__(Address)
+        a._buf = bytearray(self._buf)
         return a
 
     def to_bytes(self) -> bytes:
-        out = b""
-        for x in self.w:
-            out += to_bytes(x & 0xFFFFFFFF, 4)
-        return out
+        return bytes(self._buf)
+
+    @property
+    def w(self) -> List[int]:
+        """The 8 words as integers (read-only view, for debugging)."""
+        return list(_WORDS.unpack(self._buf))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Address):
+            return NotImplemented
+        return self._buf == other._buf
+
+    def __repr__(self) -> str:
+        return f"Address(w={self.w})"
 
     # Common fields
     def set_layer(self, layer: int) -> None:
-        self.w[0] = layer & 0xFFFFFFFF
+        _WORD.pack_into(self._buf, 0, layer & 0xFFFFFFFF)
 
     def set_tree(self, tree: int) -> None:
-        tree &= (1 << 64) - 1
-        self.w[1] = (tree >> 32) & 0xFFFFFFFF
-        self.w[2] = tree & 0xFFFFFFFF
+        _TREE.pack_into(self._buf, 4, tree & ((1 << 64) - 1))
 
     def set_type(self, t: int) -> None:
         # RFC: when type changes, clear following words to 0
-        self.w[3] = t & 0xFFFFFFFF
-        for i in range(4, 8):
-            self.w[i] = 0
+        _WORD.pack_into(self._buf, 12, t & 0xFFFFFFFF)
+        self._buf[16:32] = _ZERO_16
 
     def set_key_and_mask(self, km: int) -> None:
-        self.w[7] = km & 0xFFFFFFFF
+        _WORD.pack_into(self._buf, 28, km & 0xFFFFFFFF)
 
     # OTS address (type=0)
     def set_ots_address(self, ots: int) -> None:
-        self.w[4] = ots & 0xFFFFFFFF
+        _WORD.pack_into(self._buf, 16, ots & 0xFFFFFFFF)
 
     def set_chain_address(self, chain: int) -> None:
-        self.w[5] = chain & 0xFFFFFFFF
+        _WORD.pack_into(self._buf, 20, chain & 0xFFFFFFFF)
 
     def set_hash_address(self, ha: int) -> None:
-        self.w[6] = ha & 0xFFFFFFFF
+        _WORD.pack_into(self._buf, 24, ha & 0xFFFFFFFF)
 
     # L-tree address (type=1)
     def set_ltree_address(self, l: int) -> None:
-        self.w[4] = l & 0xFFFFFFFF
+        _WORD.pack_into(self._buf, 16, l & 0xFFFFFFFF)
 
     def set_tree_height(self, th: int) -> None:
-        self.w[5] = th & 0xFFFFFFFF
+        _WORD.pack_into(self._buf, 20, th & 0xFFFFFFFF)
 
     def get_tree_height(self) -> int:
-        return self.w[5]
+        return _WORD.unpack_from(self._buf, 20)[0]
 
     def set_tree_index(self, ti: int) -> None:
-        self.w[6] = ti & 0xFFFFFFFF
+        _WORD.pack_into(self._buf, 24, ti & 0xFFFFFFFF)
 
     def get_tree_index(self) -> int:
-        return self.w[6]
+        return _WORD.unpack_from(self._buf, 24)[0]
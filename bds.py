@@ -0,0 +1,235 @@
+# bds.py
+"""
+BDS traversal (Buchmann, Dahmen, Schneider, "Merkle Tree Traversal Revisited")
+for one XMSS tree (single-tree key or one XMSS^MT layer), K = 0 variant as in the RFC 8391 reference code.
+
+The state lives next to XMSSPrivateKey (SK.bds) and is advanced by xmss_sign:
+each signature costs about h/2 + 1 leaf computations instead of a full
+treehash per auth-path level, and the state holds O(h) nodes.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from address import Address
+from ltree import rand_hash
+from params import XMSSParams
+from xmss import XMSSPrivateKey, XMSSPublicKey, gen_leaf, treehash, xmss_keygen
+
+
+@dataclass
+class TreehashInstance:
+    """Incremental treehash for the next right auth node at a given height."""
+    height: int
+    next_idx: int = 0
+    stack: List[Tuple[bytes, int]] = field(default_factory=list)
+    node: Optional[bytes] = None
+    completed: bool = True
+
+    def copy(self) -> "TreehashInstance":
+        return replace(self, stack=self.stack[:])
+
+    def low(self, h: int) -> int:
+        """Lowest height still pending on this instance (h if completed)."""
+        if self.completed:
+            return h
+        if not self.stack:
+            return self.height
+        return min(nh for _, nh in self.stack)
+
+    def update(self, SK: XMSSPrivateKey, adrs: Address) -> None:
+        """One treehash step: compute the next leaf and merge it into the stack."""
+        node = gen_leaf(SK, self.next_idx, adrs)
+        adrs.set_type(2)
+        node_h = 0
+        while self.stack and self.stack[-1][1] == node_h:
+            left, _h = self.stack.pop()
+            adrs.set_tree_height(node_h)
+            adrs.set_tree_index(self.next_idx >> (node_h + 1))
+            node = rand_hash(left, node, SK.pub_seed, adrs, SK.params)
+            node_h += 1
+
+        if node_h == self.height:
+            self.node = node
+            self.completed = True
+        else:
+            self.stack.append((node, node_h))
+            self.next_idx += 1
+
+
+@dataclass
+class BDSState:
+    """
+    Traversal state for the next leaf to sign (idx):
+      auth: auth path of idx
+      keep: right nodes kept to build the next left auth nodes
+      treehash: one instance per height, building the next right auth node
+    layer/tree are the address words of the tree (non-zero only in XMSS^MT).
+    """
+    idx: int
+    auth: List[bytes]
+    keep: List[Optional[bytes]]
+    treehash: List[TreehashInstance]
+    layer: int = 0
+    tree: int = 0
+
+    def copy(self) -> "BDSState":
+        return BDSState(
+            idx=self.idx,
+            auth=self.auth[:],
+            keep=self.keep[:],
+            treehash=[th.copy() for th in self.treehash],
+            layer=self.layer,
+            tree=self.tree,
+        )
+
+    def _address(self) -> Address:
+        return tree_address(self.layer, self.tree)
+
+    def next_state(self, SK: XMSSPrivateKey) -> "BDSState":
+        """Return the state for idx + 1; self is left untouched (rollback-safe)."""
+        state = self.copy()
+        h = SK.params.h
+        if state.idx < (1 << h) - 1:
+            state._round(SK)
+            # (h - K)/2 aggiornamenti bastano per h pari; per h dispari si arrotonda per eccesso.
+            state._treehash_update(SK, (h + 1) // 2)
+        state.idx += 1
+        return state
+
+    def _round(self, SK: XMSSPrivateKey) -> None:
+        params = SK.params
+        h = params.h
+        s = self.idx
+        adrs = self._address()
+
+        # tau: altezza del primo antenato sinistro della foglia s.
+        tau = h
+        for i in range(h):
+            if not (s >> i) & 1:
+                tau = i
+                break
+
+        if tau > 0:
+            left, right = self.auth[tau - 1], self.keep[tau - 1]
+        if not (s >> (tau + 1)) & 1 and tau < h - 1:
+            self.keep[tau] = self.auth[tau]
+
+        if tau == 0:
+            self.auth[0] = gen_leaf(SK, s, adrs)
+            return
+
+        adrs.set_type(2)
+        adrs.set_tree_height(tau - 1)
+        adrs.set_tree_index(s >> tau)
+        self.auth[tau] = rand_hash(left, right, SK.pub_seed, adrs, params)
+        self.keep[tau - 1] = None
+
+        for j in range(tau):
+            th = self.treehash[j]
+            # Non dovrebbe succedere col budget di aggiornamenti: completa comunque l'istanza.
+            while not th.completed:
+                th.update(SK, adrs)
+            self.auth[j] = th.node
+
+        for j in range(tau):
+            start = s + 1 + 3 * (1 << j)
+            if start < (1 << h):
+                self.treehash[j] = TreehashInstance(height=j, next_idx=start, completed=False)
+
+    def _treehash_update(self, SK: XMSSPrivateKey, updates: int) -> None:
+        h = SK.params.h
+        adrs = self._address()
+        for _ in range(updates):
+            # Aggiorna l'istanza con la coda più bassa (a parità, l'altezza minore).
+            level, l_min = -1, h
+            for j, th in enumerate(self.treehash):
+                low = th.low(h)
+                if low < l_min:
+                    level, l_min = j, low
+            if level < 0:
+                break
+            self.treehash[level].update(SK, adrs)
+
+
+def tree_address(layer: int, tree: int) -> Address:
+    adrs = Address()
+    adrs.set_layer(layer)
+    adrs.set_tree(tree)
+    return adrs
+
+
+def _state_from_nodes(idx: int, params: XMSSParams, node: Callable[[int, int], bytes],
+                      layer: int = 0, tree: int = 0) -> BDSState:
+    h = params.h
+    auth: List[bytes] = []
+    keep: List[Optional[bytes]] = [None] * h
+    instances: List[TreehashInstance] = []
+    for j in range(h):
+        a = idx >> j
+        auth.append(node(j, a ^ 1))
+
+        # Prossimo antenato sinistro dopo a: il suo fratello destro va preparato.
+        nxt = a + 2 if a % 2 == 0 else a + 1
+        if nxt + 1 < (1 << (h - j)):
+            instances.append(TreehashInstance(height=j, node=node(j, nxt + 1)))
+        else:
+            instances.append(TreehashInstance(height=j))
+
+        if a % 2 == 1 and (idx >> (j + 1)) % 2 == 0 and j < h - 1:
+            keep[j] = node(j, a)
+    return BDSState(idx=idx, auth=auth, keep=keep, treehash=instances, layer=layer, tree=tree)
+
+
+def _required_nodes(idx: int, params: XMSSParams) -> Set[Tuple[int, int]]:
+    """Posizioni (height, index) dei nodi che servono allo stato per idx."""
+    needed: Set[Tuple[int, int]] = set()
+
+    def record(height: int, index: int) -> bytes:
+        needed.add((height, index))
+        return b""
+
+    _state_from_nodes(idx, params, record)
+    return needed
+
+
+def _capture(idx: int, params: XMSSParams) -> Tuple[Dict[Tuple[int, int], bytes], Callable[[int, int, bytes], None]]:
+    needed = _required_nodes(idx, params)
+    captured: Dict[Tuple[int, int], bytes] = {}
+
+    def on_node(height: int, index: int, node: bytes) -> None:
+        if (height, index) in needed:
+            captured[(height, index)] = node
+
+    return captured, on_node
+
+
+def bds_state_init(SK: XMSSPrivateKey, layer: int = 0, tree: int = 0) -> BDSState:
+    """
+    Rebuild the BDS state for SK.idx (e.g. after load_private_key).
+    Costs about three full keygens, once per loaded key.
+    """
+    params = SK.params
+
+    def node(height: int, index: int) -> bytes:
+        return treehash(SK, index << height, height, tree_address(layer, tree))
+
+    return _state_from_nodes(SK.idx, params, node, layer, tree)
+
+
+def bds_build(SK: XMSSPrivateKey, layer: int = 0, tree: int = 0) -> Tuple[bytes, BDSState]:
+    """
+    One treehash pass over the whole tree (at address layer/tree): returns the
+    root and the BDS state for SK.idx, keeping only the nodes the state needs.
+    """
+    captured, on_node = _capture(SK.idx, SK.params)
+    root = treehash(SK, 0, SK.params.h, tree_address(layer, tree), on_node)
+    return root, _state_from_nodes(SK.idx, SK.params, lambda height, index: captured[(height, index)], layer, tree)
+
+
+def bds_keygen(params: XMSSParams) -> Tuple[XMSSPrivateKey, XMSSPublicKey]:
+    """xmss_keygen that also captures the BDS state for idx 0 from the same treehash pass."""
+    captured, on_node = _capture(0, params)
+    SK, PK = xmss_keygen(params, on_node=on_node)
+    state = _state_from_nodes(0, params, lambda height, index: captured[(height, index)])
+    return replace(SK, bds=state), PK
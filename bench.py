@@ -0,0 +1,239 @@
+# bench.py
+"""
+Benchmark harness: xmss_keygen / xmss_sign / xmss_verify over a grid of
+XMSSParams (n, w, h) and the primitives chain, ltree, rand_hash, base_w.
+sign_nodes / sign_chains measure signing without and with WOTS+ chain
+checkpoints; the log reports the speedup of the latter.
+
+Every case reports ops/s, latency percentiles (p50/p90/p99) and the peak
+Python heap of one extra run under tracemalloc (kept out of the timings).
+Results are written as JSON and can be compared with a stored baseline:
+
+    python bench.py --out bench.json
+    python bench.py --quick --baseline bench.json --threshold 0.15
+
+A case regresses when its p50 grows by more than threshold (relative);
+the exit status is then 1.
+"""
+from __future__ import annotations
+import argparse
+from dataclasses import asdict, dataclass, replace
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from address import Address
+from bds import bds_keygen
+from chainstore import chainstore_keygen
+from ltree import ltree, rand_hash
+from params import XMSSParams
+from utils import base_w
+from wots import chain
+from xmss import XMSSPrivateKey, xmss_keygen, xmss_sign, xmss_verify
+
+GRID_N = (16, 32)
+GRID_W = (4, 16)
+GRID_H = (4, 6, 8)
+QUICK_H = (4,)
+
+
+@dataclass
+class BenchResult:
+    name: str
+    ops: int
+    ops_per_s: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    peak_kib: float
+
+
+def _percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    k = max(0, min(len(sorted_values) - 1, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def run_case(name: str, op: Callable[[], Any], min_ops: int = 5, min_time: float = 0.5) -> BenchResult:
+    """Run op at least min_ops times and for at least min_time seconds."""
+    op()  # warm-up (cache HMAC, import lazy)
+    lat: List[float] = []
+    start = time.perf_counter()
+    while len(lat) < min_ops or time.perf_counter() - start < min_time:
+        t0 = time.perf_counter()
+        op()
+        lat.append(time.perf_counter() - t0)
+    total = sum(lat)
+
+    tracemalloc.start()
+    try:
+        op()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    lat.sort()
+    return BenchResult(
+        name=name,
+        ops=len(lat),
+        ops_per_s=len(lat) / total if total > 0 else float("inf"),
+        p50_ms=_percentile(lat, 0.50) * 1e3,
+        p90_ms=_percentile(lat, 0.90) * 1e3,
+        p99_ms=_percentile(lat, 0.99) * 1e3,
+        peak_kib=peak / 1024,
+    )
+
+
+def _params_label(p: XMSSParams) -> str:
+    return f"n={p.n},w={p.w},h={p.h}"
+
+
+def bench_scheme(p: XMSSParams, min_time: float) -> List[BenchResult]:
+    label = _params_label(p)
+    results = [run_case(f"keygen/{label}", lambda: xmss_keygen(p), min_ops=1, min_time=min_time)]
+
+    # Firma con stato BDS (il percorso normale); la chiave avanza a ogni chiamata
+    # e si rigenera quando gli indici finiscono.
+    SK, PK = bds_keygen(p)
+    state = {"sk": SK}
+
+    def sign() -> None:
+        if state["sk"].idx >= p.max_signatures:
+            state["sk"] = SK
+        state["sk"], _ = xmss_sign(b"bench", state["sk"])
+
+    results.append(run_case(f"sign/{label}", sign, min_time=min_time))
+
+    _, sig = xmss_sign(b"bench", SK)
+    results.append(run_case(f"verify/{label}", lambda: xmss_verify(sig, b"bench", PK), min_time=min_time))
+    results += bench_chain_store(p, min_time)
+    return results
+
+
+def bench_chain_store(p: XMSSParams, min_time: float) -> List[BenchResult]:
+    """
+    Signing from a node store without (sign_nodes) and with (sign_chains) the
+    chain checkpoints of chainstore.py: the auth path costs no hashing, so the
+    gap between the two is the WOTS+ chain walk alone.
+    """
+    label = _params_label(p)
+    results: List[BenchResult] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        SK, _ = chainstore_keygen(p, os.path.join(tmp, "chains.bin"), node_store_path=os.path.join(tmp, "nodes.bin"))
+        try:
+            for name, key in (("sign_nodes", replace(SK, chain_store=None)), ("sign_chains", SK)):
+                state = {"idx": 0}
+
+                def sign(key: XMSSPrivateKey = key) -> None:
+                    state["idx"] = (state["idx"] + 1) % p.max_signatures
+                    xmss_sign(b"bench", replace(key, idx=state["idx"]))
+
+                results.append(run_case(f"{name}/{label}", sign, min_time=min_time))
+        finally:
+            SK.chain_store.close()
+            SK.node_store.close()
+    return results
+
+
+def bench_primitives(n: int, w: int, min_time: float) -> List[BenchResult]:
+    p = XMSSParams(n=n, w=w, h=2)
+    label = f"n={n},w={w}"
+    seed, x = os.urandom(n), os.urandom(n)
+    pk = [os.urandom(n) for _ in range(p.length)]
+    adrs = Address()
+    msg = os.urandom(n)
+    return [
+        run_case(f"chain/{label}", lambda: chain(x, 0, w - 1, seed, adrs, p), min_time=min_time),
+        run_case(f"ltree/{label}", lambda: ltree(list(pk), seed, adrs, p), min_time=min_time),
+        run_case(f"rand_hash/{label}", lambda: rand_hash(x, x, seed, adrs, p), min_time=min_time),
+        run_case(f"base_w/{label}", lambda: base_w(msg, w, p.len_1), min_time=min_time),
+    ]
+
+
+def run_all(ns: Iterable[int], ws: Iterable[int], hs: Iterable[int], min_time: float = 0.5,
+            log: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    results: List[BenchResult] = []
+    for n in ns:
+        for w in ws:
+            cases = bench_primitives(n, w, min_time)
+            for h in hs:
+                cases += bench_scheme(XMSSParams(n=n, w=w, h=h), min_time)
+            for r in cases:
+                if log is not None:
+                    log(f"{r.name:<28} {r.ops_per_s:>10.1f} op/s  p50 {r.p50_ms:9.3f} ms  "
+                        f"p99 {r.p99_ms:9.3f} ms  peak {r.peak_kib:8.1f} KiB")
+            results += cases
+            if log is not None:
+                for h in hs:
+                    label = _params_label(XMSSParams(n=n, w=w, h=h))
+                    plain = next(r for r in cases if r.name == f"sign_nodes/{label}")
+                    fast = next(r for r in cases if r.name == f"sign_chains/{label}")
+                    log(f"checkpoint chain {label}: firma {plain.p50_ms / fast.p50_ms:.2f}x")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {r.name: asdict(r) for r in results},
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.10) -> Tuple[List[str], List[str]]:
+    """Return (report lines, names of regressed cases) comparing p50 latencies."""
+    lines: List[str] = []
+    regressed: List[str] = []
+    base = baseline.get("results", {})
+    for name, cur in current["results"].items():
+        old = base.get(name)
+        if old is None or old["p50_ms"] <= 0:
+            continue
+        change = cur["p50_ms"] / old["p50_ms"] - 1.0
+        mark = "ok"
+        if change > threshold:
+            mark = "REGRESSION"
+            regressed.append(name)
+        elif change < -threshold:
+            mark = "faster"
+        lines.append(f"{name:<28} {old['p50_ms']:9.3f} -> {cur['p50_ms']:9.3f} ms  {change:+7.1%}  {mark}")
+    return lines, regressed
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="XMSS benchmark")
+    ap.add_argument("--quick", action="store_true", help=f"solo h in {QUICK_H}")
+    ap.add_argument("-n", type=int, nargs="+", default=list(GRID_N))
+    ap.add_argument("-w", type=int, nargs="+", default=list(GRID_W))
+    ap.add_argument("--heights", type=int, nargs="+", default=None)
+    ap.add_argument("--min-time", type=float, default=0.5, help="secondi minimi per caso")
+    ap.add_argument("--out", default="bench.json")
+    ap.add_argument("--baseline", default=None, help="JSON di un run precedente")
+    ap.add_argument("--threshold", type=float, default=0.10, help="peggioramento relativo di p50 tollerato")
+    args = ap.parse_args(argv)
+
+    hs = args.heights or (QUICK_H if args.quick else GRID_H)
+    report = run_all(args.n, args.w, hs, args.min_time, log=print)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Risultati: {args.out}")
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    lines, regressed = compare(baseline, report, args.threshold)
+    print("\n".join(lines))
+    if regressed:
+        print(f"{len(regressed)} regressioni oltre {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+# chainstore.py
+"""
+Array-backed file with WOTS+ chain checkpoints of every leaf, read through mmap.
+
+wots_sign walks chain c from sk[c] (position 0) up to the digit msg[c]: on
+average (w-1)/2 steps of F + 2 PRF per chain. wots_gen_pk goes through every
+position at keygen anyway, so the values at a few positions p_1 < ... < p_k
+are kept here and signing starts from the highest p_j <= msg[c]. With evenly
+spaced positions the walk drops to about (w/(k+1) - 1)/2 steps per chain.
+Space: 2^h * len * k * n bytes (w=16, n=32, k=3: 6.3 KiB per leaf).
+
+Format:
+ - magic 4B: b"XMSC"
+ - version u8
+ - n u16, w u16, h u16, len u16, k u8, k x position u8
+ - root n (written at the end of keygen: ties the file to its key)
+ - leaf 0 .. leaf 2^h-1, each: chain 0 .. len-1, each: k values of n bytes
+
+A value at position p lets anyone finish the chain from p, i.e. forge WOTS+
+signatures of that leaf: the file is secret and must be protected like sk.bin.
+"""
+from __future__ import annotations
+from dataclasses import replace
+import mmap
+import struct
+from typing import List, Optional, Sequence, Tuple
+
+from leafengine import ENGINE_PYTHON
+from nodestore import MerkleNodeStore, open_node_store
+from params import XMSSParams
+from xmss import XMSSPrivateKey, XMSSPublicKey, xmss_keygen
+
+MAGIC = b"XMSC"
+VERSION = 1
+_HEADER = struct.Struct(">4sBHHHHB")
+
+
+def default_points(w: int, k: int = 3) -> Tuple[int, ...]:
+    """k positions evenly spaced along a chain: w/4, w/2, 3w/4 for k=3."""
+    if k < 1:
+        raise ValueError("k must be >= 1")
+    return tuple(sorted({j * w // (k + 1) for j in range(1, k + 1)} - {0, w - 1}))
+
+
+def _check_points(points: Sequence[int], w: int) -> None:
+    if not points or len(points) > 255:
+        raise ValueError("need 1..255 checkpoint positions")
+    if any(not 0 < p < w - 1 for p in points) or any(a >= b for a, b in zip(points, points[1:])):
+        raise ValueError("checkpoint positions must be increasing and in [1, w-2]")
+
+
+def chain_store_size(params: XMSSParams, points: Sequence[int]) -> int:
+    n = params.n
+    return _HEADER.size + len(points) + n + (1 << params.h) * params.length * len(points) * n
+
+
+class ChainStore:
+    """Chain checkpoints indexed by leaf; writable only while being created."""
+
+    def __init__(self, path: str, writable: bool = False) -> None:
+        self.path = path
+        self._file = open(path, "r+b" if writable else "rb")
+        try:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=access)
+        except Exception:
+            self._file.close()
+            raise
+        magic, ver, n, w, h, length, k = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("Bad magic")
+        if ver != VERSION:
+            self.close()
+            raise ValueError("Unsupported version")
+        self.n, self.w, self.h, self.length = n, w, h, length
+        self.points: Tuple[int, ...] = tuple(self._mm[_HEADER.size:_HEADER.size + k])
+        self._root_off = _HEADER.size + k
+        self._data_off = self._root_off + n
+        self._leaf_size = length * k * n
+        if len(self._mm) != self._data_off + (1 << h) * self._leaf_size:
+            self.close()
+            raise ValueError("Chain store has wrong size")
+
+    @classmethod
+    def create(cls, path: str, params: XMSSParams, points: Optional[Sequence[int]] = None) -> "ChainStore":
+        """Create an empty (zero-filled) store; points defaults to default_points(w)."""
+        points = tuple(points) if points is not None else default_points(params.w)
+        _check_points(points, params.w)
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, params.n, params.w, params.h, params.length, len(points)))
+            f.write(bytes(points))
+            f.truncate(chain_store_size(params, points))
+        return cls(path, writable=True)
+
+    def __reduce__(self) -> Tuple[type, Tuple[str]]:
+        # Come MerkleNodeStore: tra processi si passa solo il path.
+        return (ChainStore, (self.path,))
+
+    def _offset(self, i: int) -> int:
+        if not 0 <= i < (1 << self.h):
+            raise IndexError("leaf index out of range")
+        return self._data_off + i * self._leaf_size
+
+    def get_leaf(self, i: int) -> List[bytes]:
+        """Values of leaf i, chain by chain: [i * k + j] is chain i at points[j]."""
+        off, n = self._offset(i), self.n
+        data = self._mm[off:off + self._leaf_size]
+        return [data[o:o + n] for o in range(0, self._leaf_size, n)]
+
+    def put_leaf(self, i: int, values: Sequence[bytes]) -> None:
+        """Store the values of leaf i (on_chains callback of xmss_keygen)."""
+        data = b"".join(values)
+        if len(data) != self._leaf_size or len(values) != self.length * len(self.points):
+            raise ValueError("leaf values do not match len * k * n")
+        off = self._offset(i)
+        self._mm[off:off + self._leaf_size] = data
+
+    def root(self) -> bytes:
+        return self._mm[self._root_off:self._data_off]
+
+    def set_root(self, root: bytes) -> None:
+        if len(root) != self.n:
+            raise ValueError("root length != n")
+        self._mm[self._root_off:self._data_off] = root
+
+    def flush(self) -> None:
+        self._mm.flush()
+
+    def close(self) -> None:
+        if not self._mm.closed:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "ChainStore":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def open_chain_store(path: str, SK: XMSSPrivateKey) -> XMSSPrivateKey:
+    """Attach an existing store to SK (e.g. after load_private_key), checking it matches the key."""
+    store = ChainStore(path)
+    p = SK.params
+    if (store.n, store.w, store.h, store.length) != (p.n, p.w, p.h, p.length) or store.root() != SK.root:
+        store.close()
+        raise ValueError("Chain store does not match this key")
+    return replace(SK, chain_store=store)
+
+
+def chainstore_keygen(params: XMSSParams, path: str, points: Optional[Sequence[int]] = None,
+                      node_store_path: Optional[str] = None, workers: int = 1,
+                      engine: str = ENGINE_PYTHON) -> Tuple[XMSSPrivateKey, XMSSPublicKey]:
+    """
+    xmss_keygen that writes the chain checkpoints of every leaf to path (and,
+    with node_store_path, every tree node as nodestore_keygen) in one pass.
+    The returned SK signs from the store(s).
+    """
+    store = ChainStore.create(path, params, points)
+    nodes = MerkleNodeStore.create(node_store_path, params) if node_store_path is not None else None
+    try:
+        SK, PK = xmss_keygen(params, on_node=nodes.put if nodes is not None else None, workers=workers,
+                             engine=engine, chain_points=store.points, on_chains=store.put_leaf)
+        store.set_root(SK.root)
+        store.flush()
+        if nodes is not None:
+            nodes.flush()
+    finally:
+        store.close()
+        if nodes is not None:
+            nodes.close()
+    if node_store_path is not None:
+        SK = open_node_store(node_store_path, SK)
+    return open_chain_store(path, SK), PK
@@ -0,0 +1,113 @@
+# checkpoint.py
+"""
+Resumable keygen for large trees: the treehash state of xmss_keygen is saved
+every `every` leaves, so a crashed or preempted keygen continues from the
+last checkpoint instead of starting over.
+
+Checkpoint file (written with write_file_atomic, like sk.bin):
+  magic "XMCK" || version u8 || len u16 || private key (serialize.py format,
+  root all zeros until the end) || next_leaf u64 || count u16 ||
+  count x (height u8 || node n) || crc32 u32
+
+The file holds the key's seeds in the same encoding as sk.bin and must be
+protected like sk.bin; delete it once the finished key has been saved.
+A completed checkpoint (next_leaf = 2^h, root set) is never resumed: the key
+may have signed since, and handing it out again at idx 0 would reuse indices.
+"""
+from __future__ import annotations
+from dataclasses import replace
+import os
+import struct
+import zlib
+from typing import Optional, Tuple
+
+from address import Address
+from leafengine import ENGINE_PYTHON
+from params import XMSSParams
+from serialize import private_key_from_bytes, private_key_to_bytes, save_private_key_atomic, write_file_atomic
+from xmss import NodeCallback, TreehashStack, XMSSPrivateKey, XMSSPublicKey, treehash
+import instrument
+
+MAGIC = b"XMCK"
+VERSION = 1
+_HEAD = struct.Struct(">4sBH")
+_TAIL = struct.Struct(">QH")
+_CRC = struct.Struct(">I")
+
+
+def save_checkpoint(path: str, SK: XMSSPrivateKey, next_leaf: int, stack: TreehashStack) -> None:
+    sk_bytes = private_key_to_bytes(SK)
+    parts = [_HEAD.pack(MAGIC, VERSION, len(sk_bytes)), sk_bytes, _TAIL.pack(next_leaf, len(stack))]
+    for node, height in stack:
+        parts.append(bytes((height,)) + node)
+    body = b"".join(parts)
+    write_file_atomic(path, body + _CRC.pack(zlib.crc32(body)))
+
+
+def load_checkpoint(path: str) -> Tuple[XMSSPrivateKey, int, TreehashStack]:
+    """Return (SK with the seeds, next leaf, treehash stack); ValueError if the file is damaged."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _HEAD.size + _TAIL.size + _CRC.size:
+        raise ValueError("Truncated checkpoint")
+    body, (crc,) = data[:-_CRC.size], _CRC.unpack(data[-_CRC.size:])
+    if zlib.crc32(body) != crc:
+        raise ValueError("Checkpoint checksum mismatch")
+    magic, version, sk_len = _HEAD.unpack_from(body)
+    if magic != MAGIC:
+        raise ValueError("Bad magic")
+    if version != VERSION:
+        raise ValueError("Unsupported version")
+    off = _HEAD.size
+    SK = private_key_from_bytes(body[off:off + sk_len]); off += sk_len
+    next_leaf, count = _TAIL.unpack_from(body, off); off += _TAIL.size
+    n = SK.params.n
+    stack: TreehashStack = []
+    for _ in range(count):
+        stack.append((body[off + 1:off + 1 + n], body[off])); off += 1 + n
+    if off != len(body):
+        raise ValueError("Trailing bytes")
+    return SK, next_leaf, stack
+
+
+@instrument.operation("keygen")
+def checkpoint_keygen(params: XMSSParams, path: str, every: int = 1024, engine: str = ENGINE_PYTHON,
+                      on_node: Optional[NodeCallback] = None,
+                      sk_path: Optional[str] = None) -> Tuple[XMSSPrivateKey, XMSSPublicKey]:
+    """
+    xmss_keygen with a checkpoint at path: if path exists the keygen resumes
+    from it (the seeds come from the file), otherwise new seeds are drawn and
+    saved before the first leaf. on_node only sees nodes computed by this call.
+    With sk_path the finished key is saved there (refused if it exists) and
+    the checkpoint is deleted. Otherwise the checkpoint is left completed:
+    calling again raises RuntimeError, and load_checkpoint can still recover
+    a key that was never saved.
+    """
+    n = params.n
+    if sk_path is not None and os.path.exists(sk_path):
+        raise FileExistsError(sk_path)
+    if os.path.exists(path):
+        SK, next_leaf, stack = load_checkpoint(path)
+        if SK.params != params:
+            raise ValueError("Checkpoint was made with different parameters")
+        if next_leaf >= params.max_signatures:
+            raise RuntimeError(f"{path}: keygen already completed, load the saved key instead "
+                               "(the key may have signed since)")
+    else:
+        SK = XMSSPrivateKey(idx=0, sk_seed=os.urandom(n), sk_prf=os.urandom(n), root=b"\x00" * n,
+                            pub_seed=os.urandom(n), params=params)
+        next_leaf, stack = 0, []
+        save_checkpoint(path, SK, next_leaf, stack)
+
+    def on_checkpoint(leaf: int, st: TreehashStack) -> None:
+        save_checkpoint(path, SK, leaf, st)
+
+    root = treehash(SK, 0, params.h, Address(), on_node, engine, resume=(next_leaf, stack),
+                    on_checkpoint=on_checkpoint, checkpoint_every=every)
+    SK = replace(SK, root=root)
+    save_checkpoint(path, SK, params.max_signatures, [(root, params.h)])
+    if sk_path is not None:
+        # Prima la chiave, poi il checkpoint: un crash nel mezzo non perde la chiave.
+        save_private_key_atomic(sk_path, SK)
+        os.remove(path)
+    return SK, XMSSPublicKey(root=root, pub_seed=SK.pub_seed, params=params)
@@ -1,10 +1,12 @@
 ﻿# demo.py
 from __future__ import annotations
+import json
 import os
 import socket
 import threading
 import webbrowser
 from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
 
 from params import XMSSParams
 from xmss import xmss_keygen, xmss_sign, xmss_verify, xmss_root_from_sig
@@ -13,11 +15,19 @@ from utils import to_bytes
 from hashfuncs import H_msg
 from wots import wots_pk_from_sig
 from ltree import ltree, rand_hash
+from signature import XMSSSignature
 from serialize import save_private_key, load_private_key, save_public_key, load_public_key
-from merkle_dump import dump_merkle_json, build_merkle_json
+from merkle_dump import MerkleTree, build_merkle_path_json, build_merkle_tree, dump_merkle_json, level_nodes
+
+
+# Massimo numero di nodi restituiti da una richiesta /api/nodes.
+API_MAX_NODES = 1024
 
 
 class NoCacheHandler(SimpleHTTPRequestHandler):
+    # Alberi serviti da /api (tree_id -> MerkleTree), impostati da main().
+    trees: dict[str, MerkleTree] = {}
+
     def end_headers(self) -> None:
         # Disable browser caching for JSON/JS during local demos.
         self.send_header("Cache-Control", "no-store, no-cache, must-revalidate, max-age=0")
@@ -25,6 +35,45 @@ class NoCacheHandler(SimpleHTTPRequestHandler):
         self.send_header("Expires", "0")
         super().end_headers()
 
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if not url.path.startswith("/api/"):
+            super().do_GET()
+            return
+        try:
+            status, body = 200, self._api(url.path, parse_qs(url.query))
+        except (KeyError, ValueError) as exc:
+            status, body = 400, {"error": str(exc)}
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _api(self, path: str, query: dict[str, list[str]]) -> object:
+        """
+        /api/node?tree=ID&level=K&index=I          -> un nodo (con KEY/BM per i nodi interni)
+        /api/nodes?tree=ID&level=K&start=S&count=C -> nodi [S, S+C) del livello K
+        """
+        tree = self.trees[query["tree"][0]]
+        level = int(query["level"][0])
+        if not 0 <= level <= tree.params.h:
+            raise ValueError("level out of range")
+        if path == "/api/node":
+            index = int(query["index"][0])
+            if not 0 <= index < tree.count(level):
+                raise ValueError("index out of range")
+            return next(level_nodes(tree, level, index, index + 1))
+        if path == "/api/nodes":
+            start = int(query["start"][0])
+            count = min(int(query.get("count", [str(API_MAX_NODES)])[0]), API_MAX_NODES)
+            stop = min(start + count, tree.count(level))
+            if not 0 <= start < stop:
+                raise ValueError("start out of range")
+            return {"level": level, "start": start, "nodes": list(level_nodes(tree, level, start, stop))}
+        raise KeyError(path)
+
 
 def _ensure_output_dir(base_dir: str) -> str:
     out_dir = os.path.join(base_dir, "output")
@@ -53,52 +102,40 @@ def _start_server() -> ThreadingHTTPServer:
     return httpd
 
 
-def _root_from_sig_for_msg(sig: bytes, msg: bytes, PK) -> tuple[bytes, bytes]:
-    params = PK.params
-    n = params.n
-    min_len = 4 + n + (params.length + params.h) * n
-    if len(sig) != min_len:
-        raise ValueError("Firma con lunghezza non valida")
+def _parse_sig(sig: bytes, PK) -> XMSSSignature:
+    try:
+        return XMSSSignature(sig, PK.params)
+    except ValueError:
+        raise ValueError("Firma con lunghezza non valida") from None
 
-    idx_sig = int.from_bytes(sig[0:4], "big")
-    off = 4
-    r = sig[off:off+n]
-    off += n
 
-    sig_ots = [sig[off + i*n: off + (i+1)*n] for i in range(params.length)]
-    off += params.length * n
-    auth = [sig[off + i*n: off + (i+1)*n] for i in range(params.h)]
+def _msg_digest(s: XMSSSignature, msg: bytes, PK) -> bytes:
+    n = PK.params.n
+    Mp_key = b"".join((s.r, PK.root, to_bytes(s.idx, n)))
+    return H_msg(Mp_key, msg, n, PK.params.hash_mode)
 
-    adrs = Address()
-    Mp_key = r + PK.root + to_bytes(idx_sig, n)
-    Mp = H_msg(Mp_key, msg, n)
-    root_from_sig = xmss_root_from_sig(idx_sig, sig_ots, auth, Mp, PK.pub_seed, params, adrs)
+
+def _root_from_sig_for_msg(sig: bytes, msg: bytes, PK) -> tuple[bytes, bytes]:
+    s = _parse_sig(sig, PK)
+    Mp = _msg_digest(s, msg, PK)
+    root_from_sig = xmss_root_from_sig(s.idx, s.sig_ots, s.auth, Mp, PK.pub_seed, PK.params, Address())
     return root_from_sig, Mp
 
 
-def _sig_index(sig: bytes) -> int:
-    return int.from_bytes(sig[0:4], "big")
+def _sig_index(sig: bytes, PK) -> int:
+    return _parse_sig(sig, PK).idx
 
 
 def _auth_path_from_sig(sig: bytes, PK) -> list[dict]:
-    params = PK.params
-    n = params.n
-    min_len = 4 + n + (params.length + params.h) * n
-    if len(sig) != min_len:
-        raise ValueError("Firma con lunghezza non valida")
-
-    idx_sig = _sig_index(sig)
-    off = 4 + n + (params.length * n)
+    s = _parse_sig(sig, PK)
+    idx_sig = s.idx
     auth = []
-    for k in range(params.h):
-        sibling_index = (idx_sig // (1 << k)) ^ 1
-        start = off + (k * n)
-        sibling_value = sig[start:start + n].hex()
+    for k, sibling in enumerate(s.auth):
         auth.append(
             {
                 "level": k,
-                "sibling_index": sibling_index,
-                "sibling_value": sibling_value,
+                "sibling_index": (idx_sig // (1 << k)) ^ 1,
+                "sibling_value": sibling.hex(),
             }
         )
     return auth
@@ -106,22 +143,14 @@ def _auth_path_from_sig(sig: bytes, PK) -> list[dict]:
 
 def _leaf_from_sig_for_msg(sig: bytes, msg: bytes, PK) -> bytes:
     params = PK.params
-    n = params.n
-    min_len = 4 + n + (params.length + params.h) * n
-    if len(sig) != min_len:
-        raise ValueError("Firma con lunghezza non valida")
-
-    idx_sig = _sig_index(sig)
-    off = 4 + n
-    sig_ots = [sig[off + i*n: off + (i+1)*n] for i in range(params.length)]
+    s = _parse_sig(sig, PK)
+    idx_sig = s.idx
+    Mp = _msg_digest(s, msg, PK)
 
     adrs = Address()
-    Mp_key = sig[4:4+n] + PK.root + to_bytes(idx_sig, n)
-    Mp = H_msg(Mp_key, msg, n)
-
     adrs.set_type(0)
     adrs.set_ots_address(idx_sig)
-    pk_ots = wots_pk_from_sig(sig_ots, Mp, PK.pub_seed, adrs, params)
+    pk_ots = wots_pk_from_sig(s.sig_ots, Mp, PK.pub_seed, adrs, params)
 
     adrs.set_type(1)
     adrs.set_ltree_address(idx_sig)
@@ -130,12 +159,7 @@ def _leaf_from_sig_for_msg(sig: bytes, msg: bytes, PK) -> bytes:
 
 def _auth_nodes_for_msg(sig: bytes, msg: bytes, PK, auth_path: list[dict]) -> list[bytes]:
     params = PK.params
-    n = params.n
-    min_len = 4 + n + (params.length + params.h) * n
-    if len(sig) != min_len:
-        raise ValueError("Firma con lunghezza non valida")
-
-    idx_sig = _sig_index(sig)
+    idx_sig = _sig_index(sig, PK)
     node = _leaf_from_sig_for_msg(sig, msg, PK)
     nodes: list[bytes] = []
     adrs = Address()
@@ -166,17 +190,10 @@ def _build_demo_payload(sig: bytes, msg: bytes, PK, base: dict | None, label: st
         payload.update(extra)
 
     if base is not None:
-        payload.update(
-            {
-                "params": base["params"],
-                "target_idx": base["target_idx"],
-                "pub_seed": base["pub_seed"],
-                "root": base["root"],
-                "tree": base["tree"],
-                "auth_path": base["auth_path"],
-                "path": base["path"],
-            }
-        )
+        # "tree" (livelli completi) o "tree_id" (nodi caricati dal viewer via /api).
+        for key in ("params", "target_idx", "pub_seed", "root", "tree", "tree_id", "auth_path", "path"):
+            if key in base:
+                payload[key] = base[key]
 
     try:
         root_from_sig, mp = _root_from_sig_for_msg(sig, msg, PK)
@@ -267,7 +284,7 @@ def main() -> None:
     SKn = SK_mono
     for i in range(params.max_signatures):
         SKn, sig_n = xmss_sign(msg + bytes([i % 256]), SKn)
-        idxs.append(_sig_index(sig_n))
+        idxs.append(_sig_index(sig_n, PK))
     idx_monotonic = all(idxs[i] < idxs[i + 1] for i in range(len(idxs) - 1))
     print("idx values:", idxs)
     print("idx monotonic (OK atteso):", idx_monotonic)
@@ -277,14 +294,19 @@ def main() -> None:
     SK_before = SK_rb
     _, sig_rb1 = xmss_sign(b"rollback-1", SK_rb)
     _, sig_rb2 = xmss_sign(b"rollback-2", SK_before)
-    base_rb = build_merkle_json(SK_rb, target_idx=_sig_index(sig_rb1))
-    print("rollback same idx (OK atteso):", _sig_index(sig_rb1) == _sig_index(sig_rb2))
+    NoCacheHandler.trees["rollback"] = build_merkle_tree(SK_rb)
+    base_rb = dict(build_merkle_path_json(NoCacheHandler.trees["rollback"], _sig_index(sig_rb1, PK_rb)),
+                   tree_id="rollback")
+    print("rollback same idx (OK atteso):", _sig_index(sig_rb1, PK_rb) == _sig_index(sig_rb2, PK_rb))
     print("rollback sig1 verify (OK atteso):", xmss_verify(sig_rb1, b"rollback-1", PK_rb))
     print("rollback sig2 verify (OK atteso):", xmss_verify(sig_rb2, b"rollback-2", PK_rb))
 
-    target_idx = _sig_index(sig)
-    base = build_merkle_json(SK_init, target_idx=target_idx)
-    base_wrong = build_merkle_json(SK_wrong, target_idx=target_idx)
+    target_idx = _sig_index(sig, PK)
+    # Alberi calcolati una volta: il JSON contiene solo i percorsi, i nodi li serve /api.
+    tree_init = NoCacheHandler.trees["init"] = build_merkle_tree(SK_init)
+    NoCacheHandler.trees["wrong"] = build_merkle_tree(SK_wrong)
+    base = dict(build_merkle_path_json(tree_init, target_idx), tree_id="init")
+    base_wrong = dict(build_merkle_path_json(NoCacheHandler.trees["wrong"], target_idx), tree_id="wrong")
 
     demos = {
         # I primi tre test rimangono come prima (già verificati nel viewer).
@@ -316,12 +338,12 @@ def main() -> None:
             note="Due firme valide con lo stesso idx (vulnerabilita operativa).",
             extra={
                 "rollback_sig2_ok": xmss_verify(sig_rb2, b"rollback-2", PK_rb),
-                "rollback_same_idx": _sig_index(sig_rb1) == _sig_index(sig_rb2),
-                "rollback_idx": _sig_index(sig_rb1),
+                "rollback_same_idx": _sig_index(sig_rb1, PK_rb) == _sig_index(sig_rb2, PK_rb),
+                "rollback_idx": _sig_index(sig_rb1, PK_rb),
             },
         ),
     }
-    dump_merkle_json("merkle.json", SK_init, target_idx=target_idx, demos=demos)  # salva albero + demo
+    dump_merkle_json("merkle.json", SK_init, target_idx=target_idx, demos=demos, tree=tree_init)  # salva albero + demo
 
     httpd = _start_server()
     
@@ -1,31 +1,155 @@
 # hashfuncs.py
 from __future__ import annotations
+from functools import lru_cache
 import hashlib
-import hmac
+from typing import Iterable, List, Tuple, Union
+
+import instrument
+
+# Backend delle funzioni hash (XMSSParams.hash_mode):
+#  - "hmac": F/H/PRF = HMAC-SHA256 (formato storico di questo progetto)
+#  - "rfc8391": costruzione RFC 8391, Section 5.1: SHA-256(toByte(t, n) || KEY || M)
+HASH_MODE_HMAC = "hmac"
+HASH_MODE_RFC = "rfc8391"
+HASH_MODES = (HASH_MODE_HMAC, HASH_MODE_RFC)
+
+# Padding RFC 8391: F=0, H=1, H_msg=2, PRF=3.
+_PAD_F, _PAD_H, _PAD_HMSG, _PAD_PRF = 0, 1, 2, 3
+
+# Numero di chiavi PRF (pub_seed, sk_seed, S_ots, ...) con stato HMAC in cache.
+HMAC_CACHE_SIZE = 64
+
+_BLOCK = 64  # SHA-256 block size
+_IPAD = bytes.maketrans(bytes(range(256)), bytes(x ^ 0x36 for x in range(256)))
+_OPAD = bytes.maketrans(bytes(range(256)), bytes(x ^ 0x5C for x in range(256)))
+
+HMACStates = Tuple["hashlib._Hash", "hashlib._Hash"]
+
+def hmac_states(key: bytes) -> HMACStates:
+    """
+    HMAC-SHA256 keyed context: SHA-256 states after absorbing key^ipad and
+    key^opad (RFC 2104). Each MAC under this key then costs two compressions.
+    """
+    if len(key) > _BLOCK:
+        key = hashlib.sha256(key).digest()
+    block = key.ljust(_BLOCK, b"\x00")
+    return hashlib.sha256(block.translate(_IPAD)), hashlib.sha256(block.translate(_OPAD))
+
+# Contesti pre-keyed condivisi: non vengono mai modificati, solo clonati con .copy().
+cached_hmac_states = lru_cache(maxsize=HMAC_CACHE_SIZE)(hmac_states)
+
+def hmac_with_states(states: HMACStates, data: bytes) -> bytes:
+    inner, outer = states[0].copy(), states[1].copy()
+    inner.update(data)
+    outer.update(inner.digest())
+    return outer.digest()
 
 def hmac_sha256(key: bytes, data: bytes) -> bytes:
-    return hmac.new(key, data, hashlib.sha256).digest()
+    # Chiave usata una sola volta (KEY di F/H): contesto fresco, senza cache né copie.
+    inner, outer = hmac_states(key)
+    inner.update(data)
+    outer.update(inner.digest())
+    return outer.digest()
+
+@lru_cache(maxsize=HMAC_CACHE_SIZE)
+def rfc_prefix_state(pad: int, key: bytes, n: int) -> "hashlib._Hash":
+    """
+    SHA-256 state after toByte(pad, n) || key (RFC 8391 padding prefix).
+    For PRF the key is constant (pub_seed, S_ots, ...) and for n=32 the prefix
+    fills exactly one block; F/H/H_msg cache only the padding (key=b"").
+    """
+    return hashlib.sha256(pad.to_bytes(n, "big") + key)
+
+def _rfc_hash(pad: int, key: bytes, data: bytes, n: int) -> bytes:
+    h = rfc_prefix_state(pad, b"", n).copy()
+    h.update(key)
+    h.update(data)
+    return h.digest()[:n]
 
 def sha256(data: bytes) -> bytes:
     return hashlib.sha256(data).digest()
 
-def PRF(key_n: bytes, in_32: bytes, n: int) -> bytes:
+def PRF(key_n: bytes, in_32: bytes, n: int, mode: str = HASH_MODE_HMAC) -> bytes:
     if len(key_n) != n:
         raise ValueError("PRF: key length != n")
+    if instrument.current is not None:
+        instrument.current.count("PRF")
     # RFC: PRF takes (n-byte key, 32-byte index/address); in our usage address is always 32 bytes.
-    return hmac_sha256(key_n, in_32)[:n]
+    if mode == HASH_MODE_HMAC:
+        return hmac_with_states(cached_hmac_states(key_n), in_32)[:n]
+    if mode == HASH_MODE_RFC:
+        h = rfc_prefix_state(_PAD_PRF, key_n, n).copy()
+        h.update(in_32)
+        return h.digest()[:n]
+    raise ValueError(f"Unknown hash mode: {mode}")
+
+def PRF_many(key_n: bytes, inputs: Iterable[bytes], n: int, mode: str = HASH_MODE_HMAC) -> List[bytes]:
+    """PRF(key_n, x, n) for every x, looking up the keyed context once."""
+    if len(key_n) != n:
+        raise ValueError("PRF: key length != n")
+    out: List[bytes] = []
+    if mode == HASH_MODE_HMAC:
+        states = cached_hmac_states(key_n)
+        out = [hmac_with_states(states, x)[:n] for x in inputs]
+    elif mode == HASH_MODE_RFC:
+        prefix = rfc_prefix_state(_PAD_PRF, key_n, n)
+        for x in inputs:
+            h = prefix.copy()
+            h.update(x)
+            out.append(h.digest()[:n])
+    else:
+        raise ValueError(f"Unknown hash mode: {mode}")
+    if instrument.current is not None:
+        instrument.current.count("PRF", len(out))
+    return out
 
-def F(key_n: bytes, x_n: bytes, n: int) -> bytes:
+def F(key_n: bytes, x_n: bytes, n: int, mode: str = HASH_MODE_HMAC) -> bytes:
     if len(key_n) != n or len(x_n) != n:
         raise ValueError("F: length mismatch")
-    return hmac_sha256(key_n, x_n)[:n]
+    if instrument.current is not None:
+        instrument.current.count("F")
+    if mode == HASH_MODE_HMAC:
+        return hmac_sha256(key_n, x_n)[:n]
+    if mode == HASH_MODE_RFC:
+        return _rfc_hash(_PAD_F, key_n, x_n, n)
+    raise ValueError(f"Unknown hash mode: {mode}")
 
-def H(key_n: bytes, x_2n: bytes, n: int) -> bytes:
+def H(key_n: bytes, x_2n: bytes, n: int, mode: str = HASH_MODE_HMAC) -> bytes:
     if len(key_n) != n or len(x_2n) != 2 * n:
         raise ValueError("H: length mismatch")
-    return hmac_sha256(key_n, x_2n)[:n]
+    if instrument.current is not None:
+        instrument.current.count("H")
+    if mode == HASH_MODE_HMAC:
+        return hmac_sha256(key_n, x_2n)[:n]
+    if mode == HASH_MODE_RFC:
+        return _rfc_hash(_PAD_H, key_n, x_2n, n)
+    raise ValueError(f"Unknown hash mode: {mode}")
+
+# Pezzo di messaggio accettato da H_msg_stream (bytes, bytearray, memoryview, mmap).
+Chunk = Union[bytes, bytearray, memoryview]
 
-def H_msg(key_3n: bytes, msg: bytes, n: int) -> bytes:
+def _h_msg_state(key_3n: bytes, n: int, mode: str) -> "hashlib._Hash":
+    """SHA-256 state after the H_msg prefix: the message is then absorbed with update()."""
     if len(key_3n) != 3 * n:
         raise ValueError("H_msg: key length != 3n")
-    return sha256(key_3n + msg)[:n]
+    if instrument.current is not None:
+        instrument.current.count("H_msg")
+    if mode == HASH_MODE_HMAC:
+        return hashlib.sha256(key_3n)
+    if mode == HASH_MODE_RFC:
+        h = rfc_prefix_state(_PAD_HMSG, b"", n).copy()
+        h.update(key_3n)
+        return h
+    raise ValueError(f"Unknown hash mode: {mode}")
+
+def H_msg(key_3n: bytes, msg: bytes, n: int, mode: str = HASH_MODE_HMAC) -> bytes:
+    h = _h_msg_state(key_3n, n, mode)
+    h.update(msg)
+    return h.digest()[:n]
+
+def H_msg_stream(key_3n: bytes, chunks: Iterable[Chunk], n: int, mode: str = HASH_MODE_HMAC) -> bytes:
+    """H_msg over a message given as consecutive chunks, without joining them."""
+    h = _h_msg_state(key_3n, n, mode)
+    for chunk in chunks:
+        h.update(chunk)
+    return h.digest()[:n]
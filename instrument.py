@@ -0,0 +1,142 @@
+# instrument.py
+"""
+Optional instrumentation: PRF/F/H/H_msg call counters and timing spans for
+the phases (wots_sk_from_seed, wots_gen_pk, ltree, treehash, build_auth,
+xmss_root_from_sig), aggregated per operation (keygen, sign, verify, ...).
+
+Off by default: primitives test `current is not None`, spans call the wrapped
+function directly. Turn it on with
+
+    with profile() as prof:
+        ...
+    print(prof.to_json())
+
+or for a whole process with XMSS_PROFILE=1 (JSON report on stderr at exit)
+or XMSS_PROFILE=<path> (report written to path).
+Spans are inclusive (treehash time includes its leaves); work done in
+worker processes (workers > 1) is not counted. One profile per process, not
+per thread.
+"""
+from __future__ import annotations
+import atexit
+from contextlib import contextmanager
+from functools import wraps
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, cast
+
+ENV_VAR = "XMSS_PROFILE"
+PRIMITIVES = ("PRF", "F", "H", "H_msg")
+# Operazione usata per le fasi chiamate fuori da keygen/sign/verify.
+NO_OPERATION = "-"
+
+T = TypeVar("T", bound=Callable[..., Any])
+
+
+class SpanStats:
+    """Calls, total time and primitive calls of one span (operation or phase)."""
+    __slots__ = ("calls", "time", "hashes")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.time = 0.0
+        self.hashes: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "time_s": self.time, "hashes": dict(self.hashes)}
+
+
+class Profile:
+    def __init__(self) -> None:
+        self.total = SpanStats()
+        self.operations: Dict[str, SpanStats] = {}
+        self.phases: Dict[Tuple[str, str], SpanStats] = {}
+        self._op = NO_OPERATION
+        # Span aperti: ogni chiamata a primitiva viene contata su tutti.
+        self._open: List[SpanStats] = [self.total]
+
+    def count(self, primitive: str, k: int = 1) -> None:
+        for st in self._open:
+            st.hashes[primitive] = st.hashes.get(primitive, 0) + k
+
+    def run(self, operation: bool, name: str, fn: Callable[..., Any], args: Any, kwargs: Any) -> Any:
+        prev_op = self._op
+        if operation:
+            st = self.operations.setdefault(name, SpanStats())
+            self._op = name
+        else:
+            st = self.phases.setdefault((self._op, name), SpanStats())
+        st.calls += 1
+        self._open.append(st)
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            st.time += time.perf_counter() - t0
+            self._open.pop()
+            self._op = prev_op
+
+    def to_dict(self) -> Dict[str, Any]:
+        """{"hashes": totals, "operations": {op: {calls, time_s, hashes, phases: {...}}}}"""
+        ops: Dict[str, Any] = {name: dict(st.to_dict(), phases={}) for name, st in self.operations.items()}
+        for (op, phase), st in self.phases.items():
+            if op not in ops:
+                ops[op] = dict(SpanStats().to_dict(), phases={})
+            ops[op]["phases"][phase] = st.to_dict()
+        return {"hashes": dict(self.total.hashes), "operations": ops}
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent, sort_keys=True)
+
+
+# Profilo attivo (None = strumentazione spenta). Solo lettura per gli altri moduli.
+current: Optional[Profile] = None
+
+
+@contextmanager
+def profile() -> Iterator[Profile]:
+    """Collect a new Profile for the duration of the block (the previous one is restored)."""
+    global current
+    prev, prof = current, Profile()
+    current = prof
+    try:
+        yield prof
+    finally:
+        current = prev
+
+
+def _span(operation: bool, name: str) -> Callable[[T], T]:
+    def deco(fn: T) -> T:
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            prof = current
+            if prof is None:
+                return fn(*args, **kwargs)
+            return prof.run(operation, name, fn, args, kwargs)
+        return cast(T, wrapper)
+    return deco
+
+
+def operation(name: str) -> Callable[[T], T]:
+    """Decorator: top-level operation (keygen, sign, verify) that groups phases."""
+    return _span(True, name)
+
+
+def phase(name: str) -> Callable[[T], T]:
+    """Decorator: timed phase inside the current operation."""
+    return _span(False, name)
+
+
+def _report_at_exit(prof: Profile, target: str) -> None:
+    if target == "1":
+        sys.stderr.write(prof.to_json() + "\n")
+    else:
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(prof.to_json())
+
+
+if os.environ.get(ENV_VAR):
+    current = Profile()
+    atexit.register(_report_at_exit, current, os.environ[ENV_VAR])
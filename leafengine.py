@@ -0,0 +1,299 @@
+# leafengine.py
+"""
+Lockstep leaf engine: computes many XMSS leaves (WOTS+ PK + L-tree) at once.
+
+Every leaf runs the same sequence of PRF/F/H calls on different data, so a
+batch of leaves is moved forward together: all chains of all leaves of the
+batch take step j at the same time, then the L-trees are reduced level by
+level. Hash states are NumPy uint32 arrays with one column per lane and the
+SHA-256 compression function is evaluated on all lanes with array operations.
+HMAC-SHA256 and the RFC 8391 padding construction are both supported; the
+leaves are bit-identical to xmss.gen_leaf.
+
+NumPy is an optional dependency: without it only ENGINE_PYTHON is available.
+"""
+from __future__ import annotations
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from address import Address
+from hashfuncs import HASH_MODE_HMAC, HASH_MODE_RFC, _PAD_F, _PAD_H, _PAD_PRF
+from params import XMSSParams
+import instrument
+
+# Motore usato da treehash per le foglie: gen_leaf una alla volta oppure questo modulo.
+ENGINE_PYTHON = "python"
+ENGINE_NUMPY = "numpy"
+ENGINES = (ENGINE_PYTHON, ENGINE_NUMPY)
+
+# Lane SHA-256 per batch: sotto qualche migliaio domina l'overhead di NumPy.
+LANES = 1 << 14
+
+_K = (
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+)
+_IV = (0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19)
+
+_BLOCK = 64
+
+if np is not None:
+    _K_COL = np.array(_K, dtype=np.uint32)[:, None]
+    _IV_COL = np.array(_IV, dtype=np.uint32)[:, None]
+
+# Stato SHA-256 di tutte le lane dopo un prefisso: (parole (8, B) o (8, 1), byte assorbiti).
+State = Tuple["np.ndarray", int]
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("The numpy leaf engine requires numpy")
+
+
+def check_engine(engine: str) -> None:
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {ENGINES}")
+    if engine == ENGINE_NUMPY:
+        _require_numpy()
+
+
+# --- SHA-256 multi-lane ---------------------------------------------------
+
+def _compress(state: "np.ndarray", block: "np.ndarray") -> "np.ndarray":
+    """SHA-256 compression (FIPS 180-4, 6.2.2) of block (16, B) into state (8, B) or (8, 1)."""
+    B = block.shape[1]
+    W = np.empty((64, B), dtype=np.uint32)
+    W[:16] = block
+    for t in range(16, 64):
+        x, y = W[t - 15], W[t - 2]
+        s0 = ((x >> 7) | (x << 25)) ^ ((x >> 18) | (x << 14)) ^ (x >> 3)
+        s1 = ((y >> 17) | (y << 15)) ^ ((y >> 19) | (y << 13)) ^ (y >> 10)
+        W[t] = W[t - 16] + s0 + W[t - 7] + s1
+    W += _K_COL
+
+    a, b, c, d, e, f, g, h = (np.broadcast_to(r, (B,)) for r in state)
+    bc = b ^ c
+    for t in range(64):
+        S1 = ((e >> 6) | (e << 26)) ^ ((e >> 11) | (e << 21)) ^ ((e >> 25) | (e << 7))
+        t1 = h + S1 + (g ^ (e & (f ^ g))) + W[t]
+        S0 = ((a >> 2) | (a << 30)) ^ ((a >> 13) | (a << 19)) ^ ((a >> 22) | (a << 10))
+        # Maj(a, b, c) = b ^ ((a ^ b) & (b ^ c)); a ^ b è il b ^ c del round dopo.
+        ab = a ^ b
+        t2 = S0 + (b ^ (ab & bc))
+        bc = ab
+        h, g, f, e, d, c, b, a = g, f, e, d + t1, c, b, a, t1 + t2
+    return np.stack((a, b, c, d, e, f, g, h)) + state
+
+
+def _absorb(state: "np.ndarray", data: "np.ndarray") -> "np.ndarray":
+    """Compress the full 64-byte blocks of data (B, 64k) uint8, without padding."""
+    words = np.ascontiguousarray(data.view(">u4").astype(np.uint32).T)
+    for k in range(0, words.shape[0], 16):
+        state = _compress(state, words[k:k + 16])
+    return state
+
+
+def _finish(state: State, tail: "np.ndarray") -> "np.ndarray":
+    """Digests (B, 32) of prefix || tail[i], with the SHA-256 padding of the total length."""
+    words, done = state
+    B, L = tail.shape
+    total = done + L
+    size = -(-(L + 9) // _BLOCK) * _BLOCK
+    buf = np.zeros((B, size), dtype=np.uint8)
+    buf[:, :L] = tail
+    buf[:, L] = 0x80
+    buf[:, -8:] = np.frombuffer((total * 8).to_bytes(8, "big"), dtype=np.uint8)
+    out = _absorb(words, buf)
+    return np.ascontiguousarray(out.T).astype(">u4").view(np.uint8)
+
+
+def _prefix(data: bytes) -> Tuple[State, bytes]:
+    """State after the full blocks of a constant prefix, plus the bytes left over."""
+    full = len(data) - len(data) % _BLOCK
+    words = _IV_COL
+    if full:
+        words = _absorb(words, np.frombuffer(data[:full], dtype=np.uint8)[None, :])
+    return (words, full), data[full:]
+
+
+def _key_blocks(keys: "np.ndarray", pad: int) -> "np.ndarray":
+    block = np.zeros((keys.shape[0], _BLOCK), dtype=np.uint8)
+    block[:, :keys.shape[1]] = keys
+    return block ^ np.uint8(pad)
+
+
+def _hmac(inner: State, outer: State, data: "np.ndarray") -> "np.ndarray":
+    return _finish(outer, _finish(inner, data))
+
+
+def _hmac_keys(keys: "np.ndarray") -> Tuple[State, State]:
+    """HMAC ipad/opad states (RFC 2104) for keys (B, n), n <= 64."""
+    return (_absorb(_IV_COL, _key_blocks(keys, 0x36)), _BLOCK), (_absorb(_IV_COL, _key_blocks(keys, 0x5C)), _BLOCK)
+
+
+class _PRF:
+    """PRF(seed, x) on many 32-byte inputs x, with the seed-dependent prefix hashed once."""
+
+    def __init__(self, seed: bytes, params: XMSSParams) -> None:
+        self.n, self.mode = params.n, params.hash_mode
+        key = np.frombuffer(seed, dtype=np.uint8)[None, :]
+        if self.mode == HASH_MODE_HMAC:
+            self.inner, self.outer = _hmac_keys(key)
+        else:
+            self.state, rest = _prefix(_PAD_PRF.to_bytes(self.n, "big") + seed)
+            self.rest = np.frombuffer(rest, dtype=np.uint8)
+
+    def __call__(self, x: "np.ndarray") -> "np.ndarray":
+        if instrument.current is not None:
+            instrument.current.count("PRF", x.shape[0])
+        if self.mode == HASH_MODE_HMAC:
+            return _hmac(self.inner, self.outer, x)[:, :self.n]
+        if len(self.rest):
+            x = np.concatenate((np.broadcast_to(self.rest, (x.shape[0], len(self.rest))), x), axis=1)
+        return _finish(self.state, x)[:, :self.n]
+
+
+def _keyed(pad: int, keys: "np.ndarray", data: "np.ndarray", params: XMSSParams) -> "np.ndarray":
+    """F (pad=_PAD_F) or H (pad=_PAD_H) with a different n-byte key per lane."""
+    n = params.n
+    if instrument.current is not None:
+        instrument.current.count("F" if pad == _PAD_F else "H", keys.shape[0])
+    if params.hash_mode == HASH_MODE_HMAC:
+        inner, outer = _hmac_keys(keys)
+        return _hmac(inner, outer, data)[:, :n]
+    head = np.zeros((keys.shape[0], n), dtype=np.uint8)
+    head[:, -1] = pad
+    return _finish((_IV_COL, 0), np.concatenate((head, keys, data), axis=1))[:, :n]
+
+
+# --- foglie ---------------------------------------------------------------
+
+def _addresses(base: Address, count: int) -> "np.ndarray":
+    """count copies of the 8 address words of base (layer and tree are kept)."""
+    words = np.zeros((count, 8), dtype=np.uint32)
+    words[:, :3] = np.frombuffer(base.to_bytes()[:12], dtype=">u4")
+    return words
+
+
+def _adrs_bytes(words: "np.ndarray") -> "np.ndarray":
+    return words.astype(">u4").view(np.uint8)
+
+
+def _wots_pks(sk_seed: bytes, prf: _PRF, params: XMSSParams, start: int, count: int,
+              base: Address, points: Sequence[int] = ()) -> Tuple["np.ndarray", List["np.ndarray"]]:
+    """
+    WOTS+ public keys of leaves [start, start+count): array (count, len, n),
+    and the chain values at each position in points: arrays (count * len, n).
+    """
+    n, length = params.n, params.length
+    lanes = count * length
+
+    # S_ots[i] = PRF(sk_seed, toByte(i, 32)), sk[i][c] = PRF(S_ots[i], toByte(c, 32)).
+    idx = np.zeros((count, 8), dtype=np.uint32)
+    idx[:, 7] = np.arange(start, start + count, dtype=np.uint32)
+    s_ots = _PRF(sk_seed, params)(_adrs_bytes(idx))
+    chains = np.zeros((length, 8), dtype=np.uint32)
+    chains[:, 7] = np.arange(length, dtype=np.uint32)
+    chain_in = np.tile(_adrs_bytes(chains), (count, 1))
+    if params.hash_mode == HASH_MODE_HMAC:
+        if instrument.current is not None:
+            instrument.current.count("PRF", lanes)
+        # Chiave per foglia: stati ipad/opad calcolati una volta e ripetuti per le len chain.
+        (inner, _), (outer, _) = _hmac_keys(s_ots)
+        X = _hmac((np.repeat(inner, length, axis=1), _BLOCK), (np.repeat(outer, length, axis=1), _BLOCK),
+                  chain_in)[:, :n]
+    else:
+        if instrument.current is not None:
+            instrument.current.count("PRF", lanes)
+        head = np.zeros((lanes, n), dtype=np.uint8)
+        head[:, -1] = _PAD_PRF
+        X = _finish((_IV_COL, 0), np.concatenate((head, np.repeat(s_ots, length, axis=0), chain_in), axis=1))[:, :n]
+
+    # Catene: tutte le lane fanno il passo j insieme (RFC 8391, Algorithm 2).
+    adrs = _addresses(base, 2 * lanes)
+    adrs[:, 4] = np.tile(np.repeat(np.arange(start, start + count, dtype=np.uint32), length), 2)
+    adrs[:, 5] = np.tile(np.arange(length, dtype=np.uint32), 2 * count)
+    adrs[lanes:, 7] = 1
+    mids: List["np.ndarray"] = []
+    for j in range(params.w - 1):
+        adrs[:, 6] = j
+        km = prf(_adrs_bytes(adrs))
+        X = _keyed(_PAD_F, km[:lanes], X ^ km[lanes:], params)
+        if j + 1 in points:
+            mids.append(X)
+    return X.reshape(count, length, n), mids
+
+
+def _ltrees(pks: "np.ndarray", prf: _PRF, params: XMSSParams, start: int, base: Address) -> "np.ndarray":
+    """L-tree roots (RFC 8391, Algorithm 8) of all pks at once: array (count, n)."""
+    count, l, n = pks.shape
+    nodes = pks
+    height = 0
+    while l > 1:
+        half = l // 2
+        lanes = count * half
+        adrs = _addresses(base, 3 * lanes)
+        adrs[:, 3] = 1
+        adrs[:, 4] = np.tile(np.repeat(np.arange(start, start + count, dtype=np.uint32), half), 3)
+        adrs[:, 5] = height
+        adrs[:, 6] = np.tile(np.arange(half, dtype=np.uint32), 3 * count)
+        adrs[:, 7] = np.repeat(np.arange(3, dtype=np.uint32), lanes)
+        masks = prf(_adrs_bytes(adrs))
+        left = nodes[:, 0:2 * half:2].reshape(lanes, n) ^ masks[lanes:2 * lanes]
+        right = nodes[:, 1:2 * half:2].reshape(lanes, n) ^ masks[2 * lanes:]
+        merged = _keyed(_PAD_H, masks[:lanes], np.concatenate((left, right), axis=1), params).reshape(count, half, n)
+        if l % 2 == 1:
+            # Nodo dispari promosso al livello successivo.
+            merged = np.concatenate((merged, nodes[:, l - 1:l]), axis=1)
+        nodes = merged
+        l = nodes.shape[1]
+        height += 1
+    return nodes[:, 0]
+
+
+def gen_leaves(sk_seed: bytes, pub_seed: bytes, params: XMSSParams, start: int, count: int,
+               adrs: Address, chain_points: Sequence[int] = (),
+               on_chains: Optional[Callable[[int, List[bytes]], None]] = None) -> List[bytes]:
+    """
+    Leaves start .. start+count-1 of the tree at adrs (layer and tree words);
+    same values as xmss.gen_leaf. adrs is not modified.
+    on_chains(leaf, values) is called as in xmss.gen_leaf, before returning.
+    """
+    _require_numpy()
+    if params.hash_mode not in (HASH_MODE_HMAC, HASH_MODE_RFC) or params.n > 32:
+        raise ValueError("numpy leaf engine: unsupported parameters (n must be <= 32)")
+    if count <= 0:
+        return []
+    prf = _PRF(pub_seed, params)
+    points = tuple(chain_points) if on_chains is not None else ()
+    pks, mids = _wots_pks(sk_seed, prf, params, start, count, adrs, points)
+    if on_chains is not None:
+        # Stesso ordine di wots_gen_pk: per ogni chain, i valori ai checkpoint.
+        k = len(points)
+        values = np.stack(mids, axis=1).reshape(count, params.length * k, params.n) if k else None
+        for l in range(count):
+            on_chains(start + l, [bytes(v) for v in values[l]] if values is not None else [])
+    roots = _ltrees(pks, prf, params, start, adrs)
+    return [bytes(r) for r in roots]
+
+
+def iter_leaves(sk_seed: bytes, pub_seed: bytes, params: XMSSParams, start: int, count: int,
+                adrs: Address, batch: Optional[int] = None, chain_points: Sequence[int] = (),
+                on_chains: Optional[Callable[[int, List[bytes]], None]] = None) -> Iterator[bytes]:
+    """gen_leaves in batches of `batch` leaves (default: about LANES chains per batch)."""
+    if batch is None:
+        batch = max(1, LANES // params.length)
+    base = adrs.copy()
+    for s in range(start, start + count, batch):
+        yield from gen_leaves(sk_seed, pub_seed, params, s, min(batch, start + count - s), base,
+                              chain_points, on_chains)
@@ -0,0 +1,175 @@
+# lease.py
+"""
+Cross-process index leasing on a shared key file (serialize.py format).
+
+A process takes an exclusive lease on a disjoint range [start, end) of
+indices and signs from it locally, without further coordination. The idx in
+the key file is the high-water mark: it is advanced (atomically, under an
+advisory lock) before the range is handed out, so a crash only skips indices.
+Unused indices returned on a clean shutdown go back to the key file when they
+sit right below the high-water mark, otherwise to a free list (path + ".free",
+records start u64 || end u64) that later leases consume first.
+
+Locking uses fcntl.flock on path + ".lock" (POSIX only); every process
+sharing the key must go through this module.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import replace
+import struct
+import threading
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from chainstore import open_chain_store
+from nodestore import open_node_store
+from serialize import load_private_key, save_private_key_atomic, write_file_atomic
+from xmss import XMSSPrivateKey, xmss_sign
+
+_RANGE = struct.Struct(">QQ")
+Lease = Tuple[int, int]
+
+
+@contextmanager
+def _locked(path: str) -> Iterator[None]:
+    if fcntl is None:
+        raise RuntimeError("Index leasing requires fcntl (POSIX)")
+    with open(path + ".lock", "a+b") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _read_free(path: str) -> List[Lease]:
+    try:
+        with open(path + ".free", "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    usable = len(data) - len(data) % _RANGE.size
+    return [_RANGE.unpack_from(data, off) for off in range(0, usable, _RANGE.size)]
+
+
+def _write_free(path: str, ranges: List[Lease]) -> None:
+    write_file_atomic(path + ".free", b"".join(_RANGE.pack(s, e) for s, e in ranges))
+
+
+def acquire_lease(path: str, size: int) -> Lease:
+    """Reserve up to `size` indices for the caller: returns [start, end)."""
+    if size < 1:
+        raise ValueError("lease size must be >= 1")
+    with _locked(path):
+        free = _read_free(path)
+        if free:
+            # Prima gli intervalli restituiti da altri processi.
+            start, end = free.pop()
+            if end - start > size:
+                free.append((start + size, end))
+                end = start + size
+            _write_free(path, free)
+            return start, end
+
+        SK = load_private_key(path)
+        limit = SK.params.max_signatures
+        if SK.idx >= limit:
+            raise ValueError("XMSS: no signatures left for this key (idx exhausted)")
+        start, end = SK.idx, min(SK.idx + size, limit)
+        save_private_key_atomic(path, replace(SK, idx=end))
+        return start, end
+
+
+def release_lease(path: str, start: int, end: int) -> None:
+    """Give back the unused indices [start, end) of a lease."""
+    if start >= end:
+        return
+    with _locked(path):
+        SK = load_private_key(path)
+        free = _read_free(path)
+        if end != SK.idx:
+            free.append((start, end))
+            _write_free(path, free)
+            return
+
+        # Intervallo in cima: si abbassa l'high-water mark, assorbendo anche gli
+        # intervalli liberi che diventano contigui.
+        idx = start
+        merged = True
+        while merged:
+            merged = False
+            for i, (s, e) in enumerate(free):
+                if e == idx:
+                    idx = s
+                    del free[i]
+                    merged = True
+                    break
+        # Il free list va riscritto prima: un crash nel mezzo lascia solo indici saltati.
+        _write_free(path, free)
+        save_private_key_atomic(path, replace(SK, idx=idx))
+
+
+class LeasedSigner:
+    """
+    Signs with a shared key file from a private lease of `size` indices,
+    taking a new lease when the current one is used up.
+    node_store_path: optional node store of the key (nodestore.py), strongly
+    advised, since a lease starts at an arbitrary index and has no BDS state.
+    chain_store_path: optional WOTS+ chain checkpoints of the key (chainstore.py).
+    """
+
+    def __init__(self, path: str, size: int = 1024, node_store_path: Optional[str] = None,
+                 chain_store_path: Optional[str] = None) -> None:
+        self.path = path
+        self.size = size
+        SK = load_private_key(path)
+        if node_store_path is not None:
+            SK = open_node_store(node_store_path, SK)
+        if chain_store_path is not None:
+            SK = open_chain_store(chain_store_path, SK)
+        self._lock = threading.Lock()
+        self._closed = False
+        start, self._end = acquire_lease(path, size)
+        self._sk = replace(SK, idx=start)
+
+    @property
+    def sk(self) -> XMSSPrivateKey:
+        """Private key at the next index of the current lease."""
+        return self._sk
+
+    @property
+    def lease(self) -> Lease:
+        """Indices still owned by this signer: [next, end)."""
+        return self._sk.idx, self._end
+
+    def sign(self, M: bytes) -> bytes:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("LeasedSigner is closed")
+            if self._sk.idx >= self._end:
+                start, self._end = acquire_lease(self.path, self.size)
+                self._sk = replace(self._sk, idx=start)
+            self._sk, sig = xmss_sign(M, self._sk)
+            return sig
+
+    def close(self) -> None:
+        """Return the unused part of the lease."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            release_lease(self.path, self._sk.idx, self._end)
+            if self._sk.node_store is not None:
+                self._sk.node_store.close()
+            if self._sk.chain_store is not None:
+                self._sk.chain_store.close()
+
+    def __enter__(self) -> "LeasedSigner":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
@@ -1,25 +1,38 @@
 # ltree.py
 from __future__ import annotations
-from typing import List
+from typing import List, Tuple
 from params import XMSSParams
 from address import Address
 from utils import xor_bytes
 from hashfuncs import PRF, H
+import instrument
+
+Masks = Tuple[bytes, bytes, bytes]
+
+def rand_hash_masks(SEED: bytes, adrs: Address, params: XMSSParams) -> Masks:
+    """RFC 8391, Algorithm 7: (KEY, BM_0, BM_1) = PRF(SEED, ADRS) con keyAndMask=0/1/2."""
+    n, mode = params.n, params.hash_mode
+    adrs.set_key_and_mask(0)
+    KEY = PRF(SEED, adrs.to_bytes(), n, mode)
+    adrs.set_key_and_mask(1)
+    BM0 = PRF(SEED, adrs.to_bytes(), n, mode)
+    adrs.set_key_and_mask(2)
+    BM1 = PRF(SEED, adrs.to_bytes(), n, mode)
+    return KEY, BM0, BM1
+
+def rand_hash_with_masks(left: bytes, right: bytes, masks: Masks, params: XMSSParams) -> bytes:
+    """H(KEY, (LEFT^BM0)||(RIGHT^BM1)) con maschere già calcolate."""
+    KEY, BM0, BM1 = masks
+    return H(KEY, xor_bytes(left, BM0) + xor_bytes(right, BM1), params.n, params.hash_mode)
 
 def rand_hash(left: bytes, right: bytes, SEED: bytes, adrs: Address, params: XMSSParams) -> bytes:
     """
     RFC 8391, Algorithm 7: KEY, BM_0, BM_1 da PRF(SEED, ADRS) con keyAndMask=0/1/2.
     Ritorna H(KEY, (LEFT^BM0)||(RIGHT^BM1)).
     """
-    n = params.n
-    adrs.set_key_and_mask(0)
-    KEY = PRF(SEED, adrs.to_bytes(), n)
-    adrs.set_key_and_mask(1)
-    BM0 = PRF(SEED, adrs.to_bytes(), n)
-    adrs.set_key_and_mask(2)
-    BM1 = PRF(SEED, adrs.to_bytes(), n)
-    return H(KEY, xor_bytes(left, BM0) + xor_bytes(right, BM1), n)
+    return rand_hash_with_masks(left, right, rand_hash_masks(SEED, adrs, params), params)
 
+@instrument.phase("ltree")
 def ltree(pk: List[bytes], SEED: bytes, adrs: Address, params: XMSSParams) -> bytes:
     """RFC 8391, Algorithm 8: costruzione dell'L-tree dalla WOTS PK."""
     nodes = pk[:]  # copia difensiva per non mutare l'input
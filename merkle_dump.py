@@ -1,34 +1,22 @@
 # merkle_dump.py
 from __future__ import annotations
+from dataclasses import dataclass
 import json
-from typing import Dict, List
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 from address import Address
 from hashfuncs import PRF, H
-from ltree import ltree, rand_hash
 from params import XMSSParams
-from utils import to_bytes, xor_bytes
-from wots import wots_gen_pk, wots_sk_from_seed
-from xmss import XMSSPrivateKey
+from utils import xor_bytes
+from leafengine import ENGINE_PYTHON
+from xmss import XMSSPrivateKey, treehash, treehash_parallel
 
 
 def _hex(b: bytes) -> str:
     return b.hex()
 
 
-def _leaf_from_sk(sk_seed: bytes, pub_seed: bytes, idx: int, params: XMSSParams) -> bytes:
-    adrs = Address()
-    adrs.set_type(0)
-    adrs.set_ots_address(idx)
-    s_ots = PRF(sk_seed, to_bytes(idx, 32), params.n)
-    wots_sk = wots_sk_from_seed(s_ots, params)
-    pk = wots_gen_pk(wots_sk, pub_seed, adrs, params)
-
-    adrs.set_type(1)
-    adrs.set_ltree_address(idx)
-    return ltree(pk, pub_seed, adrs, params)
-
-
 def _internal_node_detail(left: bytes, right: bytes, height: int, index: int, pub_seed: bytes, params: XMSSParams) -> Dict[str, str]:
     adrs = Address()
     adrs.set_type(2)
@@ -36,15 +24,15 @@ def _internal_node_detail(left: bytes, right: bytes, height: int, index: int, pu
     adrs.set_tree_index(index)
 
     adrs.set_key_and_mask(0)
-    key = PRF(pub_seed, adrs.to_bytes(), params.n)
+    key = PRF(pub_seed, adrs.to_bytes(), params.n, params.hash_mode)
     adrs.set_key_and_mask(1)
-    bm0 = PRF(pub_seed, adrs.to_bytes(), params.n)
+    bm0 = PRF(pub_seed, adrs.to_bytes(), params.n, params.hash_mode)
     adrs.set_key_and_mask(2)
-    bm1 = PRF(pub_seed, adrs.to_bytes(), params.n)
+    bm1 = PRF(pub_seed, adrs.to_bytes(), params.n, params.hash_mode)
 
     masked_left = xor_bytes(left, bm0)
     masked_right = xor_bytes(right, bm1)
-    node = H(key, masked_left + masked_right, params.n)
+    node = H(key, masked_left + masked_right, params.n, params.hash_mode)
 
     return {
         "index": index,
@@ -59,66 +47,160 @@ def _internal_node_detail(left: bytes, right: bytes, height: int, index: int, pu
     }
 
 
-def build_merkle_json(sk: XMSSPrivateKey, target_idx: int) -> Dict[str, object]:
+@dataclass
+class MerkleTree:
+    """
+    All nodes of one XMSS tree in compact arrays: levels[k] holds the
+    2^(h-k) nodes of height k, n bytes each, concatenated (k = 0 leaves,
+    k = h root). Built once, reused for any target_idx and for the export.
+    """
+    params: XMSSParams
+    pub_seed: bytes
+    levels: List[bytearray]
+
+    def node(self, level: int, index: int) -> bytes:
+        n = self.params.n
+        return bytes(self.levels[level][index * n:(index + 1) * n])
+
+    def count(self, level: int) -> int:
+        return 1 << (self.params.h - level)
+
+    @property
+    def root(self) -> bytes:
+        return self.node(self.params.h, 0)
+
+
+def build_merkle_tree(sk: XMSSPrivateKey, workers: int = 1, engine: str = ENGINE_PYTHON) -> MerkleTree:
+    """
+    Compute every node once (from sk.node_store if attached, else with treehash;
+    engine is passed to treehash, "numpy" computes the leaves in batches).
+    """
     params = sk.params
-    leaf_count = 1 << params.h
-
-    # Livello foglie.
-    leaves: List[bytes] = []
-    leaf_nodes: List[Dict[str, str]] = []
-    for i in range(leaf_count):
-        leaf = _leaf_from_sk(sk.sk_seed, sk.pub_seed, i, params)
-        leaves.append(leaf)
-        leaf_nodes.append({"index": i, "value": _hex(leaf)})
-
-    levels: List[Dict[str, object]] = [{"level": 0, "nodes": leaf_nodes}]
-
-    # Livelli interni.
-    current = leaves
-    for height in range(params.h):
-        next_nodes: List[bytes] = []
-        details: List[Dict[str, str]] = []
-        for i in range(0, len(current), 2):
-            detail = _internal_node_detail(current[i], current[i + 1], height, i // 2, sk.pub_seed, params)
-            next_nodes.append(bytes.fromhex(detail["value"]))
-            details.append(detail)
-        levels.append({"level": height + 1, "tree_height": height, "nodes": details})
-        current = next_nodes
-
-    root = current[0]
-
-    # Auth path e percorso per target_idx.
-    auth: List[Dict[str, str]] = []
-    path: List[Dict[str, str]] = []
+    h, n = params.h, params.n
+    levels = [bytearray((1 << (h - k)) * n) for k in range(h + 1)]
+
+    def on_node(height: int, index: int, node: bytes) -> None:
+        levels[height][index * n:(index + 1) * n] = node
+
+    if sk.node_store is not None:
+        for k in range(h + 1):
+            for i in range(1 << (h - k)):
+                on_node(k, i, sk.node_store.get(k, i))
+    elif workers != 1:
+        treehash_parallel(sk, 0, h, Address(), workers=workers, on_node=on_node, engine=engine)
+    else:
+        treehash(sk, 0, h, Address(), on_node, engine)
+    return MerkleTree(params=params, pub_seed=sk.pub_seed, levels=levels)
+
+
+def level_nodes(tree: MerkleTree, level: int, start: int, stop: int) -> Iterator[Dict[str, object]]:
+    """JSON entries of nodes [start, stop) of a level (with KEY/BM0/BM1 for internal nodes)."""
+    for i in range(start, stop):
+        if level == 0:
+            yield {"index": i, "value": _hex(tree.node(0, i))}
+        else:
+            left, right = tree.node(level - 1, 2 * i), tree.node(level - 1, 2 * i + 1)
+            yield _internal_node_detail(left, right, level - 1, i, tree.pub_seed, tree.params)
+
+
+def _target_path(tree: MerkleTree, target_idx: int) -> Tuple[List[Dict[str, object]], List[Dict[str, object]]]:
+    """(auth_path, path) della foglia target_idx, letti dagli array."""
+    if not 0 <= target_idx < tree.count(0):
+        raise ValueError("target_idx out of range")
+    auth: List[Dict[str, object]] = []
+    path: List[Dict[str, object]] = []
     idx = target_idx
-    for level in range(params.h):
-        nodes = levels[level]["nodes"]
-        node_value = nodes[idx]["value"]
-        path.append({"level": level, "node_index": idx, "node_value": node_value})
+    for level in range(tree.params.h):
+        path.append({"level": level, "node_index": idx, "node_value": _hex(tree.node(level, idx))})
         sib = idx ^ 1
-        auth.append({"level": level, "sibling_index": sib, "sibling_value": nodes[sib]["value"]})
+        auth.append({"level": level, "sibling_index": sib, "sibling_value": _hex(tree.node(level, sib))})
         idx //= 2
+    return auth, path
+
+
+def _params_dict(params: XMSSParams) -> Dict[str, object]:
+    return {"n": params.n, "w": params.w, "h": params.h, "hash_mode": params.hash_mode}
+
 
+def build_merkle_path_json(tree: MerkleTree, target_idx: int) -> Dict[str, object]:
+    """Tree summary and path of target_idx, without the levels (the viewer fetches nodes on demand)."""
+    auth, path = _target_path(tree, target_idx)
     return {
-        "params": {"n": params.n, "w": params.w, "h": params.h},
+        "params": _params_dict(tree.params),
         "target_idx": target_idx,
-        "pub_seed": _hex(sk.pub_seed),
-        "root": _hex(root),
-        "tree": {"levels": levels},
+        "pub_seed": _hex(tree.pub_seed),
+        "root": _hex(tree.root),
         "auth_path": auth,
         "path": path,
     }
 
 
-def dump_merkle_json(path: str, sk: XMSSPrivateKey, target_idx: int = 5, demos: Dict[str, object] | None = None) -> None:
-    base = build_merkle_json(sk, target_idx)
-    payload = {
-        "params": base["params"],
-        "target_idx": base["target_idx"],
-        "pub_seed": base["pub_seed"],
-        "root": base["root"],
+def build_merkle_json(sk: XMSSPrivateKey, target_idx: int, tree: Optional[MerkleTree] = None) -> Dict[str, object]:
+    """Whole tree as one dict (small trees / demo); pass tree to reuse an already built one."""
+    if tree is None:
+        tree = build_merkle_tree(sk)
+    h = tree.params.h
+    levels: List[Dict[str, object]] = [{"level": 0, "nodes": list(level_nodes(tree, 0, 0, tree.count(0)))}]
+    for level in range(1, h + 1):
+        levels.append({"level": level, "tree_height": level - 1,
+                       "nodes": list(level_nodes(tree, level, 0, tree.count(level)))})
+    base = build_merkle_path_json(tree, target_idx)
+    base["tree"] = {"levels": levels}
+    return base
+
+
+def dump_merkle_json(path: str, sk: XMSSPrivateKey, target_idx: int = 5, demos: Dict[str, object] | None = None,
+                     tree: Optional[MerkleTree] = None) -> None:
+    if tree is None:
+        tree = build_merkle_tree(sk)
+    payload: Dict[str, object] = {
+        "params": _params_dict(tree.params),
+        "target_idx": target_idx,
+        "pub_seed": _hex(tree.pub_seed),
+        "root": _hex(tree.root),
     }
     if demos is not None:
         payload["demos"] = demos
     with open(path, "w", encoding="utf-8") as f:
         json.dump(payload, f, indent=2)
+
+
+def dump_merkle_chunks(out_dir: str, tree: MerkleTree, chunk_nodes: int = 1024,
+                       targets: Iterable[int] = ()) -> Dict[str, object]:
+    """
+    Stream the tree to out_dir as one JSON file per chunk of at most
+    chunk_nodes nodes of a level (level-<k>-<c>.json, {"level", "start", "nodes"})
+    plus manifest.json listing them (and the auth path of each target).
+    Only one chunk is held in memory at a time. Returns the manifest.
+    """
+    if chunk_nodes < 1:
+        raise ValueError("chunk_nodes must be >= 1")
+    os.makedirs(out_dir, exist_ok=True)
+    levels: List[Dict[str, object]] = []
+    for level in range(tree.params.h + 1):
+        count = tree.count(level)
+        chunks: List[Dict[str, object]] = []
+        for c, start in enumerate(range(0, count, chunk_nodes)):
+            stop = min(start + chunk_nodes, count)
+            name = f"level-{level}-{c}.json"
+            with open(os.path.join(out_dir, name), "w", encoding="utf-8") as f:
+                json.dump({"level": level, "start": start, "nodes": list(level_nodes(tree, level, start, stop))}, f)
+            chunks.append({"file": name, "start": start, "count": stop - start})
+        levels.append({"level": level, "count": count, "chunks": chunks})
+
+    target_paths: Dict[str, object] = {}
+    for t in targets:
+        auth, path = _target_path(tree, t)
+        target_paths[str(t)] = {"auth_path": auth, "path": path}
+
+    manifest: Dict[str, object] = {
+        "params": _params_dict(tree.params),
+        "pub_seed": _hex(tree.pub_seed),
+        "root": _hex(tree.root),
+        "chunk_nodes": chunk_nodes,
+        "levels": levels,
+        "targets": target_paths,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,124 @@
+# nodestore.py
+"""
+Array-backed file with every node of the XMSS Merkle tree, read through mmap.
+
+Format:
+ - magic 4B: b"XMSN"
+ - version u8
+ - n u16, h u16
+ - level 0 (2^h leaves) || level 1 (2^(h-1) nodes) || ... || level h (root)
+each node is n bytes, so node (height, index) sits at a fixed offset.
+"""
+from __future__ import annotations
+from dataclasses import replace
+import mmap
+import struct
+from typing import List, Tuple
+
+from params import XMSSParams
+from xmss import XMSSPrivateKey, XMSSPublicKey, xmss_keygen
+
+MAGIC = b"XMSN"
+VERSION = 1
+_HEADER = struct.Struct(">4sBHH")
+
+
+def node_store_size(n: int, h: int) -> int:
+    # 2^h + 2^(h-1) + ... + 1 = 2^(h+1) - 1 nodi.
+    return _HEADER.size + ((1 << (h + 1)) - 1) * n
+
+
+class MerkleNodeStore:
+    """Merkle nodes indexed by (height, index); writable only while being created."""
+
+    def __init__(self, path: str, writable: bool = False) -> None:
+        self.path = path
+        self._file = open(path, "r+b" if writable else "rb")
+        try:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=access)
+        except Exception:
+            self._file.close()
+            raise
+        magic, ver, n, h = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("Bad magic")
+        if ver != VERSION:
+            self.close()
+            raise ValueError("Unsupported version")
+        if len(self._mm) != node_store_size(n, h):
+            self.close()
+            raise ValueError("Node store has wrong size")
+        self.n = n
+        self.h = h
+
+    @classmethod
+    def create(cls, path: str, params: XMSSParams) -> "MerkleNodeStore":
+        """Create an empty (zero-filled) store for params and open it for writing."""
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, params.n, params.h))
+            f.truncate(node_store_size(params.n, params.h))
+        return cls(path, writable=True)
+
+    def __reduce__(self) -> Tuple[type, Tuple[str]]:
+        # Tra processi si passa solo il path: ogni processo rimappa lo stesso file.
+        return (MerkleNodeStore, (self.path,))
+
+    def _offset(self, height: int, index: int) -> int:
+        if not 0 <= height <= self.h or not 0 <= index < (1 << (self.h - height)):
+            raise IndexError("node (height, index) out of range")
+        # Nodi dei livelli sotto height: 2^(h+1) - 2^(h+1-height).
+        before = (1 << (self.h + 1)) - (1 << (self.h + 1 - height))
+        return _HEADER.size + (before + index) * self.n
+
+    def get(self, height: int, index: int) -> bytes:
+        off = self._offset(height, index)
+        return self._mm[off:off + self.n]
+
+    def put(self, height: int, index: int, node: bytes) -> None:
+        if len(node) != self.n:
+            raise ValueError("node length != n")
+        off = self._offset(height, index)
+        self._mm[off:off + self.n] = node
+
+    def root(self) -> bytes:
+        return self.get(self.h, 0)
+
+    def auth_path(self, i: int) -> List[bytes]:
+        """auth[j] = node(j, floor(i/2^j) XOR 1): h lookups, no hashing."""
+        return [self.get(j, (i >> j) ^ 1) for j in range(self.h)]
+
+    def flush(self) -> None:
+        self._mm.flush()
+
+    def close(self) -> None:
+        if not self._mm.closed:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "MerkleNodeStore":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def open_node_store(path: str, SK: XMSSPrivateKey) -> XMSSPrivateKey:
+    """Attach an existing store to SK (e.g. after load_private_key), checking it matches the key."""
+    store = MerkleNodeStore(path)
+    if store.n != SK.params.n or store.h != SK.params.h or store.root() != SK.root:
+        store.close()
+        raise ValueError("Node store does not match this key")
+    return replace(SK, node_store=store)
+
+
+def nodestore_keygen(params: XMSSParams, path: str) -> Tuple[XMSSPrivateKey, XMSSPublicKey]:
+    """xmss_keygen that writes every tree node to path; the returned SK signs from the store."""
+    store = MerkleNodeStore.create(path, params)
+    try:
+        SK, PK = xmss_keygen(params, on_node=store.put)
+        store.flush()
+    finally:
+        store.close()
+    return open_node_store(path, SK), PK
@@ -3,6 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 import math
 from utils import lg_w, ceil_div
+from hashfuncs import HASH_MODE_HMAC, HASH_MODES
 
 @dataclass(frozen=True)
 class XMSSParams:
@@ -11,10 +12,18 @@ class XMSSParams:
     n: bytes
     w: Winternitz parameter (4 or 16)
     h: Merkle tree height (2^h signatures)
+    hash_mode: "hmac" (HMAC-SHA256, default) or "rfc8391" (RFC 8391 SHA2 padding construction)
     """
     n: int = 32
     w: int = 16
     h: int = 10  # 1024 signatures by default (change for demo!)
+    hash_mode: str = HASH_MODE_HMAC
+
+    def __post_init__(self) -> None:
+        if self.hash_mode not in HASH_MODES:
+            raise ValueError(f"hash_mode must be one of {HASH_MODES}")
+        if self.hash_mode != HASH_MODE_HMAC and not 0 < self.n <= 32:
+            raise ValueError("rfc8391 hash mode (SHA-256) needs n <= 32")
 
     @property
     def len_1(self) -> int:
@@ -40,3 +49,41 @@ class XMSSParams:
     @property
     def max_signatures(self) -> int:
         return 1 << self.h
+
+@dataclass(frozen=True)
+class XMSSMTParams:
+    """
+    Parameter container for XMSS^MT (RFC 8391, Section 4.2.1).
+    h: total hypertree height (2^h signatures)
+    d: number of layers; every layer is made of XMSS trees of height h/d
+    """
+    n: int = 32
+    w: int = 16
+    h: int = 20
+    d: int = 2
+    hash_mode: str = HASH_MODE_HMAC
+
+    def __post_init__(self) -> None:
+        if self.d < 1 or self.h % self.d != 0:
+            raise ValueError("XMSS^MT: h must be a multiple of d (d >= 1)")
+        # Valida w e hash_mode tramite i parametri del singolo albero.
+        lg_w(self.w)
+        XMSSParams(n=self.n, w=self.w, h=self.tree_height, hash_mode=self.hash_mode)
+
+    @property
+    def tree_height(self) -> int:
+        return self.h // self.d
+
+    @property
+    def tree_params(self) -> XMSSParams:
+        """Parameters of one XMSS tree of the hypertree."""
+        return XMSSParams(n=self.n, w=self.w, h=self.tree_height, hash_mode=self.hash_mode)
+
+    @property
+    def idx_bytes(self) -> int:
+        # RFC 8391: idx_sig occupa ceil(h / 8) byte.
+        return ceil_div(self.h, 8)
+
+    @property
+    def max_signatures(self) -> int:
+        return 1 << self.h
@@ -0,0 +1,107 @@
+# precompute.py
+"""
+Signer that prepares the message-independent part of the next K signatures in
+the background: the auth path (build_auth) and the WOTS+ secret key of each
+upcoming index. At request time only H_msg, the WOTS+ chain walk and the
+signature serialization are left.
+"""
+from __future__ import annotations
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import replace
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from address import Address
+from xmss import XMSSPrivateKey, build_auth, gen_wots_sk, xmss_sign
+
+Prepared = Tuple[List[bytes], List[bytes]]
+
+
+def _prepare(job: Tuple[XMSSPrivateKey, int]) -> Prepared:
+    """Worker: (auth, wots_sk) per l'indice i."""
+    SK, i = job
+    return build_auth(SK, i, Address()), gen_wots_sk(SK, i)
+
+
+class PrecomputingSigner:
+    """
+    Wraps an XMSSPrivateKey and keeps up to `depth` upcoming indices prepared.
+
+    persist, if given, is called with the advanced private key before each
+    signature is returned (e.g. serialize.save_private_key), so the state on
+    disk never lags behind a released signature.
+    The background pool is a ProcessPoolExecutor with `workers` processes,
+    unless an executor is passed in.
+    """
+
+    def __init__(self, SK: XMSSPrivateKey, depth: int = 8, workers: Optional[int] = None,
+                 executor: Optional[Executor] = None,
+                 persist: Optional[Callable[[XMSSPrivateKey], None]] = None) -> None:
+        if depth < 1:
+            raise ValueError("depth must be >= 1")
+        self.depth = depth
+        self._sk = SK
+        # Ai worker va solo la parte statica della chiave (lo stato BDS vale per un solo idx).
+        self._job_sk = replace(SK, bds=None)
+        self._own_executor = executor is None
+        self._executor = executor if executor is not None else ProcessPoolExecutor(max_workers=workers)
+        self._persist = persist
+        self._pending: Dict[int, "Future[Prepared]"] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._fill()
+
+    @property
+    def sk(self) -> XMSSPrivateKey:
+        """Current private key (idx = next index to be used)."""
+        return self._sk
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of upcoming indices whose precomputation is already finished."""
+        return sum(1 for fut in self._pending.values() if fut.done())
+
+    @property
+    def scheduled(self) -> int:
+        """Number of upcoming indices submitted to the workers (finished or not)."""
+        return len(self._pending)
+
+    def _fill(self) -> None:
+        end = min(self._sk.idx + self.depth, self._sk.params.max_signatures)
+        for i in range(self._sk.idx, end):
+            if i not in self._pending:
+                self._pending[i] = self._executor.submit(_prepare, (self._job_sk, i))
+
+    def sign(self, M: bytes) -> bytes:
+        """Sign M with the next index; waits only if that index is not prepared yet."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("PrecomputingSigner is closed")
+            SK = self._sk
+            if SK.idx >= SK.params.max_signatures:
+                raise ValueError("XMSS: no signatures left for this key (idx exhausted)")
+
+            fut = self._pending.pop(SK.idx, None)
+            auth, wots_sk = fut.result() if fut is not None else _prepare((self._job_sk, SK.idx))
+            SK2, sig = xmss_sign(M, replace(SK, bds=None), auth, wots_sk)
+
+            if self._persist is not None:
+                self._persist(SK2)
+            self._sk = SK2
+            self._fill()
+            return sig
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            for fut in self._pending.values():
+                fut.cancel()
+            self._pending.clear()
+            if self._own_executor:
+                self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "PrecomputingSigner":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
@@ -1,60 +1,117 @@
 # serialize.py
 from __future__ import annotations
 from dataclasses import asdict
+import os
 import struct
-from params import XMSSParams
+from hashfuncs import HASH_MODE_HMAC, HASH_MODE_RFC
+from params import XMSSMTParams, XMSSParams
 from xmss import XMSSPrivateKey, XMSSPublicKey
+from xmss_mt import XMSSMTPrivateKey, XMSSMTPublicKey
 
 # Format:
 #  - magic 4B: b"XMSS"
 #  - version u8
 #  - n u16, w u16, h u16
+#  - (version >= 2) hash mode u8: 0 = hmac, 1 = rfc8391; version 1 files are hmac
 #  - for PK: root(n) || pub_seed(n)
 #  - for SK: idx u32 || sk_seed(n) || sk_prf(n) || root(n) || pub_seed(n)
+#
+# XMSS^MT format:
+#  - magic 4B: b"XMMT"
+#  - version u8
+#  - n u16, w u16, h u16, d u16, hash mode u8
+#  - for PK: root(n) || pub_seed(n)
+#  - for SK: idx u64 || sk_seed(n) || sk_prf(n) || root(n) || pub_seed(n)
 
 MAGIC = b"XMSS"
-VERSION = 1
+VERSION = 2
+_HASH_MODE_IDS = {HASH_MODE_HMAC: 0, HASH_MODE_RFC: 1}
+MT_MAGIC = b"XMMT"
+MT_VERSION = 1
 
-def save_public_key(path: str, pk: XMSSPublicKey) -> None:
-    p = pk.params
-    header = MAGIC + struct.pack(">BHHH", VERSION, p.n, p.w, p.h)
-    body = pk.root + pk.pub_seed
-    with open(path, "wb") as f:
-        f.write(header + body)
+def _hash_mode_from_id(mode_id: int) -> str:
+    for mode, ident in _HASH_MODE_IDS.items():
+        if ident == mode_id:
+            return mode
+    raise ValueError("Unknown hash mode")
 
-def load_public_key(path: str) -> XMSSPublicKey:
-    with open(path, "rb") as f:
-        data = f.read()
+def _pack_header(p: XMSSParams) -> bytes:
+    return MAGIC + struct.pack(">BHHHB", VERSION, p.n, p.w, p.h, _HASH_MODE_IDS[p.hash_mode])
+
+def _unpack_header(data: bytes) -> tuple[XMSSParams, int]:
+    """Ritorna (params, offset del body); accetta anche i file versione 1 (hmac)."""
     if data[:4] != MAGIC:
         raise ValueError("Bad magic")
     ver, n, w, h = struct.unpack(">BHHH", data[4:11])
+    if ver == 1:
+        return XMSSParams(n=n, w=w, h=h), 11
     if ver != VERSION:
         raise ValueError("Unsupported version")
-    params = XMSSParams(n=n, w=w, h=h)
-    off = 11
+    if len(data) < 12:
+        raise ValueError("Truncated header")
+    return XMSSParams(n=n, w=w, h=h, hash_mode=_hash_mode_from_id(data[11])), 12
+
+def public_key_to_bytes(pk: XMSSPublicKey) -> bytes:
+    return _pack_header(pk.params) + pk.root + pk.pub_seed
+
+def public_key_from_bytes(data: bytes) -> XMSSPublicKey:
+    params, off = _unpack_header(data)
+    n = params.n
     root = data[off:off+n]; off += n
     pub_seed = data[off:off+n]; off += n
     if off != len(data):
         raise ValueError("Trailing bytes")
     return XMSSPublicKey(root=root, pub_seed=pub_seed, params=params)
 
-def save_private_key(path: str, sk: XMSSPrivateKey) -> None:
-    p = sk.params
-    header = MAGIC + struct.pack(">BHHH", VERSION, p.n, p.w, p.h)
+def save_public_key(path: str, pk: XMSSPublicKey) -> None:
+    with open(path, "wb") as f:
+        f.write(public_key_to_bytes(pk))
+
+def load_public_key(path: str) -> XMSSPublicKey:
+    with open(path, "rb") as f:
+        return public_key_from_bytes(f.read())
+
+def private_key_to_bytes(sk: XMSSPrivateKey) -> bytes:
+    header = _pack_header(sk.params)
     body = struct.pack(">I", sk.idx) + sk.sk_seed + sk.sk_prf + sk.root + sk.pub_seed
+    return header + body
+
+def save_private_key(path: str, sk: XMSSPrivateKey) -> None:
     with open(path, "wb") as f:
-        f.write(header + body)
+        f.write(private_key_to_bytes(sk))
+
+def fsync_dir(path: str) -> None:
+    """fsync della directory che contiene path (rende durevole un rename)."""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # es. Windows: directory non apribile
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_file_atomic(path: str, data: bytes) -> None:
+    """Scrive un file temporaneo, fsync, poi rename atomico su path."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(path)
+
+def save_private_key_atomic(path: str, sk: XMSSPrivateKey) -> None:
+    """Like save_private_key, but durable and never leaves a half-written sk.bin."""
+    write_file_atomic(path, private_key_to_bytes(sk))
 
 def load_private_key(path: str) -> XMSSPrivateKey:
     with open(path, "rb") as f:
-        data = f.read()
-    if data[:4] != MAGIC:
-        raise ValueError("Bad magic")
-    ver, n, w, h = struct.unpack(">BHHH", data[4:11])
-    if ver != VERSION:
-        raise ValueError("Unsupported version")
-    params = XMSSParams(n=n, w=w, h=h)
-    off = 11
+        return private_key_from_bytes(f.read())
+
+def private_key_from_bytes(data: bytes) -> XMSSPrivateKey:
+    params, off = _unpack_header(data)
+    n = params.n
     idx = struct.unpack(">I", data[off:off+4])[0]; off += 4
     sk_seed = data[off:off+n]; off += n
     sk_prf  = data[off:off+n]; off += n
@@ -63,3 +120,51 @@ def load_private_key(path: str) -> XMSSPrivateKey:
     if off != len(data):
         raise ValueError("Trailing bytes")
     return XMSSPrivateKey(idx=idx, sk_seed=sk_seed, sk_prf=sk_prf, root=root, pub_seed=pub_seed, params=params)
+
+def _pack_mt_header(p: XMSSMTParams) -> bytes:
+    return MT_MAGIC + struct.pack(">BHHHHB", MT_VERSION, p.n, p.w, p.h, p.d, _HASH_MODE_IDS[p.hash_mode])
+
+def _unpack_mt_header(data: bytes) -> tuple[XMSSMTParams, int]:
+    if data[:4] != MT_MAGIC:
+        raise ValueError("Bad magic")
+    if len(data) < 14:
+        raise ValueError("Truncated header")
+    ver, n, w, h, d, mode_id = struct.unpack(">BHHHHB", data[4:14])
+    if ver != MT_VERSION:
+        raise ValueError("Unsupported version")
+    return XMSSMTParams(n=n, w=w, h=h, d=d, hash_mode=_hash_mode_from_id(mode_id)), 14
+
+def save_mt_public_key(path: str, pk: XMSSMTPublicKey) -> None:
+    with open(path, "wb") as f:
+        f.write(_pack_mt_header(pk.params) + pk.root + pk.pub_seed)
+
+def load_mt_public_key(path: str) -> XMSSMTPublicKey:
+    with open(path, "rb") as f:
+        data = f.read()
+    params, off = _unpack_mt_header(data)
+    n = params.n
+    root = data[off:off+n]; off += n
+    pub_seed = data[off:off+n]; off += n
+    if off != len(data):
+        raise ValueError("Trailing bytes")
+    return XMSSMTPublicKey(root=root, pub_seed=pub_seed, params=params)
+
+def save_mt_private_key(path: str, sk: XMSSMTPrivateKey) -> None:
+    # Gli alberi correnti (sk.layers) non vengono salvati: xmssmt_sign li ricostruisce.
+    body = struct.pack(">Q", sk.idx) + sk.sk_seed + sk.sk_prf + sk.root + sk.pub_seed
+    with open(path, "wb") as f:
+        f.write(_pack_mt_header(sk.params) + body)
+
+def load_mt_private_key(path: str) -> XMSSMTPrivateKey:
+    with open(path, "rb") as f:
+        data = f.read()
+    params, off = _unpack_mt_header(data)
+    n = params.n
+    idx = struct.unpack(">Q", data[off:off+8])[0]; off += 8
+    sk_seed = data[off:off+n]; off += n
+    sk_prf  = data[off:off+n]; off += n
+    root    = data[off:off+n]; off += n
+    pub_seed= data[off:off+n]; off += n
+    if off != len(data):
+        raise ValueError("Trailing bytes")
+    return XMSSMTPrivateKey(idx=idx, sk_seed=sk_seed, sk_prf=sk_prf, root=root, pub_seed=pub_seed, params=params)
@@ -0,0 +1,223 @@
+# shards.py
+"""
+Distributed keygen: the tree is cut at height h - split into 2^split subtrees;
+each job computes the roots of a range of them from the same inputs treehash
+uses (sk_seed, pub_seed, params) and writes a small result file. merge_shards
+validates the results and combines the roots with rand_hash into the root.
+
+Plan file: the seeds in the sk.bin format (root all zeros); it goes to every
+job and must be protected like sk.bin.
+Result file:
+  magic "XMSR" || version u8 || split u8 || first u32 || count u32 ||
+  count x root (n) || HMAC-SHA256(key = SHA-256(plan file), previous bytes)
+The MAC ties a result to its plan: results of another key or run, or damaged
+files, are rejected at merge time.
+
+    python shards.py init plan.bin --h 16 [--node-store nodes.bin]
+    python shards.py run plan.bin --split 4 --first 0 --count 8 --out shard-0.bin
+    python shards.py merge plan.bin shard-*.bin --sk sk.bin --pk pk.bin
+
+merge refuses to replace an existing sk.bin (it may already have signed and
+the merged key starts at idx 0) unless --force is given.
+"""
+from __future__ import annotations
+import argparse
+from dataclasses import dataclass, replace
+import hmac
+import os
+import struct
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from address import Address
+from hashfuncs import HASH_MODES, hmac_sha256, sha256
+from leafengine import ENGINE_PYTHON, ENGINES
+from nodestore import MerkleNodeStore
+from params import XMSSParams
+from serialize import (load_private_key, private_key_to_bytes, save_private_key_atomic,
+                       save_public_key, write_file_atomic)
+from xmss import (NodeCallback, XMSSPrivateKey, XMSSPublicKey, merge_subtree_roots, treehash,
+                  treehash_parallel)
+
+MAGIC = b"XMSR"
+VERSION = 1
+_HEAD = struct.Struct(">4sBBII")
+_MAC_SIZE = 32
+
+
+@dataclass
+class ShardResult:
+    """Roots of subtrees first .. first+len(roots)-1 of height h - split."""
+    split: int
+    first: int
+    roots: List[bytes]
+
+
+def new_plan(params: XMSSParams) -> XMSSPrivateKey:
+    """Fresh seeds for a sharded keygen (root still unknown: all zeros)."""
+    n = params.n
+    return XMSSPrivateKey(idx=0, sk_seed=os.urandom(n), sk_prf=os.urandom(n), root=b"\x00" * n,
+                          pub_seed=os.urandom(n), params=params)
+
+
+def _check_range(params: XMSSParams, split: int, first: int, count: int) -> None:
+    if not 0 <= split <= params.h:
+        raise ValueError("split must be in [0, h]")
+    if count < 1 or first < 0 or first + count > (1 << split):
+        raise ValueError("subtree range outside [0, 2^split)")
+
+
+def compute_shard(plan: XMSSPrivateKey, split: int, first: int, count: int, engine: str = ENGINE_PYTHON,
+                  workers: int = 1, on_node: Optional[NodeCallback] = None) -> ShardResult:
+    """
+    Roots of subtrees first .. first+count-1 (height h - split). on_node sees
+    every node of those subtrees (e.g. MerkleNodeStore.put of a shared store).
+    """
+    _check_range(plan.params, split, first, count)
+    t = plan.params.h - split
+    roots: List[bytes] = []
+    for j in range(first, first + count):
+        if workers != 1:
+            roots.append(treehash_parallel(plan, j << t, t, Address(), workers, on_node=on_node, engine=engine))
+        else:
+            roots.append(treehash(plan, j << t, t, Address(), on_node, engine))
+    return ShardResult(split=split, first=first, roots=roots)
+
+
+def _mac(plan: XMSSPrivateKey, body: bytes) -> bytes:
+    return hmac_sha256(sha256(private_key_to_bytes(replace(plan, idx=0, root=b"\x00" * plan.params.n))), body)
+
+
+def encode_shard(plan: XMSSPrivateKey, result: ShardResult) -> bytes:
+    body = _HEAD.pack(MAGIC, VERSION, result.split, result.first, len(result.roots)) + b"".join(result.roots)
+    return body + _mac(plan, body)
+
+
+def decode_shard(plan: XMSSPrivateKey, data: bytes) -> ShardResult:
+    """Parse and authenticate a result file; ValueError if it does not belong to plan."""
+    if len(data) < _HEAD.size + _MAC_SIZE:
+        raise ValueError("Truncated shard result")
+    body, mac = data[:-_MAC_SIZE], data[-_MAC_SIZE:]
+    if not hmac.compare_digest(_mac(plan, body), mac):
+        raise ValueError("Shard result MAC mismatch (other key, or damaged file)")
+    magic, version, split, first, count = _HEAD.unpack_from(body)
+    if magic != MAGIC:
+        raise ValueError("Bad magic")
+    if version != VERSION:
+        raise ValueError("Unsupported version")
+    n = plan.params.n
+    if len(body) != _HEAD.size + count * n:
+        raise ValueError("Shard result has wrong size")
+    _check_range(plan.params, split, first, count)
+    roots = [body[_HEAD.size + k * n:_HEAD.size + (k + 1) * n] for k in range(count)]
+    return ShardResult(split=split, first=first, roots=roots)
+
+
+def save_shard(path: str, plan: XMSSPrivateKey, result: ShardResult) -> None:
+    write_file_atomic(path, encode_shard(plan, result))
+
+
+def load_shard(path: str, plan: XMSSPrivateKey) -> ShardResult:
+    with open(path, "rb") as f:
+        return decode_shard(plan, f.read())
+
+
+def merge_shards(plan: XMSSPrivateKey, results: Iterable[ShardResult],
+                 on_node: Optional[NodeCallback] = None) -> Tuple[XMSSPrivateKey, XMSSPublicKey]:
+    """
+    Combine the subtree roots of all results into the key. Every subtree must
+    be present (a repeated job is fine if it agrees). on_node sees the nodes of
+    the top split + 1 levels (subtree roots up to the root).
+    """
+    params = plan.params
+    split: Optional[int] = None
+    roots: Dict[int, bytes] = {}
+    for res in results:
+        if split is None:
+            split = res.split
+        elif res.split != split:
+            raise ValueError("Shard results use different split heights")
+        for k, root in enumerate(res.roots):
+            j = res.first + k
+            if roots.setdefault(j, root) != root:
+                raise ValueError(f"Conflicting results for subtree {j}")
+    if split is None:
+        raise ValueError("No shard results")
+    missing = [j for j in range(1 << split) if j not in roots]
+    if missing:
+        raise ValueError(f"Missing subtrees: {missing[:16]}{' ...' if len(missing) > 16 else ''}")
+
+    t = params.h - split
+    level = [roots[j] for j in range(1 << split)]
+    if on_node is not None:
+        for j, node in enumerate(level):
+            on_node(t, j, node)
+    root = merge_subtree_roots(plan, level, 0, t, Address(), on_node)
+    SK = replace(plan, idx=0, root=root)
+    return SK, XMSSPublicKey(root=root, pub_seed=plan.pub_seed, params=params)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Keygen XMSS distribuita a shard")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p_init = sub.add_parser("init", help="crea il file di piano (seed)")
+    p_init.add_argument("plan")
+    p_init.add_argument("--n", type=int, default=32)
+    p_init.add_argument("--w", type=int, default=16)
+    p_init.add_argument("--h", type=int, default=10)
+    p_init.add_argument("--hash-mode", choices=HASH_MODES, default=HASH_MODES[0])
+    p_init.add_argument("--node-store", default=None, help="crea anche un node store vuoto")
+
+    p_run = sub.add_parser("run", help="calcola le radici di un intervallo di sottoalberi")
+    p_run.add_argument("plan")
+    p_run.add_argument("--split", type=int, required=True)
+    p_run.add_argument("--first", type=int, required=True)
+    p_run.add_argument("--count", type=int, default=1)
+    p_run.add_argument("--out", required=True)
+    p_run.add_argument("--engine", choices=ENGINES, default=ENGINE_PYTHON)
+    p_run.add_argument("--workers", type=int, default=1)
+    p_run.add_argument("--node-store", default=None, help="node store condiviso in cui scrivere i sottoalberi")
+
+    p_merge = sub.add_parser("merge", help="valida i risultati e calcola la chiave")
+    p_merge.add_argument("plan")
+    p_merge.add_argument("shards", nargs="+")
+    p_merge.add_argument("--sk", required=True)
+    p_merge.add_argument("--pk", required=True)
+    p_merge.add_argument("--node-store", default=None, help="scrive i livelli alti nel node store")
+    p_merge.add_argument("--force", action="store_true",
+                         help="sovrascrive --sk esistente (la chiave riparte da idx 0!)")
+
+    args = ap.parse_args(argv)
+    if args.cmd == "init":
+        params = XMSSParams(n=args.n, w=args.w, h=args.h, hash_mode=args.hash_mode)
+        save_private_key_atomic(args.plan, new_plan(params))
+        if args.node_store:
+            MerkleNodeStore.create(args.node_store, params).close()
+        return 0
+
+    # Una sk.bin esistente può aver già firmato: riscriverla con idx 0 riuserebbe le foglie.
+    if args.cmd == "merge" and os.path.exists(args.sk) and not args.force:
+        raise FileExistsError(args.sk)
+    plan = load_private_key(args.plan)
+    store = MerkleNodeStore(args.node_store, writable=True) if args.node_store else None
+    try:
+        put = store.put if store is not None else None
+        if args.cmd == "run":
+            result = compute_shard(plan, args.split, args.first, args.count, args.engine, args.workers, put)
+            save_shard(args.out, plan, result)
+        else:
+            SK, PK = merge_shards(plan, (load_shard(path, plan) for path in args.shards), put)
+            save_private_key_atomic(args.sk, SK)
+            save_public_key(args.pk, PK)
+            print(f"root {PK.root.hex()}")
+        if store is not None:
+            store.flush()
+    finally:
+        if store is not None:
+            store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# signature.py
+"""
+XMSS signature codec (RFC 8391, Section 4.1.8):
+  idx_sig(4) || r(n) || sig_ots(len*n) || auth(h*n)
+
+XMSSSignature wraps a memoryview of the encoded signature: idx, r,
+sig_ots[i] and auth[k] are slices of that buffer, nothing is copied.
+encode_signature / write_signature build the encoding in one allocation or
+directly into a caller's buffer.
+"""
+from __future__ import annotations
+from typing import Iterator, Sequence, Union
+
+from params import XMSSParams
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def signature_size(params: XMSSParams) -> int:
+    return 4 + (1 + params.length + params.h) * params.n
+
+
+class Blocks(Sequence[memoryview]):
+    """Read-only sequence of `count` consecutive n-byte blocks of a buffer."""
+    __slots__ = ("_buf", "_off", "_count", "_n")
+
+    def __init__(self, buf: memoryview, off: int, count: int, n: int) -> None:
+        self._buf = buf
+        self._off = off
+        self._count = count
+        self._n = n
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> memoryview:
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("block index out of range")
+        start = self._off + i * self._n
+        return self._buf[start:start + self._n]
+
+    def __iter__(self) -> Iterator[memoryview]:
+        n = self._n
+        for start in range(self._off, self._off + self._count * n, n):
+            yield self._buf[start:start + n]
+
+
+class XMSSSignature:
+    """Parsed view of an encoded XMSS signature; raises ValueError on a wrong length."""
+    __slots__ = ("params", "_buf")
+
+    def __init__(self, data: Buffer, params: XMSSParams) -> None:
+        buf = memoryview(data)
+        if buf.ndim != 1 or buf.itemsize != 1:
+            buf = buf.cast("B")
+        if len(buf) != signature_size(params):
+            raise ValueError("XMSS signature: invalid length")
+        self.params = params
+        self._buf = buf
+
+    @property
+    def idx(self) -> int:
+        return int.from_bytes(self._buf[:4], "big")
+
+    @property
+    def r(self) -> memoryview:
+        return self._buf[4:4 + self.params.n]
+
+    @property
+    def sig_ots(self) -> Blocks:
+        p = self.params
+        return Blocks(self._buf, 4 + p.n, p.length, p.n)
+
+    @property
+    def auth(self) -> Blocks:
+        p = self.params
+        return Blocks(self._buf, 4 + (1 + p.length) * p.n, p.h, p.n)
+
+    def __len__(self) -> int:
+        return len(self._buf)
+
+    def __bytes__(self) -> bytes:
+        return self._buf.tobytes()
+
+    def to_bytes(self) -> bytes:
+        return self._buf.tobytes()
+
+
+def encode_signature(idx_sig: int, r: bytes, sig_ots: Sequence[bytes], auth: Sequence[bytes]) -> bytes:
+    """idx_sig(4) || r || sig_ots || auth, joined in one allocation."""
+    return b"".join([idx_sig.to_bytes(4, "big"), r, *sig_ots, *auth])
+
+
+def write_signature(buffer: Union[bytearray, memoryview], params: XMSSParams, idx_sig: int, r: bytes,
+                    sig_ots: Sequence[bytes], auth: Sequence[bytes], offset: int = 0) -> XMSSSignature:
+    """Encode the signature into buffer[offset:offset + signature_size] and return a view of it."""
+    n = params.n
+    size = signature_size(params)
+    out = memoryview(buffer)[offset:offset + size]
+    if len(out) != size:
+        raise ValueError("XMSS signature: buffer too small")
+    if len(sig_ots) != params.length or len(auth) != params.h:
+        raise ValueError("XMSS signature: wrong number of blocks")
+    out[:4] = idx_sig.to_bytes(4, "big")
+    pos = 4
+    for block in (r, *sig_ots, *auth):
+        out[pos:pos + n] = block
+        pos += n
+    return XMSSSignature(out, params)
@@ -0,0 +1,169 @@
+# statestore.py
+"""
+Crash-safe private-key state with index reservation.
+
+The key is stored once in the serialize.py format (path) and the index state
+in an append-only journal (path + ".journal"). Before an index is used, a
+whole block of `reserve` indices is reserved with a single fsync'd journal
+record, so one fsync covers many signatures.
+
+Journal record (13 bytes): kind u8 || value u64 || crc32 u32
+  kind 1 = reserve: indices < value may have been used
+  kind 2 = release: clean shutdown, value is the exact next unused index
+Recovery takes the value of the last record: a torn (partial) record at the
+end was never fsync'd, so no index beyond the previous record was handed out.
+A full-size record that fails its CRC is corruption, not a torn write: the
+journal is refused, since dropping it and the records after it could move the
+index backwards.
+After a crash the key restarts after the whole reserved block: indices may be
+skipped, never reused.
+"""
+from __future__ import annotations
+from dataclasses import replace
+import os
+import struct
+import threading
+import zlib
+from typing import Optional, Tuple
+
+from serialize import load_private_key, save_private_key_atomic
+from xmss import XMSSPrivateKey, xmss_sign
+
+_RECORD = struct.Struct(">BQ")
+_CRC = struct.Struct(">I")
+RECORD_SIZE = _RECORD.size + _CRC.size
+KIND_RESERVE = 1
+KIND_RELEASE = 2
+
+
+def _pack_record(kind: int, value: int) -> bytes:
+    body = _RECORD.pack(kind, value)
+    return body + _CRC.pack(zlib.crc32(body))
+
+
+def read_journal(journal_path: str) -> Tuple[Optional[int], int]:
+    """
+    Return (value of the last record or None, byte length of the complete
+    records). Only a partial record at the end is left out; ValueError if a
+    complete record is damaged.
+    """
+    try:
+        with open(journal_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None, 0
+    value: Optional[int] = None
+    valid = 0
+    for off in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        body = data[off:off + _RECORD.size]
+        (crc,) = _CRC.unpack_from(data, off + _RECORD.size)
+        kind, v = _RECORD.unpack(body)
+        if zlib.crc32(body) != crc or kind not in (KIND_RESERVE, KIND_RELEASE):
+            raise ValueError(f"{journal_path}: damaged journal record at offset {off}")
+        value = v
+        valid = off + RECORD_SIZE
+    return value, valid
+
+
+class KeyStateStore:
+    """
+    Private key whose index is made durable in reserved blocks.
+    Use create() for a new key and open() to recover an existing one.
+    compact_every: after this many journal records the key file is rewritten
+    with the current high-water mark and the journal is emptied.
+    """
+
+    def __init__(self, path: str, SK: XMSSPrivateKey, reserved_until: int, journal_size: int,
+                 reserve: int = 64, compact_every: int = 1024) -> None:
+        if reserve < 1:
+            raise ValueError("reserve must be >= 1")
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.reserve = reserve
+        self.compact_every = compact_every
+        self._sk = SK
+        self._reserved_until = reserved_until
+        self._lock = threading.Lock()
+        # Riapre il journal troncando l'eventuale record parziale in coda.
+        self._journal = open(self.journal_path, "ab+")
+        self._journal.truncate(journal_size)
+        self._records = journal_size // RECORD_SIZE
+
+    @classmethod
+    def create(cls, path: str, SK: XMSSPrivateKey, reserve: int = 64, compact_every: int = 1024) -> "KeyStateStore":
+        """Start a new store; refuses to overwrite an existing key or journal."""
+        for p in (path, path + ".journal"):
+            if os.path.exists(p):
+                raise FileExistsError(p)
+        save_private_key_atomic(path, SK)
+        return cls(path, SK, SK.idx, 0, reserve, compact_every)
+
+    @classmethod
+    def open(cls, path: str, reserve: int = 64, compact_every: int = 1024) -> "KeyStateStore":
+        SK = load_private_key(path)
+        value, valid = read_journal(path + ".journal")
+        idx = SK.idx if value is None else max(SK.idx, value)
+        return cls(path, replace(SK, idx=idx), idx, valid, reserve, compact_every)
+
+    @property
+    def sk(self) -> XMSSPrivateKey:
+        """Private key at the next index to use (not yet reserved, possibly)."""
+        return self._sk
+
+    @sk.setter
+    def sk(self, SK: XMSSPrivateKey) -> None:
+        # Permette di agganciare stato BDS / node store, non di cambiare idx.
+        if SK.idx != self._sk.idx or SK.root != self._sk.root:
+            raise ValueError("KeyStateStore: replacement key must have the same root and idx")
+        self._sk = SK
+
+    @property
+    def reserved_until(self) -> int:
+        return self._reserved_until
+
+    def _append(self, kind: int, value: int) -> None:
+        self._journal.write(_pack_record(kind, value))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._records += 1
+
+    def _compact(self) -> None:
+        # Prima il file chiave con l'high-water mark (atomico), poi si svuota il journal.
+        save_private_key_atomic(self.path, replace(self._sk, idx=self._reserved_until))
+        self._journal.truncate(0)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._records = 0
+
+    def _ensure_reserved(self) -> None:
+        if self._sk.idx < self._reserved_until:
+            return
+        if self._records >= self.compact_every:
+            self._compact()
+        limit = self._sk.params.max_signatures
+        self._reserved_until = min(self._sk.idx + self.reserve, limit)
+        self._append(KIND_RESERVE, self._reserved_until)
+
+    def sign(self, M: bytes) -> bytes:
+        """Sign M with the next index; fsyncs only when a new block must be reserved."""
+        with self._lock:
+            if self._sk.idx >= self._sk.params.max_signatures:
+                raise ValueError("XMSS: no signatures left for this key (idx exhausted)")
+            self._ensure_reserved()
+            self._sk, sig = xmss_sign(M, self._sk)
+            return sig
+
+    def close(self) -> None:
+        """Clean shutdown: record the exact next index so unused reserved ones are kept."""
+        with self._lock:
+            if self._journal.closed:
+                return
+            if self._sk.idx < self._reserved_until:
+                self._append(KIND_RELEASE, self._sk.idx)
+            self._journal.close()
+
+    def __enter__(self) -> "KeyStateStore":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
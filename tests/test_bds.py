@@ -0,0 +1,40 @@
+# test_bds.py
+import os
+import sys
+from dataclasses import replace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from address import Address
+from bds import bds_keygen, bds_state_init
+from params import XMSSParams
+from xmss import build_auth, xmss_sign, xmss_verify
+
+
+def test_bds_signatures_match_build_auth_for_every_idx():
+    params = XMSSParams(n=16, w=16, h=4)
+    SK, PK = bds_keygen(params)
+    plain = replace(SK, bds=None)
+    for i in range(params.max_signatures):
+        assert SK.bds.idx == i
+        assert SK.bds.auth == build_auth(plain, i, Address())
+        M = b"m%d" % i
+        SK, sig = xmss_sign(M, SK)
+        _, ref = xmss_sign(M, replace(plain, idx=i))
+        assert sig == ref and xmss_verify(sig, M, PK)
+    assert SK.idx == params.max_signatures
+
+
+def test_bds_state_restored_mid_key():
+    params = XMSSParams(n=16, w=4, h=4)
+    SK, PK = bds_keygen(params)
+    plain = replace(SK, bds=None)
+    for start in (1, 5, 8, 15):
+        # Come dopo load_private_key: stato ricostruito a partire da idx = start.
+        key = replace(plain, idx=start)
+        key = replace(key, bds=bds_state_init(key))
+        for i in range(start, params.max_signatures):
+            M = b"r%d" % i
+            key, sig = xmss_sign(M, key)
+            _, ref = xmss_sign(M, replace(plain, idx=i))
+            assert sig == ref
@@ -0,0 +1,44 @@
+# test_leafengine.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("numpy")
+
+from address import Address
+from hashfuncs import HASH_MODES
+from leafengine import ENGINE_NUMPY, ENGINE_PYTHON, gen_leaves
+from params import XMSSParams
+from xmss import XMSSPrivateKey, gen_leaf, treehash
+
+
+def _key(params):
+    n = params.n
+    return XMSSPrivateKey(idx=0, sk_seed=bytes(range(n)), sk_prf=bytes(n), root=bytes(n),
+                          pub_seed=bytes(range(100, 100 + n)), params=params)
+
+
+@pytest.mark.parametrize("mode", HASH_MODES)
+@pytest.mark.parametrize("n,w", [(16, 16), (32, 4), (32, 16)])
+def test_numpy_leaves_and_root_match_python(mode, n, w):
+    params = XMSSParams(n=n, w=w, h=3, hash_mode=mode)
+    SK = _key(params)
+    leaves = gen_leaves(SK.sk_seed, SK.pub_seed, params, 0, 1 << params.h, Address())
+    assert leaves == [gen_leaf(SK, i, Address()) for i in range(1 << params.h)]
+    assert treehash(SK, 0, params.h, Address(), engine=ENGINE_NUMPY) == \
+        treehash(SK, 0, params.h, Address(), engine=ENGINE_PYTHON)
+
+
+@pytest.mark.parametrize("mode", HASH_MODES)
+def test_numpy_chain_checkpoints_match_python(mode):
+    params = XMSSParams(n=32, w=16, h=2, hash_mode=mode)
+    SK = _key(params)
+    got = {ENGINE_PYTHON: {}, ENGINE_NUMPY: {}}
+    for engine, out in got.items():
+        treehash(SK, 0, params.h, Address(), engine=engine, chain_points=(4, 8, 12),
+                 on_chains=lambda leaf, values, out=out: out.__setitem__(leaf, values))
+    assert got[ENGINE_NUMPY] == got[ENGINE_PYTHON]
+    assert len(got[ENGINE_PYTHON]) == 1 << params.h
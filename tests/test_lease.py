@@ -0,0 +1,57 @@
+# test_lease.py
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lease
+from lease import LeasedSigner, _read_free
+from params import XMSSParams
+from serialize import load_private_key, save_private_key
+from xmss import xmss_keygen
+
+pytestmark = pytest.mark.skipif(lease.fcntl is None, reason="lease.py needs fcntl")
+
+H = 4
+
+
+def _sign_some(args):
+    path, size, count = args
+    used = []
+    with LeasedSigner(path, size=size) as signer:
+        for j in range(count):
+            sig = signer.sign(b"m%d" % j)
+            used.append(int.from_bytes(sig[:4], "big"))
+    return used
+
+
+def _available(path):
+    """Indici ancora assegnabili: free list + [idx del file, 2^h)."""
+    free = {i for s, e in _read_free(path) for i in range(s, e)}
+    return free | set(range(load_private_key(path).idx, 1 << H))
+
+
+def test_concurrent_leases_are_disjoint_and_nothing_is_lost(tmp_path):
+    path = str(tmp_path / "sk.bin")
+    save_private_key(path, xmss_keygen(XMSSParams(n=16, w=16, h=H))[0])
+
+    # Lease di 3 indici, se ne usano 2 o 1: il resto torna indietro al close.
+    jobs = [(path, 3, 2), (path, 3, 1), (path, 3, 2), (path, 3, 1)]
+    with multiprocessing.get_context("fork").Pool(len(jobs)) as pool:
+        results = pool.map(_sign_some, jobs)
+    used = [i for r in results for i in r]
+    assert len(used) == len(set(used)) == 6
+
+    available = _available(path)
+    assert not available & set(used)
+    assert available | set(used) == set(range(1 << H))
+
+    # Riapertura: i nuovi indici vengono da quelli restituiti, mai da quelli usati.
+    more = _sign_some((path, 4, 6))
+    assert len(set(more)) == 6 and not set(more) & set(used)
+    available = _available(path)
+    assert available | set(used) | set(more) == set(range(1 << H))
+    assert len(available) == (1 << H) - 12
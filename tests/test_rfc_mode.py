@@ -0,0 +1,75 @@
+# test_rfc_mode.py
+import hashlib
+import os
+import struct
+import sys
+from dataclasses import replace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from address import Address
+from hashfuncs import HASH_MODE_HMAC, HASH_MODE_RFC, F, H, H_msg, PRF
+from params import XMSSParams
+from serialize import (private_key_from_bytes, private_key_to_bytes, public_key_from_bytes,
+                       public_key_to_bytes)
+from xmss import XMSSPrivateKey, XMSSPublicKey, treehash, xmss_sign, xmss_verify
+
+KEY = bytes(range(32))
+X = bytes(range(32, 64))
+X2 = bytes(range(64, 128))
+KEY3 = bytes(range(96))
+ADRS = bytes(range(100, 132))
+MSG = b"RFC 8391 known-answer test"
+
+
+def _rfc(pad, key, data, n=32):
+    # RFC 8391, Section 5.1: SHA2-256(toByte(pad, n) || KEY || M), troncato a n byte.
+    return hashlib.sha256(pad.to_bytes(n, "big") + key + data).digest()[:n]
+
+
+def test_known_answers():
+    assert F(KEY, X, 32, HASH_MODE_RFC).hex() == \
+        "dc7a48014fc1fac8b52af39bc7ea5cafafabf8bb81fb8f880fdf3b4a4566795c"
+    assert H(KEY, X2, 32, HASH_MODE_RFC).hex() == \
+        "59167f649bd8cc7a6ccc4f8cf79187505a4cbae2b0900b893fc8c5a434c4ce98"
+    assert H_msg(KEY3, MSG, 32, HASH_MODE_RFC).hex() == \
+        "df7f7c317283374ae2c905bd82e2f36212a209a667493f97a56f5293cf4bfb3d"
+    assert PRF(KEY, ADRS, 32, HASH_MODE_RFC).hex() == \
+        "7899d1908dd48b39aadff5627d912a637c9333d644d7f087ec843d1f76f57d39"
+
+
+def test_matches_rfc_definitions():
+    assert F(KEY, X, 32, HASH_MODE_RFC) == _rfc(0, KEY, X)
+    assert H(KEY, X2, 32, HASH_MODE_RFC) == _rfc(1, KEY, X2)
+    assert H_msg(KEY3, MSG, 32, HASH_MODE_RFC) == _rfc(2, KEY3, MSG)
+    assert PRF(KEY, ADRS, 32, HASH_MODE_RFC) == _rfc(3, KEY, ADRS)
+    assert F(KEY[:16], X[:16], 16, HASH_MODE_RFC) == _rfc(0, KEY[:16], X[:16], 16)
+
+
+def test_fixed_key_signature():
+    params = XMSSParams(n=32, w=16, h=2, hash_mode=HASH_MODE_RFC)
+    SK = XMSSPrivateKey(idx=1, sk_seed=bytes(32), sk_prf=bytes([1]) * 32, root=bytes(32),
+                        pub_seed=bytes([2]) * 32, params=params)
+    SK = replace(SK, root=treehash(SK, 0, params.h, Address()))
+    assert SK.root.hex() == "4aaa9f4d75865d3c4e784c63184f3512390857d5a561fc41a8a8fc328957d4d2"
+    _, sig = xmss_sign(b"abc", SK)
+    assert hashlib.sha256(sig).hexdigest() == \
+        "926eb4da908d4fd1978abf897c93fe4f9ea32d344d6c1c24fedd14406858b40b"
+    PK = public_key_from_bytes(public_key_to_bytes(XMSSPublicKey(SK.root, SK.pub_seed, params)))
+    assert xmss_verify(sig, b"abc", PK)
+    assert not xmss_verify(sig, b"abc", replace(PK, params=replace(params, hash_mode=HASH_MODE_HMAC)))
+
+
+def test_v1_files_load_as_hmac_and_resave_as_v2():
+    n, w, h = 16, 16, 4
+    root, pub_seed, sk_seed, sk_prf = (bytes([b]) * n for b in (1, 2, 3, 4))
+    v1 = b"XMSS" + struct.pack(">BHHH", 1, n, w, h)
+    pk = public_key_from_bytes(v1 + root + pub_seed)
+    sk = private_key_from_bytes(v1 + struct.pack(">I", 7) + sk_seed + sk_prf + root + pub_seed)
+    assert pk.params == sk.params == XMSSParams(n=n, w=w, h=h, hash_mode=HASH_MODE_HMAC)
+    assert (sk.idx, sk.sk_seed, sk.sk_prf, sk.root, sk.pub_seed) == (7, sk_seed, sk_prf, root, pub_seed)
+
+    pk2, sk2 = public_key_to_bytes(pk), private_key_to_bytes(sk)
+    assert pk2[4] == 2 and pk2[11] == 0 and sk2[4] == 2 and sk2[11] == 0
+    assert public_key_from_bytes(pk2) == pk
+    assert private_key_from_bytes(sk2) == sk
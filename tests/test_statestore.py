@@ -0,0 +1,50 @@
+# test_statestore.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from params import XMSSParams
+from statestore import RECORD_SIZE, KeyStateStore
+from xmss import xmss_keygen
+
+
+@pytest.fixture(scope="module")
+def key():
+    return xmss_keygen(XMSSParams(n=16, w=16, h=4))
+
+
+def _fill_journal(path, SK):
+    # reserve=2: ogni due firme un nuovo record di prenotazione (2, 4, 6).
+    store = KeyStateStore.create(path, SK, reserve=2)
+    for _ in range(5):
+        store.sign(b"m")
+    store._journal.close()  # crash: niente record di release
+    return path + ".journal"
+
+
+def test_torn_tail_is_trimmed(tmp_path, key):
+    path = str(tmp_path / "sk.bin")
+    journal = _fill_journal(path, key[0])
+    with open(journal, "ab") as f:
+        f.write(b"\x01\x00\x00")  # record parziale, mai arrivato su disco
+    store = KeyStateStore.open(path, reserve=2)
+    assert store.sk.idx == 6
+    assert os.path.getsize(journal) == 3 * RECORD_SIZE
+    store.close()
+
+
+def test_damaged_record_refuses_to_open(tmp_path, key):
+    path = str(tmp_path / "sk.bin")
+    journal = _fill_journal(path, key[0])
+    with open(journal, "r+b") as f:
+        f.seek(RECORD_SIZE + 4)  # secondo record di tre: quelli dopo sono validi
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes((byte[0] ^ 0xFF,)))
+    size = os.path.getsize(journal)
+    with pytest.raises(ValueError):
+        KeyStateStore.open(path, reserve=2)
+    assert os.path.getsize(journal) == size
@@ -0,0 +1,23 @@
+# test_verifier.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from params import XMSSParams
+from xmss import XMSSVerifier, xmss_keygen, xmss_sign, xmss_verify
+
+
+def test_forged_idx_is_rejected_and_top_cache_stays_bounded():
+    params = XMSSParams(n=32, w=16, h=4)
+    SK, PK = xmss_keygen(params)
+    _, sig = xmss_sign(b"msg", SK)
+    verifier = XMSSVerifier(PK)
+    assert verifier.verify(sig, b"msg")
+
+    for idx in range(params.max_signatures, params.max_signatures + 200):
+        forged = idx.to_bytes(4, "big") + sig[4:]
+        assert not verifier.verify(forged, b"msg")
+        assert not xmss_verify(forged, b"msg", PK)
+    # Al massimo 2^h - 1 nodi interni nella tabella alta.
+    assert len(verifier._top) <= (1 << params.h) - 1
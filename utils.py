@@ -1,6 +1,16 @@
 # utils.py
 from __future__ import annotations
 import math
+import mmap
+import os
+from typing import IO, Iterable, Iterator, Union
+
+# Messaggio per sign/verify in streaming: path (letto via mmap), file object
+# binario aperto, oppure iterabile di pezzi bytes-like.
+MessageSource = Union[str, "os.PathLike[str]", IO[bytes], Iterable[bytes]]
+
+# Dimensione dei blocchi letti da un file object.
+MSG_CHUNK_SIZE = 1 << 20
 
 def to_bytes(x: int, outlen: int) -> bytes:
     """RFC 8391, Section 2.4: big-endian integer-to-byte."""
@@ -56,3 +66,26 @@ def base_w(x: bytes, w: int, out_len: int) -> list[int]:
         raise ValueError("base_w: could not extract enough digits")
 
     return res
+
+def iter_message(source: MessageSource, chunk_size: int = MSG_CHUNK_SIZE) -> Iterator[Union[bytes, memoryview, mmap.mmap]]:
+    """
+    Yield the message in pieces without loading it whole: a path is mapped
+    with mmap (yielded once, pages are read on demand), a file object is read
+    in chunk_size blocks, any other iterable is passed through.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield source
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return  # mmap non accetta file vuoti
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+    elif hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from source
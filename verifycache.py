@@ -0,0 +1,97 @@
+# verifycache.py
+"""
+Optional cache of verification results, in front of xmss_verify.
+
+The key is SHA-256(pk.bin || len(sig) || sig || M), where pk.bin is the
+serialized public key (header, root, pub_seed), so a repeated verification of
+the same signature on the same message costs one hash and a dict lookup.
+Both outcomes are cached (verification is deterministic). Entries are evicted
+in LRU order beyond max_entries and, with ttl set, after ttl seconds.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from serialize import public_key_to_bytes
+from signature import Buffer, XMSSSignature
+from xmss import XMSSPublicKey, xmss_verify
+
+Signature = Union[Buffer, XMSSSignature]
+
+
+def cache_key(pk_bytes: bytes, sig: Signature, M: Buffer) -> bytes:
+    """Digest identifying (public key, signature, message); pk_bytes as in pk.bin."""
+    sig_buf = memoryview(bytes(sig) if isinstance(sig, XMSSSignature) else sig)
+    h = hashlib.sha256(pk_bytes)
+    # La lunghezza della firma separa firma e messaggio in modo univoco.
+    h.update(len(sig_buf).to_bytes(4, "big"))
+    h.update(sig_buf)
+    h.update(M)
+    return h.digest()
+
+
+class VerificationCache:
+    """
+    max_entries: size limit (LRU eviction); ttl: lifetime of an entry in
+    seconds, None = no expiry. Thread-safe.
+    """
+
+    def __init__(self, max_entries: int = 65536, ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be > 0")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        # chiave -> (risultato, scadenza)
+        self._entries: "OrderedDict[bytes, Tuple[bool, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes) -> Optional[bool]:
+        """Cached result for key, or None (counts a hit or a miss)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and entry[1] <= self._clock():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: bytes, valid: bool) -> None:
+        expires = self._clock() + self.ttl if self.ttl is not None else 0.0
+        with self._lock:
+            self._entries[key] = (valid, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def verify(self, sig: Signature, M: bytes, PK: XMSSPublicKey,
+               verify: Callable[[Signature, bytes, XMSSPublicKey], bool] = xmss_verify) -> bool:
+        """xmss_verify(sig, M, PK) through the cache; verify can be e.g. an XMSSVerifier wrapper."""
+        key = cache_key(public_key_to_bytes(PK), sig, M)
+        valid = self.get(key)
+        if valid is None:
+            valid = verify(sig, M, PK)
+            self.put(key, valid)
+        return valid
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,364 @@
+# verifyservice.py
+"""
+Local asyncio HTTP verification service (sidecar), stdlib only.
+
+  POST /verify        {"key": NAME | "pk": HEX, "sig": HEX, "msg": HEX}  -> {"valid": bool}
+  POST /verify_batch  {"items": [{...same fields...}, ...]}             -> {"results": [bool, ...]}
+  GET  /health                                                          -> queue and batch counters
+
+pk is a public key in the serialize.py format (pk.bin contents); NAME refers
+to a key registered at startup (--key NAME=pk.bin).
+
+Concurrent requests are queued item by item and merged into batches (up to
+max_batch items, waiting at most window seconds for more), grouped by public
+key and verified in a process pool. Every worker keeps an LRU of
+XMSSVerifier per public key (registered keys are loaded and precomputed
+when the worker starts), so the mask cache stays warm across batches.
+The queue is bounded: when it is full the request gets 503 and Retry-After.
+A /verify_batch request may carry at most queue_size items (--queue, default
+4096); larger ones get 413 and must be split, since they could never fit.
+With a VerificationCache (--cache N) repeated requests are answered without
+reaching the queue.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+import json
+import os
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from serialize import public_key_from_bytes
+from verifycache import VerificationCache, cache_key
+from xmss import XMSSVerifier
+
+# Richiesta di verifica: (pk serializzata, firma, messaggio).
+Item = Tuple[bytes, bytes, bytes]
+Group = Tuple[bytes, List[Tuple[bytes, bytes]]]
+
+MAX_BODY = 64 << 20
+# Verifier tenuti in cache in ogni processo worker.
+WORKER_CACHE_SIZE = 64
+
+_verifiers: "OrderedDict[bytes, XMSSVerifier]" = OrderedDict()
+
+
+def _verifier(pk_bytes: bytes) -> XMSSVerifier:
+    v = _verifiers.get(pk_bytes)
+    if v is not None:
+        _verifiers.move_to_end(pk_bytes)
+        return v
+    v = XMSSVerifier(public_key_from_bytes(pk_bytes))
+    _verifiers[pk_bytes] = v
+    if len(_verifiers) > WORKER_CACHE_SIZE:
+        _verifiers.popitem(last=False)
+    return v
+
+
+def _init_worker(preload: Sequence[bytes]) -> None:
+    """Initializer del pool: verifier delle chiavi registrate già pronti."""
+    for pk_bytes in preload:
+        _verifier(pk_bytes).precompute()
+
+
+def _verify_groups(groups: List[Group]) -> List[List[bool]]:
+    """Worker: verifica ogni gruppo (pk, [(sig, msg), ...]) con il verifier in cache."""
+    out: List[List[bool]] = []
+    for pk_bytes, pairs in groups:
+        v = _verifier(pk_bytes)
+        out.append([v.verify(sig, msg) for sig, msg in pairs])
+    return out
+
+
+class QueueFull(Exception):
+    pass
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class VerificationService:
+    """
+    keys: registered public keys (name -> serialized pk).
+    workers: processes of the pool (None = os.cpu_count()), unless executor is given.
+    max_batch / window: batch size limit and coalescing delay in seconds.
+    queue_size: maximum number of queued items before requests are rejected.
+    cache: optional VerificationCache consulted before queueing.
+    """
+
+    def __init__(self, keys: Optional[Dict[str, bytes]] = None, workers: Optional[int] = None,
+                 max_batch: int = 64, window: float = 0.002, queue_size: int = 4096,
+                 executor: Optional[Executor] = None, cache: Optional[VerificationCache] = None) -> None:
+        if max_batch < 1 or queue_size < 1:
+            raise ValueError("max_batch and queue_size must be >= 1")
+        self.keys = dict(keys or {})
+        for pk_bytes in self.keys.values():
+            public_key_from_bytes(pk_bytes)  # chiavi non valide: errore subito
+        self.workers = workers or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.window = window
+        self.queue_size = queue_size
+        self.cache = cache
+        self._own_executor = executor is None
+        self._executor = executor if executor is not None else ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(list(self.keys.values()),))
+        self._queue: "Optional[asyncio.Queue[Tuple[Item, asyncio.Future[bool]]]]" = None
+        self._inflight: Optional[asyncio.Semaphore] = None
+        self._batcher: Optional["asyncio.Task[None]"] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.stats = {"items": 0, "batches": 0, "rejected": 0}
+
+    # --- coda e batch -------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            # Al massimo due batch per worker in volo: il resto aspetta in coda.
+            self._inflight = asyncio.Semaphore(2 * self.workers)
+            self._batcher = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    def submit(self, items: Sequence[Item]) -> "List[asyncio.Future[bool]]":
+        """
+        Queue items (all or none); raises QueueFull when the queue has no room
+        right now, ValueError if there are more items than queue_size.
+        """
+        if len(items) > self.queue_size:
+            raise ValueError(f"at most {self.queue_size} items per request")
+        self._ensure_started()
+        assert self._queue is not None
+        if self._queue.qsize() + len(items) > self.queue_size:
+            self.stats["rejected"] += len(items)
+            raise QueueFull()
+        loop = asyncio.get_running_loop()
+        futures: "List[asyncio.Future[bool]]" = []
+        for item in items:
+            fut: "asyncio.Future[bool]" = loop.create_future()
+            self._queue.put_nowait((item, fut))
+            futures.append(fut)
+        return futures
+
+    async def verify_many(self, items: Sequence[Item]) -> List[bool]:
+        cache = self.cache
+        if cache is None:
+            return list(await asyncio.gather(*self.submit(items)))
+        keys = [cache_key(pk_bytes, sig, msg) for pk_bytes, sig, msg in items]
+        results = [cache.get(k) for k in keys]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing:
+            fresh = await asyncio.gather(*self.submit([items[i] for i in missing]))
+            for i, valid in zip(missing, fresh):
+                cache.put(keys[i], valid)
+                results[i] = valid
+        return [bool(r) for r in results]
+
+    async def verify(self, pk_bytes: bytes, sig: bytes, msg: bytes) -> bool:
+        return (await self.verify_many([(pk_bytes, sig, msg)]))[0]
+
+    async def _batch_loop(self) -> None:
+        assert self._queue is not None and self._inflight is not None
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.empty() and self.window > 0:
+                await asyncio.sleep(self.window)  # lascia arrivare richieste concorrenti
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._inflight.acquire()
+            asyncio.get_running_loop().create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: "List[Tuple[Item, asyncio.Future[bool]]]") -> None:
+        assert self._inflight is not None
+        try:
+            index: Dict[bytes, int] = {}
+            groups: List[Group] = []
+            slots: List[Tuple[int, int]] = []
+            for (pk_bytes, sig, msg), _fut in batch:
+                g = index.get(pk_bytes)
+                if g is None:
+                    g = index[pk_bytes] = len(groups)
+                    groups.append((pk_bytes, []))
+                slots.append((g, len(groups[g][1])))
+                groups[g][1].append((sig, msg))
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(self._executor, _verify_groups, groups)
+            except Exception as exc:
+                for _item, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(exc)
+                return
+            for (g, k), (_item, fut) in zip(slots, batch):
+                if not fut.done():
+                    fut.set_result(results[g][k])
+            self.stats["items"] += len(batch)
+            self.stats["batches"] += 1
+        finally:
+            self._inflight.release()
+
+    # --- HTTP ---------------------------------------------------------
+
+    def _parse_item(self, obj: Any) -> Item:
+        if not isinstance(obj, dict):
+            raise HTTPError(400, "item must be an object")
+        try:
+            if "key" in obj:
+                pk_bytes = self.keys[obj["key"]]
+            else:
+                pk_bytes = bytes.fromhex(obj["pk"])
+                public_key_from_bytes(pk_bytes)
+            return pk_bytes, bytes.fromhex(obj["sig"]), bytes.fromhex(obj["msg"])
+        except KeyError as exc:
+            raise HTTPError(400, f"missing or unknown field: {exc}") from None
+        except (TypeError, ValueError, struct.error) as exc:
+            raise HTTPError(400, f"invalid item: {exc}") from None
+
+    async def _route(self, method: str, path: str, body: bytes) -> Any:
+        if path == "/health":
+            queued = self._queue.qsize() if self._queue is not None else 0
+            health: Dict[str, Any] = dict(self.stats, status="ok", queued=queued)
+            if self.cache is not None:
+                health["cache"] = self.cache.stats()
+            return health
+        if path not in ("/verify", "/verify_batch"):
+            raise HTTPError(404, "not found")
+        if method != "POST":
+            raise HTTPError(405, "use POST")
+        try:
+            req = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, "invalid JSON") from None
+        if path == "/verify":
+            return {"valid": (await self.verify_many([self._parse_item(req)]))[0]}
+        if not isinstance(req, dict) or not isinstance(req.get("items"), list):
+            raise HTTPError(400, "expected {\"items\": [...]}")
+        if len(req["items"]) > self.queue_size:
+            # Non entrerebbe mai in coda: 503 + Retry-After farebbe riprovare all'infinito.
+            raise HTTPError(413, f"at most {self.queue_size} items per request")
+        items = [self._parse_item(x) for x in req["items"]]
+        return {"results": await self.verify_many(items)}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                parts = line.decode("latin-1").split()
+                if len(parts) != 3:
+                    return
+                method, path, version = parts
+                headers: Dict[str, str] = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = h.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                extra: Dict[str, str] = {}
+                # Errore di framing: il body non è stato letto, la connessione va chiusa.
+                framing_error = True
+                try:
+                    length = int(headers.get("content-length", "0"))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    status, payload = 400, {"error": "bad Content-Length"}
+                elif length > MAX_BODY:
+                    status, payload = 413, {"error": "body too large"}
+                else:
+                    framing_error = False
+                    body = await reader.readexactly(length)
+                    try:
+                        status, payload = 200, await self._route(method, path.split("?", 1)[0], body)
+                    except HTTPError as exc:
+                        status, payload = exc.status, {"error": str(exc)}
+                    except QueueFull:
+                        status, payload = 503, {"error": "queue full"}
+                        extra["Retry-After"] = "1"
+                    except Exception as exc:  # errore nei worker
+                        status, payload = 500, {"error": str(exc)}
+
+                keep_alive = (headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                              and not framing_error)
+                data = json.dumps(payload).encode("utf-8")
+                head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+                        "Content-Type: application/json",
+                        f"Content-Length: {len(data)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f"{k}: {v}" for k, v in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        self._ensure_started()
+        # I worker vanno creati prima di accettare connessioni: con fork
+        # erediterebbero i socket dei client aperti in quel momento.
+        await asyncio.get_running_loop().run_in_executor(self._executor, _verify_groups, [])
+        self._server = await asyncio.start_server(self._handle, host, port)
+
+    @property
+    def port(self) -> int:
+        assert self._server is not None
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._batcher is not None:
+            self._batcher.cancel()
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    keys: Dict[str, bytes] = {}
+    for spec in args.key:
+        name, _, path = spec.partition("=")
+        with open(path, "rb") as f:
+            keys[name] = f.read()
+    cache = VerificationCache(args.cache, ttl=args.cache_ttl) if args.cache else None
+    service = VerificationService(keys, workers=args.workers, max_batch=args.max_batch,
+                                  window=args.window_ms / 1000, queue_size=args.queue, cache=cache)
+    await service.start(args.host, args.port)
+    print(f"Verification service: http://{args.host}:{service.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.close()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="XMSS verification service")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--key", action="append", default=[], help="NAME=pk.bin (ripetibile)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--max-batch", type=int, default=64)
+    ap.add_argument("--window-ms", type=float, default=2.0)
+    ap.add_argument("--queue", type=int, default=4096)
+    ap.add_argument("--cache", type=int, default=0, help="voci della cache dei risultati (0 = spenta)")
+    ap.add_argument("--cache-ttl", type=float, default=None, help="durata delle voci in secondi")
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
 const DATA_PATH = "../merkle.json";
+// Endpoint di demo.py per i nodi caricati su richiesta (demo con tree_id).
+const API_BASE = "/api";
+// Fino a questa altezza l'albero viene mostrato tutto espanso.
+const FULL_TREE_MAX_H = 5;
 
 const state = {
   data: null,
@@ -7,8 +11,16 @@ const state = {
   rootKey: null,
   playing: false,
   timer: null,
+  // Nodi interni espansi ("level:index"): gli altri sono disegnati come sottoalberi chiusi.
+  expanded: new Set(),
+  // Incrementati a ogni step / nodo selezionato: le risposte asincrone superate vengono ignorate.
+  renderToken: 0,
+  detailsToken: 0,
 };
 
+// Cache dei nodi scaricati: tree_id -> Map("level:index" -> nodo).
+const nodeCache = new Map();
+
 const elements = {
   svg: document.getElementById("tree"),
   rootStatus: document.getElementById("root-status"),
@@ -34,15 +46,104 @@ function setStatus(demo) {
   elements.params.textContent = `params: n=${demo.params.n}, w=${demo.params.w}, h=${demo.params.h}, target_idx=${demo.target_idx}`;
 }
 
+function treeHeight(demo) {
+  return demo.tree ? demo.tree.levels.length - 1 : demo.params.h;
+}
+
+async function getNode(demo, level, index) {
+  if (demo.tree) {
+    return demo.tree.levels[level].nodes[index];
+  }
+  let cache = nodeCache.get(demo.tree_id);
+  if (!cache) {
+    cache = new Map();
+    nodeCache.set(demo.tree_id, cache);
+  }
+  const key = `${level}:${index}`;
+  if (!cache.has(key)) {
+    const url = `${API_BASE}/node?tree=${encodeURIComponent(demo.tree_id)}&level=${level}&index=${index}`;
+    // La promise in corso evita richieste doppie; se fallisce si toglie dalla cache,
+    // così un errore transitorio non blocca il nodo fino al reload della pagina.
+    const pending = fetch(url)
+      .then((response) => {
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.json();
+      })
+      .catch(() => {
+        if (cache.get(key) === pending) cache.delete(key);
+        return null;
+      });
+    cache.set(key, pending);
+  }
+  return cache.get(key);
+}
+
+function resetExpanded(demo) {
+  const h = treeHeight(demo);
+  state.expanded.clear();
+  if (h <= FULL_TREE_MAX_H) {
+    for (let level = 1; level <= h; level++) {
+      for (let i = 0; i < Math.pow(2, h - level); i++) {
+        state.expanded.add(`${level}:${i}`);
+      }
+    }
+    return;
+  }
+  // Albero grande: solo il percorso dalla radice alla foglia target.
+  let idx = demo.target_idx;
+  for (let level = 0; level <= h; level++) {
+    if (level > 0) state.expanded.add(`${level}:${idx}`);
+    idx = Math.floor(idx / 2);
+  }
+}
+
+function isPathNode(demo, level, index) {
+  return level <= treeHeight(demo) && Math.floor(demo.target_idx / Math.pow(2, level)) === index;
+}
+
+function toggleSubtree(demo, level, index) {
+  const key = `${level}:${index}`;
+  if (level === 0) return;
+  if (state.expanded.has(key)) {
+    if (isPathNode(demo, level, index)) return;
+    state.expanded.delete(key);
+  } else {
+    state.expanded.add(key);
+  }
+  buildSvg(demo);
+  applyStep(demo, state.step);
+}
+
 function buildSvg(demo) {
-  const levels = demo.tree.levels;
-  const leafCount = levels[0].nodes.length;
-  const maxLevel = levels.length - 1;
+  const maxLevel = treeHeight(demo);
 
   const spacingX = 60;
   const spacingY = 80;
   const margin = 40;
-  const width = margin * 2 + (leafCount - 1) * spacingX;
+
+  // Layout solo dei nodi visibili: i nodi di frontiera (foglie o sottoalberi chiusi)
+  // occupano uno slot ciascuno, i nodi espansi stanno sopra la media dei figli.
+  const visible = [];
+  const edges = [];
+  let slot = 0;
+  function layout(level, index) {
+    const expanded = level > 0 && state.expanded.has(`${level}:${index}`);
+    let x;
+    if (expanded) {
+      const lx = layout(level - 1, index * 2);
+      const rx = layout(level - 1, index * 2 + 1);
+      x = (lx + rx) / 2;
+      edges.push([level, x, level - 1, lx], [level, x, level - 1, rx]);
+    } else {
+      x = margin + slot * spacingX;
+      slot += 1;
+    }
+    visible.push({ level, index, x, collapsed: level > 0 && !expanded });
+    return x;
+  }
+  layout(maxLevel, 0);
+
+  const width = margin * 2 + Math.max(slot - 1, 0) * spacingX;
   const height = margin * 2 + maxLevel * spacingY;
 
   elements.svg.setAttribute("viewBox", `0 0 ${width} ${height}`);
@@ -52,80 +153,76 @@ function buildSvg(demo) {
   const edgesGroup = document.createElementNS("http://www.w3.org/2000/svg", "g");
   const nodesGroup = document.createElementNS("http://www.w3.org/2000/svg", "g");
 
-  function xFor(level, index) {
-    const span = Math.pow(2, level);
-    const center = (index * span) + (span / 2) - 0.5;
-    return margin + center * spacingX;
-  }
-
   function yFor(level) {
     return margin + (maxLevel - level) * spacingY;
   }
 
   // Edges
-  for (let level = 1; level <= maxLevel; level++) {
-    const nodes = levels[level].nodes;
-    for (let i = 0; i < nodes.length; i++) {
-      const parentX = xFor(level, i);
-      const parentY = yFor(level);
-      const leftX = xFor(level - 1, i * 2);
-      const rightX = xFor(level - 1, i * 2 + 1);
-      const childY = yFor(level - 1);
-
-      [leftX, rightX].forEach((cx) => {
-        const line = document.createElementNS("http://www.w3.org/2000/svg", "line");
-        line.setAttribute("x1", parentX);
-        line.setAttribute("y1", parentY);
-        line.setAttribute("x2", cx);
-        line.setAttribute("y2", childY);
-        line.setAttribute("class", "edge");
-        edgesGroup.appendChild(line);
-      });
-    }
-  }
+  edges.forEach(([parentLevel, parentX, childLevel, childX]) => {
+    const line = document.createElementNS("http://www.w3.org/2000/svg", "line");
+    line.setAttribute("x1", parentX);
+    line.setAttribute("y1", yFor(parentLevel));
+    line.setAttribute("x2", childX);
+    line.setAttribute("y2", yFor(childLevel));
+    line.setAttribute("class", "edge");
+    edgesGroup.appendChild(line);
+  });
 
   // Nodes
-  for (let level = 0; level <= maxLevel; level++) {
-    const nodes = levels[level].nodes;
-    for (let i = 0; i < nodes.length; i++) {
-      const cx = xFor(level, i);
-      const cy = yFor(level);
-
-      const circle = document.createElementNS("http://www.w3.org/2000/svg", "circle");
-      circle.setAttribute("cx", cx);
-      circle.setAttribute("cy", cy);
-      circle.setAttribute("r", 12);
-      circle.setAttribute("class", "node other");
-      circle.style.setProperty("--delay", `${(level * 40) + (i * 10)}ms`);
-      circle.dataset.level = String(level);
-      circle.dataset.index = String(i);
-      if (level === maxLevel && i === 0) {
-        circle.dataset.root = "true";
-      }
-
-      circle.addEventListener("click", () => showNodeDetails(demo, level, i));
-
-      const label = document.createElementNS("http://www.w3.org/2000/svg", "text");
-      label.setAttribute("x", cx);
-      label.setAttribute("y", cy + 4);
-      label.setAttribute("text-anchor", "middle");
-      label.setAttribute("class", "label");
-      label.textContent = `${level}:${i}`;
-
-      nodesGroup.appendChild(circle);
-      nodesGroup.appendChild(label);
+  visible.forEach(({ level, index, x, collapsed }, order) => {
+    const cx = x;
+    const cy = yFor(level);
+
+    const circle = document.createElementNS("http://www.w3.org/2000/svg", "circle");
+    circle.setAttribute("cx", cx);
+    circle.setAttribute("cy", cy);
+    circle.setAttribute("r", 12);
+    circle.setAttribute("class", collapsed ? "node other collapsed" : "node other");
+    circle.style.setProperty("--delay", `${Math.min(order * 10, 600)}ms`);
+    circle.dataset.level = String(level);
+    circle.dataset.index = String(index);
+    if (level === maxLevel && index === 0) {
+      circle.dataset.root = "true";
+    }
 
-      nodeMap.set(`${level}:${i}`, circle);
+    circle.addEventListener("click", () => {
+      showNodeDetails(demo, level, index);
+      toggleSubtree(demo, level, index);
+    });
+
+    const label = document.createElementNS("http://www.w3.org/2000/svg", "text");
+    label.setAttribute("x", cx);
+    label.setAttribute("y", cy + 4);
+    label.setAttribute("text-anchor", "middle");
+    label.setAttribute("class", "label");
+    label.textContent = `${level}:${index}`;
+
+    nodesGroup.appendChild(circle);
+    nodesGroup.appendChild(label);
+
+    if (collapsed) {
+      // Sottoalbero chiuso: numero di foglie sotto il nodo, click per espandere.
+      const badge = document.createElementNS("http://www.w3.org/2000/svg", "text");
+      badge.setAttribute("x", cx);
+      badge.setAttribute("y", cy + 26);
+      badge.setAttribute("text-anchor", "middle");
+      badge.setAttribute("class", "label collapsed-label");
+      badge.textContent = `+${Math.pow(2, level)}`;
+      nodesGroup.appendChild(badge);
     }
-  }
+
+    nodeMap.set(`${level}:${index}`, circle);
+  });
 
   elements.svg.appendChild(edgesGroup);
   elements.svg.appendChild(nodesGroup);
 }
 
-function showNodeDetails(demo, level, index) {
-  const nodes = demo.tree.levels[level].nodes;
-  const entry = nodes[index];
+async function showNodeDetails(demo, level, index) {
+  state.detailsToken += 1;
+  const token = state.detailsToken;
+  const entry = await getNode(demo, level, index);
+  if (token !== state.detailsToken) return;
   if (!entry) {
     elements.nodeDetails.textContent = "Nodo non trovato.";
     return;
@@ -167,7 +264,8 @@ function showNodeDetails(demo, level, index) {
       for (let k = 0; k < demo.auth_path.length; k++) {
         const sibling = demo.auth_path[k];
         const parentIndex = Math.floor(cur / 2);
-        const parent = demo.tree.levels[k + 1].nodes[parentIndex];
+        const parent = await getNode(demo, k + 1, parentIndex);
+        if (token !== state.detailsToken) return;
         lines.push(
           `- livello ${k}: sibling index=${sibling.sibling_index}`
         );
@@ -200,8 +298,8 @@ function escapeHtml(text) {
     .replace(/'/g, "&#39;");
 }
 
-function applyStep(demo, step) {
-  if (!demo || !demo.path || !demo.auth_path || !demo.tree) {
+async function applyStep(demo, step) {
+  if (!demo || !demo.path || !demo.auth_path || !(demo.tree || demo.tree_id)) {
     elements.stepDetails.textContent = "Percorso non disponibile per questo test.";
     return;
   }
@@ -232,6 +330,8 @@ function applyStep(demo, step) {
     }
   }
 
+  state.renderToken += 1;
+  const token = state.renderToken;
   const detail = [];
   const add = (line) => detail.push(escapeHtml(line));
   const addHtml = (line) => detail.push(line);
@@ -239,7 +339,8 @@ function applyStep(demo, step) {
     const cur = path[step];
     const sib = auth[step];
     const parentIndex = Math.floor(cur.node_index / 2);
-    const parent = demo.tree.levels[step + 1].nodes[parentIndex];
+    const parent = await getNode(demo, step + 1, parentIndex);
+    if (token !== state.renderToken) return;
     const isLeft = (cur.node_index % 2) === 0;
     const leftValue = isLeft ? cur.node_value : sib.sibling_value;
     const rightValue = isLeft ? sib.sibling_value : cur.node_value;
@@ -453,7 +554,7 @@ function applyDemo() {
     elements.demoDetails.textContent = "Demo non disponibile.";
     return;
   }
-  if (!demo.tree || !demo.path || !demo.auth_path) {
+  if (!(demo.tree || demo.tree_id) || !demo.path || !demo.auth_path) {
     elements.svg.innerHTML = "";
     nodeMap.clear();
     elements.stepDetails.textContent = "Percorso non disponibile per questo test.";
@@ -470,12 +571,12 @@ function applyDemo() {
   state.step = Math.min(state.step, state.maxStep);
   elements.stepRange.max = String(state.maxStep);
   elements.stepRange.value = String(state.step);
-  state.rootKey = `${demo.tree.levels.length - 1}:0`;
+  state.rootKey = `${treeHeight(demo)}:0`;
 
   setStatus(demo);
+  resetExpanded(demo);
   buildSvg(demo);
-  applyStep(demo, state.step);
-  showNodeDetails(demo, 0, demo.target_idx);
+  applyStep(demo, state.step).then(() => showNodeDetails(demo, 0, demo.target_idx));
   elements.publicParams.textContent =
     `pub_seed: ${demo.pub_seed}\nroot: ${demo.root}\nparams: n=${demo.params.n}, w=${demo.params.w}, h=${demo.params.h}`;
   if (state.step >= state.maxStep) {
@@ -1,11 +1,13 @@
 # wots.py
 from __future__ import annotations
-from typing import List
+from typing import List, Optional, Sequence
 from params import XMSSParams
 from address import Address
 from utils import base_w, to_bytes, xor_bytes
-from hashfuncs import PRF, F
+from hashfuncs import PRF, PRF_many, F
+import instrument
 
+@instrument.phase("wots_sk_from_seed")
 def wots_sk_from_seed(S_ots: bytes, params: XMSSParams) -> List[bytes]:
     """
     RFC 8391, Section 3.1.7: sk[i] = PRF(S, toByte(i,32)).
@@ -14,10 +16,7 @@ def wots_sk_from_seed(S_ots: bytes, params: XMSSParams) -> List[bytes]:
     n = params.n
     if len(S_ots) != n:
         raise ValueError("S_ots must be n bytes")
-    sk: List[bytes] = []
-    for i in range(params.length):
-        sk.append(PRF(S_ots, to_bytes(i, 32), n))
-    return sk
+    return PRF_many(S_ots, [to_bytes(i, 32) for i in range(params.length)], n, params.hash_mode)
 
 def chain(X: bytes, i: int, s: int, SEED: bytes, adrs: Address, params: XMSSParams) -> bytes:
     """
@@ -44,7 +43,7 @@ def chain(X: bytes, i: int, s: int, SEED: bytes, adrs: Address, params: XMSSPara
     tmp = F(KEY, tmp XOR BM);
     return tmp;
     """
-    n, w = params.n, params.w
+    n, w, mode = params.n, params.w, params.hash_mode
     if s == 0:
         return X
     if (i + s) > (w - 1):
@@ -55,14 +54,16 @@ def chain(X: bytes, i: int, s: int, SEED: bytes, adrs: Address, params: XMSSPara
     for j in range(i, i + s):
         adrs.set_hash_address(j)
         adrs.set_key_and_mask(0)
-        KEY = PRF(SEED, adrs.to_bytes(), n)
+        KEY = PRF(SEED, adrs.to_bytes(), n, mode)
         adrs.set_key_and_mask(1)
-        BM = PRF(SEED, adrs.to_bytes(), n)
-        tmp = F(KEY, xor_bytes(tmp, BM), n)
+        BM = PRF(SEED, adrs.to_bytes(), n, mode)
+        tmp = F(KEY, xor_bytes(tmp, BM), n, mode)
 
     return tmp
 
-def wots_gen_pk(sk: List[bytes], SEED: bytes, adrs: Address, params: XMSSParams) -> List[bytes]:
+@instrument.phase("wots_gen_pk")
+def wots_gen_pk(sk: List[bytes], SEED: bytes, adrs: Address, params: XMSSParams,
+                points: Sequence[int] = (), mids: Optional[List[bytes]] = None) -> List[bytes]:
     """RFC 8391, Algorithm 4. Section 3.1.4.
     Algoritmo 4: WOTS_genPK – Generazione della chiave pubblica WOTS+
     Input: chiave privata WOTS+ sk, indirizzo ADRS, seed SEED
@@ -73,12 +74,22 @@ def wots_gen_pk(sk: List[bytes], SEED: bytes, adrs: Address, params: XMSSParams)
     pk[i] = chain(sk[i], 0, w - 1, SEED, ADRS);
     }
     return pk;
+
+    If mids is given, the value of every chain at each position in points
+    (increasing) is appended to it, chain by chain (see chainstore.py).
     """
     # Ogni chain viene portata fino in fondo per ottenere un elemento di PK.
     pk: List[bytes] = []
     for i in range(params.length):
         adrs.set_chain_address(i)
-        pk.append(chain(sk[i], 0, params.w - 1, SEED, adrs, params))
+        X, pos = sk[i], 0
+        if mids is not None:
+            # Stessi passi, spezzati ai checkpoint: i valori intermedi vengono conservati.
+            for p in points:
+                X = chain(X, pos, p - pos, SEED, adrs, params)
+                pos = p
+                mids.append(X)
+        pk.append(chain(X, pos, params.w - 1 - pos, SEED, adrs, params))
     return pk
 
 def _wots_msg_digits(M: bytes, params: XMSSParams) -> List[int]:
@@ -107,17 +118,28 @@ def _wots_msg_digits(M: bytes, params: XMSSParams) -> List[int]:
         raise RuntimeError("msg digit length mismatch")
     return msg
 
-def wots_sign(M: bytes, sk: List[bytes], SEED: bytes, adrs: Address, params: XMSSParams) -> List[bytes]:
-    """RFC 8391, Algorithm 5. Generazione della firma WOTS+"""
+def wots_sign(M: bytes, sk: List[bytes], SEED: bytes, adrs: Address, params: XMSSParams,
+              points: Sequence[int] = (), mids: Optional[Sequence[bytes]] = None) -> List[bytes]:
+    """
+    RFC 8391, Algorithm 5. Generazione della firma WOTS+
+    points / mids: optional chain checkpoints as written by wots_gen_pk; each
+    chain then starts from the highest checkpoint <= msg[i]. Same signature.
+    """
     # Usa le cifre base-w per decidere quanto avanzare su ogni chain.
     msg = _wots_msg_digits(M, params)
+    k = len(points) if mids is not None else 0
     sig: List[bytes] = []
     for i in range(params.length):
         adrs.set_chain_address(i)
-        sig.append(chain(sk[i], 0, msg[i], SEED, adrs, params))
+        X, pos = sk[i], 0
+        for j in range(k):
+            if points[j] > msg[i]:
+                break
+            X, pos = mids[i * k + j], points[j]
+        sig.append(chain(X, pos, msg[i] - pos, SEED, adrs, params))
     return sig
 
-def wots_pk_from_sig(sig: List[bytes], M: bytes, SEED: bytes, adrs: Address, params: XMSSParams) -> List[bytes]:
+def wots_pk_from_sig(sig: Sequence[bytes], M: bytes, SEED: bytes, adrs: Address, params: XMSSParams) -> List[bytes]:
     """RFC 8391, Algorithm 6."""
     if len(sig) != params.length:
         raise ValueError("sig length mismatch")
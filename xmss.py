@@ -1,15 +1,34 @@
 # xmss.py
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import List, Tuple
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 import os
 
 from params import XMSSParams
 from address import Address
-from utils import to_bytes
-from hashfuncs import PRF, H_msg
+from utils import MessageSource, iter_message, to_bytes
+from hashfuncs import Chunk, PRF, H_msg, H_msg_stream
 from wots import wots_sk_from_seed, wots_gen_pk, wots_sign, wots_pk_from_sig
-from ltree import ltree, rand_hash
+from ltree import Masks, ltree, rand_hash, rand_hash_masks, rand_hash_with_masks
+from signature import Buffer, XMSSSignature, encode_signature, write_signature
+from leafengine import ENGINE_NUMPY, ENGINE_PYTHON, check_engine, iter_leaves
+import instrument
+
+if TYPE_CHECKING:
+    from bds import BDSState
+    from chainstore import ChainStore
+    from nodestore import MerkleNodeStore
+
+# Callback (height, index, node) invocata da treehash per ogni nodo calcolato.
+NodeCallback = Callable[[int, int, bytes], None]
+# Stack di treehash: (nodo, altezza), dal basso verso la cima.
+TreehashStack = List[Tuple[bytes, int]]
+# Callback (prossima foglia, stack) per salvare lo stato di treehash (vedi checkpoint.py).
+CheckpointCallback = Callable[[int, TreehashStack], None]
+# Callback (foglia, valori) con i checkpoint delle chain WOTS+ di una foglia (vedi chainstore.py).
+ChainCallback = Callable[[int, List[bytes]], None]
 
 @dataclass
 class XMSSPublicKey:
@@ -25,36 +44,85 @@ class XMSSPrivateKey:
     root: bytes
     pub_seed: bytes  # SEED (public)
     params: XMSSParams
+    # Stato di traversal BDS opzionale (vedi bds.py): non viene serializzato.
+    bds: Optional["BDSState"] = field(default=None, repr=False, compare=False)
+    # Store mmap dei nodi dell'albero (vedi nodestore.py): non viene serializzato.
+    node_store: Optional["MerkleNodeStore"] = field(default=None, repr=False, compare=False)
+    # Checkpoint delle chain WOTS+ per foglia (vedi chainstore.py): non viene serializzato.
+    chain_store: Optional["ChainStore"] = field(default=None, repr=False, compare=False)
 
 def _get_wots_seed(sk_seed: bytes, i: int, params: XMSSParams) -> bytes:
     """RFC 8391, Section 4.1.11: S_ots[i] = PRF(S, toByte(i,32))."""
-    return PRF(sk_seed, to_bytes(i, 32), params.n)
+    return PRF(sk_seed, to_bytes(i, 32), params.n, params.hash_mode)
 
-def treehash(SK: XMSSPrivateKey, s: int, t: int, adrs: Address) -> bytes:
+def gen_wots_sk(SK: XMSSPrivateKey, i: int) -> List[bytes]:
+    """WOTS+ secret key of leaf i (pseudo-random, from SK.sk_seed)."""
+    return wots_sk_from_seed(_get_wots_seed(SK.sk_seed, i, SK.params), SK.params)
+
+def gen_leaf(SK: XMSSPrivateKey, i: int, adrs: Address, chain_points: Sequence[int] = (),
+             on_chains: Optional[ChainCallback] = None) -> bytes:
+    """
+    Leaf i of the Merkle tree: WOTS+ PK compressed by the L-tree.
+    adrs is left as an L-tree address (type=1).
+    on_chains(i, values) receives the chain values at chain_points (wots_gen_pk).
+    """
+    params = SK.params
+    adrs.set_type(0)
+    adrs.set_ots_address(i)
+    mids: Optional[List[bytes]] = [] if on_chains is not None else None
+    pk = wots_gen_pk(gen_wots_sk(SK, i), SK.pub_seed, adrs, params, chain_points, mids)
+    if on_chains is not None:
+        on_chains(i, mids)
+
+    adrs.set_type(1)
+    adrs.set_ltree_address(i)
+    return ltree(pk, SK.pub_seed, adrs, params)
+
+@instrument.phase("treehash")
+def treehash(SK: XMSSPrivateKey, s: int, t: int, adrs: Address,
+             on_node: Optional[NodeCallback] = None, engine: str = ENGINE_PYTHON,
+             resume: Optional[Tuple[int, TreehashStack]] = None,
+             on_checkpoint: Optional[CheckpointCallback] = None, checkpoint_every: int = 1024,
+             chain_points: Sequence[int] = (), on_chains: Optional[ChainCallback] = None) -> bytes:
     """
     RFC 8391, Algorithm 9 (naive stack-based treehash).
     Returns root of subtree height t with leftmost leaf index s.
+    If on_node is given it is called as on_node(height, index, node) for every
+    leaf and internal node of the subtree.
+    engine="numpy" computes the leaves in lockstep batches (leafengine.py).
+    on_checkpoint(next_leaf, stack) is called every checkpoint_every leaves;
+    resume=(next_leaf, stack) continues from such a state (on_node only sees
+    the nodes computed after it).
+    on_chains(leaf, values) gets the WOTS+ chain values of every leaf at
+    chain_points (see gen_leaf).
     """
     if s % (1 << t) != 0:
         raise ValueError("treehash: s must be leftmost leaf for subtree of height t")
+    check_engine(engine)
+    if checkpoint_every < 1:
+        raise ValueError("checkpoint_every must be >= 1")
 
     # Stack di (nodo, altezza) per combinare i nodi quando hanno la stessa altezza.
-    stack: List[Tuple[bytes, int]] = []
+    stack: TreehashStack = []
+    first = 0
+    if resume is not None:
+        first = resume[0] - s
+        stack = list(resume[1])
+        if not 0 <= first <= (1 << t):
+            raise ValueError("treehash: resume leaf outside the subtree")
     params = SK.params
+    leaves = None
+    if engine == ENGINE_NUMPY:
+        leaves = iter_leaves(SK.sk_seed, SK.pub_seed, params, s + first, (1 << t) - first, adrs,
+                             chain_points=chain_points, on_chains=on_chains)
 
-    for i in range(1 << t):
+    for i in range(first, 1 << t):
         SEED = SK.pub_seed
 
         # OTS PK -> foglia via L-tree.
-        adrs.set_type(0)
-        adrs.set_ots_address(s + i)
-        S_ots = _get_wots_seed(SK.sk_seed, s + i, params)
-        wots_sk = wots_sk_from_seed(S_ots, params)
-        pk = wots_gen_pk(wots_sk, SEED, adrs, params)
-
-        adrs.set_type(1)
-        adrs.set_ltree_address(s + i)
-        node = ltree(pk, SEED, adrs, params)
+        node = next(leaves) if leaves is not None else gen_leaf(SK, s + i, adrs, chain_points, on_chains)
+        if on_node is not None:
+            on_node(0, s + i, node)
 
         # Hash nel Merkle tree principale.
         adrs.set_type(2)
@@ -68,18 +136,128 @@ def treehash(SK: XMSSPrivateKey, s: int, t: int, adrs: Address) -> bytes:
             node = rand_hash(left, node, SEED, adrs, params)
             node_h += 1
             adrs.set_tree_height(adrs.get_tree_height() + 1)
+            if on_node is not None:
+                on_node(node_h, adrs.get_tree_index(), node)
 
         stack.append((node, node_h))
+        if on_checkpoint is not None and (i + 1) % checkpoint_every == 0 and i + 1 < (1 << t):
+            on_checkpoint(s + i + 1, stack[:])
 
     if len(stack) != 1:
         raise RuntimeError("treehash: stack ended in unexpected state")
     return stack[0][0]
 
-def build_auth(SK: XMSSPrivateKey, i: int, adrs: Address) -> List[bytes]:
+SubtreeJob = Tuple[XMSSPrivateKey, int, int, Address, bool, str, Optional[Sequence[int]]]
+SubtreeResult = Tuple[bytes, List[Tuple[int, int, bytes]], List[Tuple[int, List[bytes]]]]
+
+def _subtree_job(job: SubtreeJob) -> SubtreeResult:
+    """
+    Worker di treehash_parallel: radice del sottoalbero (ed eventualmente tutti
+    i suoi nodi e, se chain_points non è None, i checkpoint delle chain).
+    """
+    SK, s, t, adrs, collect, engine, chain_points = job
+    nodes: List[Tuple[int, int, bytes]] = []
+    chains: List[Tuple[int, List[bytes]]] = []
+    on_node = (lambda height, index, node: nodes.append((height, index, node))) if collect else None
+    on_chains = (lambda leaf, values: chains.append((leaf, values))) if chain_points is not None else None
+    root = treehash(SK, s, t, adrs, on_node, engine, chain_points=chain_points or (), on_chains=on_chains)
+    return root, nodes, chains
+
+# Altezza massima dei sottoalberi i cui nodi / checkpoint un worker tiene in memoria.
+_COLLECT_MAX_HEIGHT = 12
+
+def _default_split(t: int, workers: int) -> int:
+    # Almeno ~4 sottoalberi per worker, per bilanciare il carico.
+    k = 0
+    while (1 << k) < 4 * workers and k < t:
+        k += 1
+    return k
+
+def treehash_parallel(SK: XMSSPrivateKey, s: int, t: int, adrs: Address, workers: Optional[int] = None,
+                      k: Optional[int] = None, on_node: Optional[NodeCallback] = None,
+                      engine: str = ENGINE_PYTHON, chain_points: Sequence[int] = (),
+                      on_chains: Optional[ChainCallback] = None) -> bytes:
+    """
+    Same result as treehash(SK, s, t, adrs, on_node), computed on a process pool:
+    the 2^k subtrees of height t-k are built by treehash in the workers, then the
+    top k levels are combined here with rand_hash.
+    workers=None uses os.cpu_count(); k=None picks about 4 subtrees per worker
+    (and, with on_node / on_chains, subtrees of height at most 12).
+    on_node / on_chains are called here, with the values collected by a worker,
+    as soon as its subtree is done: only the subtrees in flight are in memory.
+    """
+    if s % (1 << t) != 0:
+        raise ValueError("treehash: s must be leftmost leaf for subtree of height t")
+    workers = workers or os.cpu_count() or 1
+    if k is None:
+        k = _default_split(t, workers)
+        if on_node is not None or on_chains is not None:
+            k = max(k, t - _COLLECT_MAX_HEIGHT)
+    if not 0 <= k <= t:
+        raise ValueError("treehash_parallel: k must be in [0, t]")
+    check_engine(engine)
+
+    sub_t = t - k
+    # Le chiavi passate ai worker portano solo i seed (niente stato BDS / mmap).
+    SK_seeds = replace(SK, bds=None, node_store=None, chain_store=None)
+    points = tuple(chain_points) if on_chains is not None else None
+    jobs: List[SubtreeJob] = [(SK_seeds, s + (j << sub_t), sub_t, adrs.copy(), on_node is not None, engine, points)
+                              for j in range(1 << k)]
+    level: List[bytes] = [b""] * len(jobs)
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        pending = {pool.submit(_subtree_job, job): j for j, job in enumerate(jobs)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                # Il risultato viene consumato e rilasciato subito, in ordine di completamento.
+                root, nodes, chains = fut.result()
+                level[pending.pop(fut)] = root
+                if on_node is not None:
+                    for height, index, node in nodes:
+                        on_node(height, index, node)
+                if on_chains is not None:
+                    for leaf, values in chains:
+                        on_chains(leaf, values)
+    return merge_subtree_roots(SK, level, s >> sub_t, sub_t, adrs, on_node)
+
+def merge_subtree_roots(SK: XMSSPrivateKey, level: List[bytes], first: int, height: int, adrs: Address,
+                    on_node: Optional[NodeCallback] = None) -> bytes:
+    """Combine 2^k adjacent subtree roots (height `height`, first index `first`) up to their root."""
+    params = SK.params
+    while len(level) > 1:
+        adrs.set_type(2)
+        adrs.set_tree_height(height)
+        nxt: List[bytes] = []
+        for i in range(0, len(level), 2):
+            adrs.set_tree_index((first + i) // 2)
+            node = rand_hash(level[i], level[i + 1], SK.pub_seed, adrs, params)
+            if on_node is not None:
+                on_node(height + 1, (first + i) // 2, node)
+            nxt.append(node)
+        level = nxt
+        first //= 2
+        height += 1
+    return level[0]
+
+@instrument.phase("build_auth")
+def build_auth(SK: XMSSPrivateKey, i: int, adrs: Address, workers: Optional[int] = 1,
+               executor: Optional[Executor] = None) -> List[bytes]:
     """
     RFC 8391 Section 4.1.9 example buildAuth (very inefficient):
       auth[j] = treehash(SK, k*2^j, j, ADRS), where k=floor(i/2^j) XOR 1
+    If SK carries a node store (see nodestore.py) or a BDS state for index i
+    (see bds.py) the auth path is taken from it instead, at no hashing cost.
+    workers > 1 (or None = all cores) computes the siblings in a process pool.
+    executor: pool to use instead of a new one per call (reused across
+    signatures, as in PrecomputingSigner); workers then only sizes the jobs.
     """
+    if SK.node_store is not None:
+        return SK.node_store.auth_path(i)
+    if SK.bds is not None and SK.bds.idx == i:
+        return SK.bds.auth[:]
+    if executor is not None or workers is None or workers > 1:
+        n_workers = workers if workers is not None and workers > 1 else os.cpu_count() or 1
+        return _build_auth_parallel(SK, i, adrs, n_workers, executor)
     auth: List[bytes] = []
     h = SK.params.h
     for j in range(h):
@@ -88,10 +266,52 @@ def build_auth(SK: XMSSPrivateKey, i: int, adrs: Address) -> List[bytes]:
         auth.append(treehash(SK, k * (1 << j), j, adrs))
     return auth
 
-def xmss_keygen(params: XMSSParams) -> Tuple[XMSSPrivateKey, XMSSPublicKey]:
+def _build_auth_parallel(SK: XMSSPrivateKey, i: int, adrs: Address, workers: int,
+                         executor: Optional[Executor] = None) -> List[bytes]:
+    """
+    build_auth on a process pool. The siblings cost 2^0 .. 2^(h-1) leaves: the
+    ones higher than `cut` are split into subtrees of height `cut` (about 4 jobs
+    per worker overall) and their roots are merged here with merge_subtree_roots,
+    as in treehash_parallel.
+    Without executor a pool is started (and shut down) for this call only.
+    """
+    h = SK.params.h
+    cut = max(0, h - _default_split(h, workers))
+    SK_seeds = replace(SK, bds=None, node_store=None, chain_store=None)
+    # Dal fratello più alto al più basso: i job piccoli riempiono i buchi alla fine.
+    heights = range(h - 1, -1, -1)
+    jobs: List[SubtreeJob] = []
+    for j in heights:
+        s = ((i >> j) ^ 1) << j
+        sub_t = min(j, cut)
+        for c in range(1 << (j - sub_t)):
+            jobs.append((SK_seeds, s + (c << sub_t), sub_t, adrs.copy(), False, ENGINE_PYTHON, None))
+    if executor is not None:
+        roots = iter(list(executor.map(_subtree_job, jobs)))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            roots = iter(list(pool.map(_subtree_job, jobs)))
+
+    auth: List[bytes] = [b""] * h
+    for j in heights:
+        sub_t = min(j, cut)
+        level = [next(roots)[0] for _ in range(1 << (j - sub_t))]
+        auth[j] = merge_subtree_roots(SK, level, (((i >> j) ^ 1) << j) >> sub_t, sub_t, adrs)
+    return auth
+
+@instrument.operation("keygen")
+def xmss_keygen(params: XMSSParams, on_node: Optional[NodeCallback] = None,
+                workers: Optional[int] = 1, engine: str = ENGINE_PYTHON, chain_points: Sequence[int] = (),
+                on_chains: Optional[ChainCallback] = None) -> Tuple[XMSSPrivateKey, XMSSPublicKey]:
     """
     RFC 8391, Algorithm 10 (but with pseudo-random WOTS keys using SK.sk_seed).
     SK stores idx, sk_seed, sk_prf, root, pub_seed.
+    on_node is forwarded to treehash and sees every node of the tree.
+    workers > 1 (or None = all cores) builds the tree with treehash_parallel;
+    the root is the same as with the serial treehash.
+    engine selects how treehash computes the leaves (see treehash).
+    chain_points / on_chains collect the WOTS+ chain checkpoints of every leaf
+    (see treehash and chainstore.py).
     """
     n = params.n
     idx = 0
@@ -101,39 +321,98 @@ def xmss_keygen(params: XMSSParams) -> Tuple[XMSSPrivateKey, XMSSPublicKey]:
 
     SK_tmp = XMSSPrivateKey(idx=idx, sk_seed=sk_seed, sk_prf=sk_prf, root=b"\x00"*n, pub_seed=pub_seed, params=params)
     adrs = Address()  # all zeros
-    root = treehash(SK_tmp, 0, params.h, adrs)
+    if workers is None or workers > 1:
+        root = treehash_parallel(SK_tmp, 0, params.h, adrs, workers, on_node=on_node, engine=engine,
+                                 chain_points=chain_points, on_chains=on_chains)
+    else:
+        root = treehash(SK_tmp, 0, params.h, adrs, on_node, engine,
+                        chain_points=chain_points, on_chains=on_chains)
 
     SK = XMSSPrivateKey(idx=idx, sk_seed=sk_seed, sk_prf=sk_prf, root=root, pub_seed=pub_seed, params=params)
     PK = XMSSPublicKey(root=root, pub_seed=pub_seed, params=params)
     return SK, PK
 
-def tree_sig(Mp: bytes, SK: XMSSPrivateKey, idx_sig: int, adrs: Address) -> Tuple[List[bytes], List[bytes]]:
-    """RFC 8391, Algorithm 11: returns (sig_ots, auth)."""
+def tree_sig(Mp: bytes, SK: XMSSPrivateKey, idx_sig: int, adrs: Address,
+             auth: Optional[List[bytes]] = None, wots_sk: Optional[List[bytes]] = None,
+             workers: Optional[int] = 1, executor: Optional[Executor] = None) -> Tuple[List[bytes], List[bytes]]:
+    """
+    RFC 8391, Algorithm 11: returns (sig_ots, auth).
+    auth / wots_sk can be passed if already computed for idx_sig (see precompute.py).
+    workers / executor are passed to build_auth (auth path on a process pool).
+    With SK.chain_store the WOTS+ chains start from the stored checkpoints.
+    """
     # Costruisce il percorso di autenticazione e la firma WOTS+.
-    auth = build_auth(SK, idx_sig, adrs)
+    if auth is None:
+        auth = build_auth(SK, idx_sig, adrs, workers, executor)
 
     adrs.set_type(0)
     adrs.set_ots_address(idx_sig)
-    S_ots = _get_wots_seed(SK.sk_seed, idx_sig, SK.params)
-    wots_sk = wots_sk_from_seed(S_ots, SK.params)
-    sig_ots = wots_sign(Mp, wots_sk, SK.pub_seed, adrs, SK.params)
+    if wots_sk is None:
+        wots_sk = gen_wots_sk(SK, idx_sig)
+    points: Sequence[int] = ()
+    mids: Optional[List[bytes]] = None
+    if SK.chain_store is not None:
+        points, mids = SK.chain_store.points, SK.chain_store.get_leaf(idx_sig)
+    sig_ots = wots_sign(Mp, wots_sk, SK.pub_seed, adrs, SK.params, points, mids)
 
     return sig_ots, auth
 
-def xmss_sign(M: bytes, SK: XMSSPrivateKey) -> Tuple[XMSSPrivateKey, bytes]:
+def xmss_sign(M: bytes, SK: XMSSPrivateKey, auth: Optional[List[bytes]] = None,
+              wots_sk: Optional[List[bytes]] = None, workers: Optional[int] = 1,
+              executor: Optional[Executor] = None) -> Tuple[XMSSPrivateKey, bytes]:
     """
     RFC 8391, Algorithm 12:
       idx_sig = idx; idx++
       r = PRF(SK_PRF, toByte(idx_sig,32))
       M' = H_msg(r || root || toByte(idx_sig,n), M)
       Sig = idx_sig(4) || r || sig_ots || auth
+    auth / wots_sk: optional precomputed values for SK.idx, passed to tree_sig.
+    workers > 1 (or None = all cores) computes the auth path in a process pool
+    when SK has neither BDS state nor node store. Starting the pool costs more
+    than the siblings of a small tree: it only pays off for large h (about 12
+    and up), and a long-lived executor passed in avoids paying it per signature.
+    """
+    SK2, idx_sig, r, sig_ots, auth = _sign_parts((M,), SK, auth, wots_sk, workers, executor)
+    return SK2, encode_signature(idx_sig, r, sig_ots, auth)
+
+def xmss_sign_into(M: bytes, SK: XMSSPrivateKey, buffer: Union[bytearray, memoryview], offset: int = 0,
+                   auth: Optional[List[bytes]] = None, wots_sk: Optional[List[bytes]] = None,
+                   workers: Optional[int] = 1, executor: Optional[Executor] = None) -> Tuple[XMSSPrivateKey, XMSSSignature]:
     """
+    xmss_sign writing the signature into buffer[offset:offset + signature_size(params)]
+    (e.g. a preallocated bytearray or mmap); returns a view over those bytes.
+    """
+    SK2, idx_sig, r, sig_ots, auth = _sign_parts((M,), SK, auth, wots_sk, workers, executor)
+    return SK2, write_signature(buffer, SK.params, idx_sig, r, sig_ots, auth, offset)
+
+def xmss_sign_stream(source: MessageSource, SK: XMSSPrivateKey, auth: Optional[List[bytes]] = None,
+                     wots_sk: Optional[List[bytes]] = None, workers: Optional[int] = 1,
+                     executor: Optional[Executor] = None) -> Tuple[XMSSPrivateKey, bytes]:
+    """
+    xmss_sign for a message given as a path (mmap), a binary file object or an
+    iterable of chunks: H_msg absorbs it incrementally, memory stays flat.
+    """
+    SK2, idx_sig, r, sig_ots, auth = _sign_parts(iter_message(source), SK, auth, wots_sk, workers, executor)
+    return SK2, encode_signature(idx_sig, r, sig_ots, auth)
+
+SignatureParts = Tuple[XMSSPrivateKey, int, bytes, List[bytes], List[bytes]]
+
+@instrument.operation("sign")
+def _sign_parts(chunks: Iterable[Chunk], SK: XMSSPrivateKey, auth: Optional[List[bytes]],
+                wots_sk: Optional[List[bytes]], workers: Optional[int] = 1,
+                executor: Optional[Executor] = None) -> SignatureParts:
+    """Algorithm 12 up to the signature fields: (SK2, idx_sig, r, sig_ots, auth)."""
     params = SK.params
     if SK.idx >= params.max_signatures:
         raise ValueError("XMSS: no signatures left for this key (idx exhausted)")
 
     idx_sig = SK.idx
 
+    # Avanza lo stato BDS (se presente) alla foglia successiva: SK resta invariata.
+    bds_next = None
+    if SK.bds is not None and SK.bds.idx == idx_sig:
+        bds_next = SK.bds.next_state(SK)
+
     # Aggiorna idx prima di restituire la firma (sicurezza stateful).
     SK2 = XMSSPrivateKey(
         idx=SK.idx + 1,
@@ -142,26 +421,28 @@ def xmss_sign(M: bytes, SK: XMSSPrivateKey) -> Tuple[XMSSPrivateKey, bytes]:
         root=SK.root,
         pub_seed=SK.pub_seed,
         params=params,
+        bds=bds_next,
+        node_store=SK.node_store,
+        chain_store=SK.chain_store,
     )
 
     adrs = Address()
-    r = PRF(SK.sk_prf, to_bytes(idx_sig, 32), params.n)
+    r = PRF(SK.sk_prf, to_bytes(idx_sig, 32), params.n, params.hash_mode)
     Mp_key = r + SK.root + to_bytes(idx_sig, params.n)
-    Mp = H_msg(Mp_key, M, params.n)
+    Mp = H_msg_stream(Mp_key, chunks, params.n, params.hash_mode)
 
-    sig_ots, auth = tree_sig(Mp, SK, idx_sig, adrs)
+    sig_ots, auth = tree_sig(Mp, SK, idx_sig, adrs, auth, wots_sk, workers, executor)
+    return SK2, idx_sig, r, sig_ots, auth
 
-    sig_bytes = (
-        to_bytes(idx_sig, 4)
-        + r
-        + b"".join(sig_ots)
-        + b"".join(auth)
-    )
-    return SK2, sig_bytes
-
-def xmss_root_from_sig(idx_sig: int, sig_ots: List[bytes], auth: List[bytes],
-                       Mp: bytes, pub_seed: bytes, params: XMSSParams, adrs: Address) -> bytes:
-    """RFC 8391, Algorithm 13."""
+@instrument.phase("xmss_root_from_sig")
+def xmss_root_from_sig(idx_sig: int, sig_ots: Sequence[bytes], auth: Sequence[bytes],
+                       Mp: bytes, pub_seed: bytes, params: XMSSParams, adrs: Address,
+                       masks: Optional[Callable[[int, int], Masks]] = None) -> bytes:
+    """
+    RFC 8391, Algorithm 13.
+    masks(height, index), if given, returns the (KEY, BM0, BM1) triple of the
+    hash-tree address instead of deriving it with PRF (see XMSSVerifier).
+    """
     # Ricostruisce la root partendo da sig_ots e auth.
     adrs.set_type(0)
     adrs.set_ots_address(idx_sig)
@@ -180,41 +461,165 @@ def xmss_root_from_sig(idx_sig: int, sig_ots: List[bytes], auth: List[bytes],
         if ((idx_sig // (1 << k)) % 2) == 0:
             # Nodo corrente a sinistra, auth[k] a destra.
             adrs.set_tree_index(adrs.get_tree_index() // 2)
-            node = rand_hash(node, auth[k], pub_seed, adrs, params)
+            left, right = node, auth[k]
         else:
             # Nodo corrente a destra, auth[k] a sinistra.
             adrs.set_tree_index((adrs.get_tree_index() - 1) // 2)
-            node = rand_hash(auth[k], node, pub_seed, adrs, params)
+            left, right = auth[k], node
+        if masks is not None:
+            node = rand_hash_with_masks(left, right, masks(k, adrs.get_tree_index()), params)
+        else:
+            node = rand_hash(left, right, pub_seed, adrs, params)
     return node
 
-def xmss_verify(sig: bytes, M: bytes, PK: XMSSPublicKey) -> bool:
+def _as_signature(sig: Union[Buffer, XMSSSignature], params: XMSSParams) -> Optional[XMSSSignature]:
+    """Parsed view of sig; None se la lunghezza non torna."""
+    if isinstance(sig, XMSSSignature):
+        return sig if sig.params == params else None
+    try:
+        return XMSSSignature(sig, params)
+    except ValueError:
+        return None
+
+def xmss_verify(sig: Union[Buffer, XMSSSignature], M: bytes, PK: XMSSPublicKey) -> bool:
     """
     RFC 8391, Algorithm 14.
     Parse signature:
       idx(4) || r(n) || sig_ots(len*n) || auth(h*n)
     """
+    return _verify_chunks(sig, (M,), PK)
+
+def xmss_verify_stream(sig: Union[Buffer, XMSSSignature], source: MessageSource, PK: XMSSPublicKey) -> bool:
+    """xmss_verify for a message given as a path (mmap), a binary file object or an iterable of chunks."""
+    return _verify_chunks(sig, iter_message(source), PK)
+
+@instrument.operation("verify")
+def _verify_chunks(sig: Union[Buffer, XMSSSignature], chunks: Iterable[Chunk], PK: XMSSPublicKey) -> bool:
     params = PK.params
     n = params.n
 
-    # Verifica che la lunghezza della firma sia esattamente quella attesa.
-    min_len = 4 + n + (params.length + params.h) * n
-    if len(sig) != min_len:
+    parsed = _as_signature(sig, params)
+    # Indice fuori dall'albero: firma non valida (niente nodi inesistenti in cache).
+    if parsed is None or parsed.idx >= params.max_signatures:
         return False
-
-    idx_sig = int.from_bytes(sig[0:4], "big")
-    off = 4
-    r = sig[off:off+n]
-    off += n
-
-    # Estrae i blocchi di firma WOTS+ e il percorso di autenticazione.
-    sig_ots = [sig[off + i*n: off + (i+1)*n] for i in range(params.length)]
-    off += params.length * n
-
-    auth = [sig[off + i*n: off + (i+1)*n] for i in range(params.h)]
+    idx_sig = parsed.idx
 
     adrs = Address()
-    Mp_key = r + PK.root + to_bytes(idx_sig, n)
-    Mp = H_msg(Mp_key, M, n)
+    Mp_key = b"".join((parsed.r, PK.root, to_bytes(idx_sig, n)))
+    Mp = H_msg_stream(Mp_key, chunks, n, params.hash_mode)
 
-    node = xmss_root_from_sig(idx_sig, sig_ots, auth, Mp, PK.pub_seed, params, adrs)
+    node = xmss_root_from_sig(idx_sig, parsed.sig_ots, parsed.auth, Mp, PK.pub_seed, params, adrs)
     return node == PK.root
+
+class XMSSVerifier:
+    """
+    Verifier bound to one XMSSPublicKey.
+    The hash-tree masks (KEY, BM0, BM1) depend only on pub_seed and
+    (height, index): they are cached without limit for the top_levels highest
+    levels of the tree (at most 2^top_levels - 1 triples) and in an LRU of
+    cache_size entries below them. Results are identical to xmss_verify.
+    """
+
+    def __init__(self, PK: XMSSPublicKey, top_levels: int = 10, cache_size: int = 4096) -> None:
+        self.PK = PK
+        self.params = PK.params
+        self._min_top = max(0, PK.params.h - top_levels)
+        self._top: Dict[Tuple[int, int], Masks] = {}
+        self._lru: "OrderedDict[Tuple[int, int], Masks]" = OrderedDict()
+        self._cache_size = cache_size
+        self._adrs = Address()
+
+    def _compute(self, height: int, index: int) -> Masks:
+        adrs = self._adrs
+        adrs.set_type(2)
+        adrs.set_tree_height(height)
+        adrs.set_tree_index(index)
+        return rand_hash_masks(self.PK.pub_seed, adrs, self.params)
+
+    def masks(self, height: int, index: int) -> Masks:
+        """(KEY, BM0, BM1) for the hash-tree address (tree_height=height, tree_index=index)."""
+        key = (height, index)
+        if height >= self._min_top:
+            m = self._top.get(key)
+            if m is None:
+                m = self._top[key] = self._compute(height, index)
+            return m
+
+        m = self._lru.get(key)
+        if m is not None:
+            self._lru.move_to_end(key)
+            return m
+        m = self._compute(height, index)
+        if self._cache_size > 0:
+            self._lru[key] = m
+            if len(self._lru) > self._cache_size:
+                self._lru.popitem(last=False)
+        return m
+
+    def precompute(self) -> None:
+        """Fill the top-level table eagerly (e.g. before forking workers)."""
+        h = self.params.h
+        for height in range(self._min_top, h):
+            for index in range(1 << (h - 1 - height)):
+                self.masks(height, index)
+
+    @instrument.operation("verify")
+    def verify(self, sig: Union[Buffer, XMSSSignature], M: bytes) -> bool:
+        params = self.params
+        n = params.n
+        parsed = _as_signature(sig, params)
+        # Indice fuori dall'albero: firma non valida (niente nodi inesistenti in cache).
+        if parsed is None or parsed.idx >= params.max_signatures:
+            return False
+        idx_sig = parsed.idx
+
+        Mp_key = b"".join((parsed.r, self.PK.root, to_bytes(idx_sig, n)))
+        Mp = H_msg(Mp_key, M, n, params.hash_mode)
+        node = xmss_root_from_sig(idx_sig, parsed.sig_ots, parsed.auth, Mp, self.PK.pub_seed, params, Address(),
+                                  self.masks)
+        return node == self.PK.root
+
+def _verify_group(job: Tuple[XMSSPublicKey, List[Tuple[bytes, bytes]]]) -> List[bool]:
+    """Worker di xmss_verify_many: verifica un gruppo di firme della stessa PK."""
+    PK, items = job
+    verifier = XMSSVerifier(PK)
+    return [verifier.verify(sig, M) for sig, M in items]
+
+def xmss_verify_many(items: Iterable[Tuple[bytes, bytes, XMSSPublicKey]], workers: Optional[int] = 1,
+                     chunk_size: int = 64) -> List[bool]:
+    """
+    Verify many (sig, M, PK) tuples; returns one bool per item, in input order.
+    Items are grouped by public key and sent to the workers in chunks of up to
+    chunk_size signatures, so each PK is pickled once per chunk, not per item.
+    workers=None uses os.cpu_count(); workers=1 verifies in this process.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be >= 1")
+    items = list(items)
+    groups: Dict[Tuple[bytes, bytes, XMSSParams], Tuple[XMSSPublicKey, List[int]]] = {}
+    for pos, (_sig, _M, PK) in enumerate(items):
+        key = (PK.root, PK.pub_seed, PK.params)
+        if key not in groups:
+            groups[key] = (PK, [])
+        groups[key][1].append(pos)
+
+    jobs: List[Tuple[XMSSPublicKey, List[Tuple[bytes, bytes]]]] = []
+    positions: List[List[int]] = []
+    for PK, pos_list in groups.values():
+        for c in range(0, len(pos_list), chunk_size):
+            chunk = pos_list[c:c + chunk_size]
+            jobs.append((PK, [(items[p][0], items[p][1]) for p in chunk]))
+            positions.append(chunk)
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            outcomes = list(pool.map(_verify_group, jobs))
+    else:
+        outcomes = [_verify_group(job) for job in jobs]
+
+    results = [False] * len(items)
+    for chunk, oks in zip(positions, outcomes):
+        for p, ok in zip(chunk, oks):
+            results[p] = ok
+    return results
@@ -0,0 +1,206 @@
+# xmss_mt.py
+"""
+XMSS^MT (RFC 8391, Section 4.2) built on the single-tree code: every tree of
+the hypertree is an XMSSPrivateKey of height h/d, addressed through
+Address.set_layer / set_tree, with a BDS state for its auth paths.
+
+Keygen builds only the first tree of each layer. The private key keeps the
+current tree of every layer (and the signature of its root by the layer
+above); when idx crosses a tree boundary the next tree is built lazily.
+Keygen and signing therefore cost O(2^(h/d)) instead of O(2^h).
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field, replace
+from typing import List, Optional, Tuple
+import os
+
+from bds import bds_build, tree_address
+from hashfuncs import PRF, H_msg
+import instrument
+from params import XMSSMTParams
+from signature import Blocks
+from utils import to_bytes
+from xmss import XMSSPrivateKey, tree_sig, xmss_root_from_sig
+
+
+@dataclass
+class XMSSMTPublicKey:
+    root: bytes
+    pub_seed: bytes  # SEED (public)
+    params: XMSSMTParams
+
+
+@dataclass
+class MTTree:
+    """Current tree of one layer: its key (at the next leaf to use) and root."""
+    layer: int
+    tree: int
+    SK: XMSSPrivateKey
+    root: bytes
+    # Firma (sig_ots || auth) del root fatta dal layer superiore; b"" per il layer d-1.
+    root_sig: bytes = b""
+
+
+@dataclass
+class XMSSMTPrivateKey:
+    idx: int
+    sk_seed: bytes   # S (secret master seed)
+    sk_prf: bytes    # SK_PRF (secret)
+    root: bytes
+    pub_seed: bytes  # SEED (public)
+    params: XMSSMTParams
+    # Alberi correnti dei layer (cache ricostruibile): non viene serializzata.
+    layers: Optional[List[Optional[MTTree]]] = field(default=None, repr=False, compare=False)
+
+
+def _tree_seed(sk_seed: bytes, layer: int, tree: int, params: XMSSMTParams) -> bytes:
+    """Secret seed of tree (layer, tree): PRF(S, ADRS) with only layer and tree set."""
+    return PRF(sk_seed, tree_address(layer, tree).to_bytes(), params.n, params.hash_mode)
+
+
+def _build_tree(SK: XMSSMTPrivateKey, layer: int, tree: int, leaf: int) -> MTTree:
+    """Build tree (layer, tree) with one treehash pass; its key starts at leaf."""
+    p = SK.params
+    SK_tree = XMSSPrivateKey(
+        idx=leaf,
+        sk_seed=_tree_seed(SK.sk_seed, layer, tree, p),
+        sk_prf=SK.sk_prf,
+        root=b"",
+        pub_seed=SK.pub_seed,
+        params=p.tree_params,
+    )
+    root, state = bds_build(SK_tree, layer, tree)
+    return MTTree(layer=layer, tree=tree, SK=replace(SK_tree, root=root, bds=state), root=root)
+
+
+def _tree_sign(layers: List[Optional[MTTree]], layer: int, leaf: int, M: bytes) -> bytes:
+    """Sign the n-byte M with leaf `leaf` of the current tree of `layer`, then advance that tree."""
+    cur = layers[layer]
+    assert cur is not None
+    if cur.SK.idx != leaf:
+        raise RuntimeError("XMSS^MT: layer state out of sync with idx")
+
+    adrs = tree_address(layer, cur.tree)
+    sig_ots, auth = tree_sig(M, cur.SK, leaf, adrs)
+
+    bds_next = cur.SK.bds.next_state(cur.SK) if cur.SK.bds is not None else None
+    layers[layer] = replace(cur, SK=replace(cur.SK, idx=leaf + 1, bds=bds_next))
+    return b"".join(sig_ots + auth)
+
+
+def _enter_tree(SK: XMSSMTPrivateKey, layers: List[Optional[MTTree]], layer: int, tree: int, leaf: int) -> None:
+    """Make (layer, tree) the current tree of layer, with its root signed by the layer above."""
+    p = SK.params
+    hp = p.tree_height
+    layers[layer] = _build_tree(SK, layer, tree, leaf)
+    if layer == p.d - 1:
+        return
+
+    up_tree, up_leaf = tree >> hp, tree & ((1 << hp) - 1)
+    up = layers[layer + 1]
+    if up is None or up.tree != up_tree:
+        _enter_tree(SK, layers, layer + 1, up_tree, up_leaf)
+    cur = layers[layer]
+    assert cur is not None
+    layers[layer] = replace(cur, root_sig=_tree_sign(layers, layer + 1, up_leaf, cur.root))
+
+
+@instrument.operation("mt_keygen")
+def xmssmt_keygen(params: XMSSMTParams) -> Tuple[XMSSMTPrivateKey, XMSSMTPublicKey]:
+    """RFC 8391, Algorithm 15, building only tree 0 of every layer."""
+    n = params.n
+    SK = XMSSMTPrivateKey(
+        idx=0,
+        sk_seed=os.urandom(n),
+        sk_prf=os.urandom(n),
+        root=b"\x00" * n,
+        pub_seed=os.urandom(n),
+        params=params,
+    )
+    layers: List[Optional[MTTree]] = [None] * params.d
+    _enter_tree(SK, layers, 0, 0, 0)
+    top = layers[params.d - 1]
+    assert top is not None
+    SK = replace(SK, root=top.root, layers=layers)
+    PK = XMSSMTPublicKey(root=top.root, pub_seed=SK.pub_seed, params=params)
+    return SK, PK
+
+
+@instrument.operation("mt_sign")
+def xmssmt_sign(M: bytes, SK: XMSSMTPrivateKey) -> Tuple[XMSSMTPrivateKey, bytes]:
+    """
+    RFC 8391, Algorithm 16:
+      Sig = idx_sig(ceil(h/8)) || r || (sig_ots || auth) for layer 0 .. d-1
+    The layer-0 part signs M'; the other layers are the cached root signatures.
+    """
+    params = SK.params
+    if SK.idx >= params.max_signatures:
+        raise ValueError("XMSS^MT: no signatures left for this key (idx exhausted)")
+
+    idx_sig = SK.idx
+    hp = params.tree_height
+    idx_tree, idx_leaf = idx_sig >> hp, idx_sig & ((1 << hp) - 1)
+
+    # Copia della lista: SK resta invariata (come in xmss_sign).
+    layers: List[Optional[MTTree]] = list(SK.layers) if SK.layers is not None else [None] * params.d
+    cur = layers[0]
+    if cur is None or cur.tree != idx_tree or cur.SK.idx != idx_leaf:
+        # Passaggio al prossimo albero del layer 0: costruzione lazy. Se lo stato
+        # non è contiguo (chiave appena caricata, idx modificato) si ricostruisce tutto.
+        sequential = cur is not None and cur.tree + 1 == idx_tree and idx_leaf == 0
+        if not sequential:
+            layers = [None] * params.d
+        _enter_tree(SK, layers, 0, idx_tree, idx_leaf)
+
+    r = PRF(SK.sk_prf, to_bytes(idx_sig, 32), params.n, params.hash_mode)
+    Mp_key = r + SK.root + to_bytes(idx_sig, params.n)
+    Mp = H_msg(Mp_key, M, params.n, params.hash_mode)
+
+    parts = [to_bytes(idx_sig, params.idx_bytes), r, _tree_sign(layers, 0, idx_leaf, Mp)]
+    for layer in layers[:-1]:
+        assert layer is not None
+        parts.append(layer.root_sig)
+
+    SK2 = replace(SK, idx=idx_sig + 1, layers=layers)
+    return SK2, b"".join(parts)
+
+
+@instrument.operation("mt_verify")
+def xmssmt_verify(sig: bytes, M: bytes, PK: XMSSMTPublicKey) -> bool:
+    """
+    RFC 8391, Algorithm 17.
+    Parse signature:
+      idx(ceil(h/8)) || r(n) || d * (sig_ots(len*n) || auth(h/d*n))
+    """
+    params = PK.params
+    tp = params.tree_params
+    n = params.n
+    hp = params.tree_height
+    part_len = (tp.length + hp) * n
+
+    if len(sig) != params.idx_bytes + n + params.d * part_len:
+        return False
+
+    idx_sig = int.from_bytes(sig[:params.idx_bytes], "big")
+    if idx_sig >= params.max_signatures:
+        return False
+    buf = memoryview(sig)
+    off = params.idx_bytes
+    r = buf[off:off+n]
+    off += n
+
+    Mp_key = b"".join((r, PK.root, to_bytes(idx_sig, n)))
+    node = H_msg(Mp_key, M, n, params.hash_mode)
+
+    idx_tree = idx_sig
+    for layer in range(params.d):
+        idx_leaf = idx_tree & ((1 << hp) - 1)
+        idx_tree >>= hp
+        sig_ots = Blocks(buf, off, tp.length, n)
+        off += tp.length * n
+        auth = Blocks(buf, off, hp, n)
+        off += hp * n
+
+        adrs = tree_address(layer, idx_tree)
+        node = xmss_root_from_sig(idx_leaf, sig_ots, auth, node, PK.pub_seed, tp, adrs)
+    return node == PK.root